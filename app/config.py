@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # ディレクトリ設定
@@ -27,4 +28,61 @@ HIDDEN_GEM_KEYWORDS = {
     '空いている': 1,
     'のんびり': 1,
     '穴場スポット': 2,
-} 
\ No newline at end of file
+}
+
+# HTTPクライアント（共有セッション）の設定
+HTTP_POOL_LIMIT = 20  # 全体の同時接続数上限
+HTTP_LIMIT_PER_HOST = 4  # 1ホストあたりの同時接続数上限
+HTTP_DNS_CACHE_TTL = 300  # DNSキャッシュの保持秒数
+HTTP_KEEPALIVE_TIMEOUT = 30  # アイドル接続を保持する秒数
+HTTP_REQUEST_TIMEOUT = 30  # 1リクエストのタイムアウト秒数
+
+# ページ取得の並行数とリクエスト間隔（トークンバケット）の設定
+SCRAPING_CONCURRENCY = 3  # 同時に取得するページ数の上限
+SCRAPING_RATE_PER_SEC = 1.0  # 1秒あたりのリクエスト数
+SCRAPING_BURST = 2  # 連続して送信できるリクエスト数
+
+# HTML解析・スコア計算を実行するエグゼキューターの設定
+EXECUTOR_KIND = os.environ.get('EXECUTOR_KIND', 'thread')  # "thread" または "process"（uvicornのワーカーごとにプールが作られる）
+EXECUTOR_MAX_WORKERS = int(os.environ.get('EXECUTOR_MAX_WORKERS', 0)) or min(4, os.cpu_count() or 1)
+
+# レビューの保存先（"database": SQLiteの全文検索を使用、"json": JSONファイルのみでbigram転置索引を使用）
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'database')
+
+# レスポンスキャッシュの設定
+RESPONSE_CACHE_TTL = 900  # ランキングなどの計算結果を保持する秒数（スクレイピング間隔に合わせる）
+RESPONSE_CACHE_MAXSIZE = 64  # 保持するキーの最大数（データの版ごとにキーが変わるため古い版から削除）
+
+# スクレイパーのページキャッシュの設定
+PAGE_CACHE_MAX_BYTES = 50 * 1024 * 1024  # 圧縮後の本文の合計サイズの上限
+ANALYZE_FRESHNESS_SECONDS = 300  # 施設ページの分析で、この秒数以内に取得したページは再取得しない
+
+# 施設ページの分析結果のキャッシュ設定（同じURLへの同時リクエストは1回の分析にまとめる）
+ANALYZE_CACHE_TTL = 300  # 分析結果を保持する秒数
+ANALYZE_CACHE_MAXSIZE = 256  # 保持するURLの最大数
+
+# 増分クロールの設定
+SITE_URL = 'https://sauna-ikitai.com'
+POSTS_SEARCH_URL = 'https://sauna-ikitai.com/posts?prefecture%5B%5D=tokyo&keyword=%E7%A9%B4%E5%A0%B4'  # 穴場を含む東京都の投稿（新しい順）
+INCREMENTAL_MAX_PAGES = 10  # 既読のレビューに到達しない場合に1回で取得する最大ページ数
+HIGH_WATER_MARK_SIZE = 20  # 既読判定に使う最新レビューのキーの数
+BACKFILL_PAGES_PER_RUN = 2  # 1回の実行でさかのぼる過去ページ数
+BACKFILL_MAX_PAGE = 200  # バックフィルでさかのぼる最大ページ
+
+# 保存前の重複判定フィルタ（ブルームフィルタ）の設定
+DEDUP_FILTER_CAPACITY = 100000  # 1つのフィルタに登録できるキー数（超えると容量を倍にしたフィルタを追加）
+DEDUP_FILTER_ERROR_RATE = 0.0001  # 未登録のキーを登録済みと誤判定する確率の上限
+
+# スクレイピングのパイプライン（取得→解析→採点→重複除去→保存）の設定
+PIPELINE_QUEUE_SIZE = 2  # 各段の間のキューに保持するページ数（超えると前段が待機する）
+
+# アプリ内の定期スクレイピングのスケジューラーとバックグラウンドジョブの設定
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'True') == 'True'  # 起動時にスケジューラーを開始するかどうか
+SCHEDULER_POLL_SECONDS = 60  # 予定時刻や有効/無効の変更を確認する間隔（秒）
+SCHEDULER_JITTER_SECONDS = 60  # 予定時刻からずらす最大秒数（複数インスタンスの実行時刻を分散）
+SCHEDULER_RETRY_SECONDS = 300  # スクレイピングが失敗した場合に再試行するまでの秒数
+JOB_HISTORY_SIZE = 50  # 保持する実行済みジョブの数
+
+# スクレイピングの実行権（リース）の設定
+SCRAPING_LEASE_NAME = 'scraping'  # リースのジョブ名
+SCRAPING_LEASE_TTL = 300  # リースの有効期間（秒、保持中は1/3ごとに延長し、異常終了時はこの時間で回収される）
@@ -1,10 +1,13 @@
+import asyncio
 import os
 import sqlite3
 import json
 from pathlib import Path
 import traceback
 from datetime import datetime
-from app.models.database import get_db, save_review, init_db
+from app.models.database import async_db_connection, async_read_connection, init_db, index_reviews_fts
+from app.services.dedup import db_review_filter
+from app.services.github_storage import seed_json_review_filter
 
 # 環境変数
 IS_RENDER = os.environ.get('RENDER', 'False') == 'True'
@@ -21,6 +24,136 @@ DB_PATH = DATA_DIR / 'sauna_app.db'
 # 初期化フラグ
 SAVE_INFO_SHOWN = False
 
+# 一括保存時に1回のSELECTで照会するレビューIDの数
+BULK_LOOKUP_CHUNK_SIZE = 500
+
+async def save_reviews_bulk(reviews, conn=None) -> dict:
+    """
+    複数のレビューを1トランザクションでまとめて保存する
+    
+    重複判定フィルタで確実に未保存のレビューは照会を省き、保存済みの可能性があるものだけをSELECTで確認します。
+    レビューは INSERT OR IGNORE で一括挿入し、追加したレビューを全文検索の索引に登録します。
+    sauna_stats は実際に追加したレビューをサウナごとに集計した件数と穴場スコアの合計で一括アップサートします。
+    
+    Args:
+        reviews: 保存するレビューのリスト（review_id, sauna_name, review_text を含む辞書、
+                 パイプラインの採点段で付けた hidden_gem_score があれば保存）
+        conn: 使用する非同期データベース接続（省略時は共有の非同期接続）
+    
+    Returns:
+        バッチ単位の件数（受信数・有効数・保存数・重複数・更新したサウナ数・照会を省いた数）
+    """
+    counts = {
+        "received": len(reviews),
+        "valid": 0,
+        "inserted": 0,
+        "duplicates": 0,
+        "saunas_updated": 0,
+        "lookups_skipped": 0
+    }
+    
+    # 必須項目のそろったレビューだけを対象にし、バッチ内の重複を除く
+    rows = {}
+    for review in reviews:
+        review_id = review.get('review_id')
+        sauna_name = review.get('sauna_name')
+        review_text = review.get('review_text')
+        
+        if not (review_id and sauna_name and review_text):
+            continue
+        
+        counts["valid"] += 1
+        if review_id not in rows:
+            sauna_id = sauna_name.replace(" ", "_").lower()
+            rows[review_id] = (review_id, sauna_name, review_text, review.get('sauna_url') or None, sauna_id,
+                               int(review.get('hidden_gem_score') or 0))
+    
+    if not rows:
+        return counts
+    
+    async with async_db_connection(conn) as conn:
+        if not db_review_filter.seeded:
+            await seed_review_filter(conn)
+        
+        # 保存済みの可能性があるレビューIDだけをまとめて照会
+        review_ids = [review_id for review_id in rows if db_review_filter.might_contain(review_id)]
+        counts["lookups_skipped"] = len(rows) - len(review_ids)
+        existing_ids = set()
+        for start in range(0, len(review_ids), BULK_LOOKUP_CHUNK_SIZE):
+            chunk = review_ids[start:start + BULK_LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            found = await conn.execute_fetchall(f"SELECT review_id FROM reviews WHERE review_id IN ({placeholders})", chunk)
+            existing_ids.update(row[0] for row in found)
+        
+        new_rows = [row for review_id, row in rows.items() if review_id not in existing_ids]
+        counts["duplicates"] = counts["valid"] - len(new_rows)
+        if not new_rows:
+            return counts
+        
+        # レビューとサウナ統計を1トランザクションで書き込む
+        # （最大rowidを読む前に書き込みロックを取得し、他の書き込みの行を集計や索引に含めない）
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            max_rowid = await conn.execute_fetchall("SELECT COALESCE(MAX(rowid), 0) FROM reviews")
+            last_rowid = max_rowid[0][0]
+            
+            before = conn.total_changes
+            await conn.executemany(
+                "INSERT OR IGNORE INTO reviews (review_id, sauna_name, review_text, sauna_url, sauna_id, hidden_gem_score) VALUES (?, ?, ?, ?, ?, ?)",
+                new_rows
+            )
+            inserted = conn.total_changes - before
+            
+            # 追加したレビュー（rowidが既存の最大値より後のもの）を全文検索の索引に登録
+            await index_reviews_fts(conn, last_rowid)
+            
+            # 実際に追加したレビューだけをサウナごとに集計（別プロセスが先に保存したIDは数えない）
+            stats = await conn.execute_fetchall(
+                "SELECT sauna_id, MAX(sauna_name), COUNT(*), SUM(hidden_gem_score) FROM reviews WHERE rowid > ? GROUP BY sauna_id",
+                (last_rowid,)
+            )
+            
+            await conn.executemany(
+                """
+                INSERT INTO sauna_stats (sauna_id, sauna_name, review_count, score) VALUES (?, ?, ?, ?)
+                ON CONFLICT(sauna_id) DO UPDATE SET
+                    review_count = review_count + excluded.review_count,
+                    score = score + excluded.score,
+                    last_updated = CURRENT_TIMESTAMP
+                """,
+                [tuple(stat) for stat in stats]
+            )
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+        
+        db_review_filter.add_many(row[0] for row in new_rows)
+        
+        counts["inserted"] = inserted
+        counts["duplicates"] = counts["valid"] - inserted
+        counts["saunas_updated"] = len(stats)
+        return counts
+
+async def seed_review_filter(conn=None):
+    """保存済みのレビューIDで重複判定フィルタを初期化する"""
+    try:
+        async with async_read_connection(conn) as conn:
+            async with conn.execute("SELECT review_id FROM reviews") as cursor:
+                review_ids = [row[0] async for row in cursor]
+        return db_review_filter.seed(review_ids)
+    except Exception as e:
+        print(f"重複判定フィルタの初期化エラー (database): {str(e)}")
+        print(traceback.format_exc())
+        return 0
+
+async def seed_review_filters():
+    """データベースとJSONファイルの重複判定フィルタを初期化する（起動時に実行）"""
+    await init_db()
+    db_count = await seed_review_filter()
+    json_count = await asyncio.to_thread(seed_json_review_filter)
+    return {"database": db_count, "json": json_count}
+
 async def save_reviews(reviews):
     """複数のレビューをデータベースに保存する"""
     global SAVE_INFO_SHOWN
@@ -28,51 +161,28 @@ async def save_reviews(reviews):
     if not reviews:
         return 0
         
-    saved_count = 0
-    
-    # データベース接続を取得
-    db = get_db()
-    
     try:
         # 一度だけ情報を表示
         if not SAVE_INFO_SHOWN:
             print(f"レビュー保存処理開始: {len(reviews)}件")
             SAVE_INFO_SHOWN = True
-            
-        # 各レビューを保存
-        for review in reviews:
-            try:
-                # レビューがあるかチェック
-                review_id = review.get('review_id')
-                sauna_name = review.get('sauna_name')
-                review_text = review.get('review_text')
-                
-                if not (review_id and sauna_name and review_text):
-                    continue
-                    
-                # レビューを保存
-                success = save_review(
-                    db, 
-                    review_id, 
-                    sauna_name, 
-                    review_text
-                )
-                
-                if success:
-                    saved_count += 1
-                    
-            except Exception as e:
-                print(f"レビュー個別保存エラー: {str(e)}")
         
-        return saved_count
+        # データベーステーブルを初期化
+        await init_db()
+        
+        # 1トランザクションで一括保存
+        counts = await save_reviews_bulk(reviews)
+        
+        if counts["inserted"] > 0:
+            print(f"レビュー保存完了: {counts['inserted']}/{len(reviews)}件 (重複 {counts['duplicates']}件)")
+        
+        return counts["inserted"]
         
     except Exception as e:
         print(f"レビュー一括保存エラー: {str(e)}")
-        return saved_count
-        
-    finally:
-        if saved_count > 0:
-            print(f"レビュー保存完了: {saved_count}/{len(reviews)}件")
+        print(traceback.format_exc())
+        return 0
+
 
 async def update_ratings(url, rating_data=None):
     """サウナ施設の評価データを更新する"""
@@ -84,9 +194,6 @@ async def update_ratings(url, rating_data=None):
             if not sauna_id.isdigit():
                 return {"success": False, "message": "無効なURL形式です"}
                 
-            # データベース接続
-            db = get_db()
-            
             # 現在の日時
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
@@ -94,14 +201,12 @@ async def update_ratings(url, rating_data=None):
             rating_json = json.dumps(rating_data, ensure_ascii=False)
             
             # データを挿入または更新
-            cursor = db.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO sauna_stats 
-                (sauna_id, rating_data, updated_at) 
-                VALUES (?, ?, ?)
-            ''', (sauna_id, rating_json, now))
-            
-            db.commit()
+            async with async_db_connection() as db:
+                await db.execute('''
+                    INSERT OR REPLACE INTO sauna_stats 
+                    (sauna_id, rating_data, updated_at) 
+                    VALUES (?, ?, ?)
+                ''', (sauna_id, rating_json, now))
             
             return {
                 "success": True, 
@@ -115,28 +220,23 @@ async def update_ratings(url, rating_data=None):
             if not ratings_data:
                 return {"success": False, "message": "評価データがありません"}
                 
-            # データベース接続
-            db = get_db()
-            
             # 現在の日時
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-            for sauna_id, rating in ratings_data.items():
-                try:
-                    # JSON形式に変換
-                    rating_json = json.dumps(rating, ensure_ascii=False)
+            async with async_db_connection() as db:
+                for sauna_id, rating in ratings_data.items():
+                    try:
+                        # JSON形式に変換
+                        rating_json = json.dumps(rating, ensure_ascii=False)
                     
-                    # データを挿入または更新
-                    cursor = db.cursor()
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO sauna_stats 
-                        (sauna_id, rating_data, updated_at) 
-                        VALUES (?, ?, ?)
-                    ''', (sauna_id, rating_json, now))
-                except Exception as e:
-                    print(f"サウナID {sauna_id} の評価更新エラー: {str(e)}")
-            
-            db.commit()
+                        # データを挿入または更新
+                        await db.execute('''
+                            INSERT OR REPLACE INTO sauna_stats 
+                            (sauna_id, rating_data, updated_at) 
+                            VALUES (?, ?, ?)
+                        ''', (sauna_id, rating_json, now))
+                    except Exception as e:
+                        print(f"サウナID {sauna_id} の評価更新エラー: {str(e)}")
             
             return {
                 "success": True, 
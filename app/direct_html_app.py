@@ -1,5 +1,5 @@
-from fastapi import FastAPI, Request, Form, BackgroundTasks
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, Request, Form
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import sqlite3
@@ -8,15 +8,26 @@ import traceback
 from datetime import datetime
 from pathlib import Path
 import uvicorn
-import asyncio
 import json
 
-from app.models.database import get_db, init_db, reset_database, count_reviews, save_review
-from app.database import save_reviews, update_ratings
+from app.models.database import async_db_connection, close_thread_db, close_async_db, init_db, reset_database, count_reviews, save_review, get_lease
+from app.database import save_reviews, update_ratings, seed_review_filters
 from app.services.ranking import generate_sauna_ranking as generate_json_ranking
 from app.services.ranking import get_review_count as get_json_review_count
-from app.services.scraper import SaunaScraper
-from app.tasks import scraping_state, load_scraping_state, save_scraping_state, reset_scraping_state, periodic_scraping, toggle_auto_scraping, ensure_data_dir
+from app.services.ranking import verify_sauna_ranking, search_reviews_page, find_hidden_gem_reviews, verify_search_index
+from app.services.scraper import SaunaScraper, create_http_session, close_http_session
+from app.services.executor import shutdown_executor
+from app.services.cache import response_cache, analysis_cache, make_etag, validator_headers, is_not_modified
+from app.services.github_storage import get_storage_version
+from app.services.github_storage import close_segment_writer
+from app.services.inverted_index import close_bigram_index
+from app.services.page_cache import close_page_cache
+from app.services.dedup import db_review_filter, json_review_filter
+from app.tasks import scraping_state, load_scraping_state, save_scraping_state, reset_scraping_state, toggle_auto_scraping, ensure_data_dir, run_storage_compaction
+from app.tasks import submit_scraping_job, check_scraping_due, start_scheduler, stop_scheduler, scraping_state_store
+from app.services.jobs import job_registry
+from app.routers import ranking as ranking_router
+from app.config import SCHEDULER_ENABLED, SCRAPING_LEASE_NAME
 
 # 環境変数
 IS_PRODUCTION = os.getenv("ENVIRONMENT", "development") == "production"
@@ -35,6 +46,9 @@ if IS_RENDER:
 else:
     BASE_DIR = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# データベースのランキングAPI（/api/ranking など）
+app.include_router(ranking_router.router)
+
 # 静的ファイルの設定
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 
@@ -44,16 +58,53 @@ templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 # スクレイパーのインスタンスを作成
 scraper = SaunaScraper()
 
+async def get_cached_ranking(route, limit, version):
+    """
+    ランキングとレビュー数を取得する（データの版が変わるまで、または一定時間キャッシュを再利用）
+    
+    キャッシュキーにデータの版を含めるため、返す本文は ETag を算出した版以降のデータから作られたものになります。
+    """
+    async def compute():
+        ranking_data = await generate_json_ranking(limit=limit)
+        review_count = await get_json_review_count()
+        return ranking_data, review_count
+    
+    # 取得に失敗した場合も空のランキングが返るため、空の結果はキャッシュしない
+    return await response_cache.get_or_compute(
+        response_cache.make_key(route, {"limit": limit, "version": version}),
+        compute,
+        should_cache=lambda result: bool(result[0])
+    )
+
+def ranking_validators(template_name):
+    """
+    ランキングページのETagと最終更新時刻を、保存済みデータの版とテンプレートから算出する
+    
+    Returns:
+        (ETag, 最終更新時刻, データの版（キャッシュキーに使用）)
+    """
+    version = get_storage_version()
+    count, last_modified = version
+    
+    # デプロイでテンプレートが変わった場合もETagを変える
+    template_mtime = (BASE_DIR / "templates" / template_name).stat().st_mtime_ns
+    return make_etag(template_name, count, last_modified, template_mtime), last_modified, version
+
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """ホームページを表示"""
     try:
-        # データベースからランキング情報を取得
-        ranking_data = await generate_json_ranking(limit=40)
-        review_count = await get_json_review_count()
+        # データが変わっていなければテンプレートを描画せずに304を返す
+        etag, last_modified, version = ranking_validators("index.html")
+        headers = validator_headers(etag, last_modified)
+        if is_not_modified(request.headers, etag, last_modified):
+            return Response(status_code=304, headers=headers)
         
-        # スクレイピング状態を取得
-        scraping_state_data = scraping_state
+        # データベースからランキング情報を取得（キャッシュがあれば再利用）
+        ranking_data, review_count = await get_cached_ranking("/", limit=40, version=version)
+        
+        # スクレイピング状態を取得（他のワーカーが更新していれば読み込み直す）
+        scraping_state_data = await load_scraping_state()
         
         return templates.TemplateResponse(
             "index.html", 
@@ -62,7 +113,8 @@ async def root(request: Request):
                 "ranking_data": ranking_data, 
                 "review_count": review_count,
                 "scraping_state": scraping_state_data
-            }
+            },
+            headers=headers
         )
     except Exception as e:
         print(f"ランキングデータ生成中にエラー発生: {str(e)}")
@@ -85,15 +137,43 @@ async def analyze(url: str = Form(...)):
     except Exception as e:
         return {"error": f"エラーが発生しました: {str(e)}"}
 
+def accepted_job_response(job, created):
+    """ジョブを受け付けたことを示す202レスポンス（進捗は /api/jobs/{job_id} で確認）"""
+    message = "スクレイピングを開始しました" if created else "スクレイピングは既に実行中です"
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "accepted",
+            "message": message,
+            "job_id": job["job_id"],
+            "job_status": job["status"],
+            "poll_url": f"/api/jobs/{job['job_id']}"
+        }
+    )
+
 @app.post("/start_scraping")
-async def start_scraping(background_tasks: BackgroundTasks):
+async def start_scraping():
     """スクレイピングを開始するエンドポイント"""
     try:
-        # バックグラウンドタスクとしてスクレイピングを開始
-        return await periodic_scraping(background_tasks)
+        # ジョブとしてバックグラウンドで実行し、完了を待たずに応答する
+        job, created = await submit_scraping_job()
+        return accepted_job_response(job, created)
     except Exception as e:
         return {"status": "error", "message": f"エラーが発生しました: {str(e)}"}
 
+@app.get("/api/jobs")
+async def list_jobs():
+    """バックグラウンドジョブの一覧を取得するエンドポイント"""
+    return {"jobs": await job_registry.list()}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """バックグラウンドジョブの状態と結果を取得するエンドポイント"""
+    job = await job_registry.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "ジョブが見つかりません"})
+    return job
+
 @app.post("/toggle_auto_scraping")
 async def toggle_auto_scrape(enable: bool = None):
     """自動スクレイピングの有効/無効を切り替えるエンドポイント"""
@@ -111,17 +191,39 @@ async def reset_scraping():
     except Exception as e:
         return {"status": "error", "message": f"スクレイピング状態リセットエラー: {str(e)}"}
 
+@app.post("/api/compact_storage")
+async def compact_storage_endpoint(include_today: bool = False):
+    """保存済みのレビューファイルを日ごとに圧縮するエンドポイント"""
+    try:
+        return await run_storage_compaction(include_today)
+    except Exception as e:
+        return {"status": "error", "message": f"レビューファイルの圧縮中にエラーが発生しました: {str(e)}"}
+
+@app.get("/api/cache_stats")
+async def get_cache_stats():
+    """レスポンスキャッシュのヒット率を取得するエンドポイント"""
+    stats = response_cache.stats()
+    stats["analysis"] = analysis_cache.stats()
+    stats["dedup"] = {"database": db_review_filter.stats(), "json": json_review_filter.stats()}
+    stats["shared_state"] = {"scraping_state": scraping_state_store.stats()}
+    return stats
+
 @app.get("/api/scraping_status")
 async def get_scraping_status():
     """スクレイピングの状態を取得するエンドポイント"""
     try:
-        # 最新の状態を読み込む
-        load_scraping_state()
+        # 最新の状態を読み込む（他のワーカーが更新していなければバージョンの確認のみ）
+        await load_scraping_state()
         
         # 現在時刻を追加
         result = scraping_state.copy()
         result["current_time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
+        # 実行中かどうかはリースの有無で判定（異常終了したプロセスのリースは期限切れで無効になる）
+        lease = await get_lease(SCRAPING_LEASE_NAME)
+        result["is_running"] = lease is not None
+        result["lease"] = lease
+        
         return result
     except Exception as e:
         return {"status": "error", "message": f"スクレイピング状態の取得に失敗しました: {str(e)}"}
@@ -194,12 +296,30 @@ async def home():
     """
 
 @app.get("/api/github-action-scraping")
-async def github_action_scraping():
-    """GitHub Actions からの定期スクレイピング用エンドポイント"""
+async def github_action_scraping(force: bool = False):
+    """
+    GitHub Actions からの定期スクレイピング用エンドポイント
+    
+    アプリ内のスケジューラーと同じく、自動スクレイピングが無効な場合や予定時刻前の場合は実行しません
+    （スリープしていたアプリを起こすための呼び出しでも二重に実行しない）。force=true の場合は常に実行します。
+    """
     try:
         print("GitHub Actionsからのスクレイピング要求を受信しました")
-        result = await periodic_scraping()
-        return {"status": "success", "message": "スクレイピングが完了しました", "details": result}
+        
+        if not force:
+            due, reason = await check_scraping_due()
+            if not due:
+                print(f"スクレイピングを見送りました: {reason}")
+                return {
+                    "status": "skipped",
+                    "message": reason,
+                    "auto_scraping_enabled": scraping_state.get("auto_scraping_enabled", True),
+                    "next_scraping": scraping_state.get("next_scraping")
+                }
+        
+        # リクエストのタイムアウトに左右されないよう、ジョブとして実行して即座に応答する
+        job, created = await submit_scraping_job()
+        return accepted_job_response(job, created)
     except Exception as e:
         print(f"GitHub Actionsスクレイピングエラー: {str(e)}")
         print(traceback.format_exc())
@@ -210,17 +330,85 @@ async def reset_db():
     """データベースをリセットする（開発用）"""
     try:
         await reset_database()
+        response_cache.invalidate()
         return {"status": "success", "message": "データベースをリセットしました"}
     except Exception as e:
         return {"status": "error", "message": f"データベースリセットエラー: {str(e)}"}
 
+@app.get("/api/search")
+async def search(q: str = "", page: int = 1, per_page: int = 20):
+    """
+    レビューを全文検索するエンドポイント（関連度順、ページ分割）
+    
+    JSONファイルのみで運用している場合はbigram転置索引で新しい順に検索します。
+    """
+    try:
+        page = max(page, 1)
+        per_page = min(max(per_page, 1), 100)
+        
+        found = await search_reviews_page(q, limit=per_page, offset=(page - 1) * per_page)
+        return {
+            "status": "success",
+            "query": q,
+            "page": page,
+            "per_page": per_page,
+            "total": found["total"],
+            "total_exact": found["total_exact"],
+            "order": found["order"],
+            "results": found["results"]
+        }
+    except Exception as e:
+        print(f"レビュー検索エラー: {str(e)}")
+        print(traceback.format_exc())
+        return {"status": "error", "message": f"レビュー検索中にエラーが発生しました: {str(e)}"}
+
+@app.get("/api/search/verify")
+async def verify_search(q: str = ""):
+    """転置索引による検索結果が全件の走査と一致するか確認するエンドポイント（q は空白区切りの検索語、省略時は穴場キーワード）"""
+    try:
+        return await verify_search_index(q.split() or None)
+    except Exception as e:
+        return {"status": "error", "message": f"転置索引の整合性確認エラー: {str(e)}"}
+
+@app.get("/api/hidden_gem_reviews")
+async def hidden_gem_reviews(page: int = 1, per_page: int = 20):
+    """穴場キーワードを含む保存済みのレビューを新しい順に取得するエンドポイント"""
+    try:
+        page = max(page, 1)
+        per_page = min(max(per_page, 1), 100)
+        
+        reviews = await find_hidden_gem_reviews(limit=per_page, offset=(page - 1) * per_page)
+        return {
+            "status": "success",
+            "page": page,
+            "per_page": per_page,
+            "results": reviews
+        }
+    except Exception as e:
+        print(f"穴場レビューの取得エラー: {str(e)}")
+        print(traceback.format_exc())
+        return {"status": "error", "message": f"穴場レビューの取得中にエラーが発生しました: {str(e)}"}
+
+@app.get("/api/ranking/verify")
+async def verify_ranking():
+    """集計済みランキングと全件からの再集計が一致するか確認するエンドポイント"""
+    try:
+        return await verify_sauna_ranking()
+    except Exception as e:
+        return {"status": "error", "message": f"ランキングの整合性確認エラー: {str(e)}"}
+
 @app.get("/json_ranking", response_class=HTMLResponse)
 async def json_ranking(request: Request):
     """サウナランキングを表示"""
     try:
-        # JSONランキングを生成
-        ranking_data = await generate_json_ranking(limit=40)
-        review_count = await get_json_review_count()
+        # データが変わっていなければテンプレートを描画せずに304を返す
+        etag, last_modified, version = ranking_validators("ranking.html")
+        headers = validator_headers(etag, last_modified)
+        if is_not_modified(request.headers, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        
+        # JSONランキングを生成（キャッシュがあれば再利用）
+        ranking_data, review_count = await get_cached_ranking("/json_ranking", limit=40, version=version)
         
         return templates.TemplateResponse(
             "ranking.html",
@@ -228,7 +416,8 @@ async def json_ranking(request: Request):
                 "request": request,
                 "ranking_data": ranking_data,
                 "review_count": review_count
-            }
+            },
+            headers=headers
         )
     except Exception as e:
         print(f"ランキング生成中にエラー発生: {str(e)}")
@@ -300,14 +489,18 @@ async def startup_event():
         await init_db()
         
         # 初期化ステータスを表示
-        db = get_db()
-        result = db.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
-        table_count = result[0]
+        async with async_db_connection() as db:
+            result = await db.execute_fetchall("SELECT COUNT(*) FROM sqlite_master")
+        table_count = result[0][0]
         print(f"Database initialized with {table_count} tables")
         
+        # 保存済みのレビューで重複判定フィルタを初期化（以降の保存前に既知のレビューを除く）
+        await seed_review_filters()
+        
         # レビュー数を確認
         try:
-            count = db.execute("SELECT COUNT(*) FROM reviews").fetchone()
+            async with async_db_connection() as db:
+                count = (await db.execute_fetchall("SELECT COUNT(*) FROM reviews"))[0]
             print(f"Found {count[0]} reviews in database")
             
             # レビューが少ない場合、初期スクレイピングを実行
@@ -315,7 +508,7 @@ async def startup_event():
                 print("レビュー数が少ないため、初期スクレイピングを実行します...")
                 try:
                     # バックグラウンドで非同期実行
-                    asyncio.create_task(periodic_scraping())
+                    await submit_scraping_job()
                     print("初期スクレイピングタスクが開始されました")
                 except Exception as e:
                     print(f"初期スクレイピングの開始中にエラー: {str(e)}")
@@ -326,16 +519,23 @@ async def startup_event():
             # テーブルがまだない場合も初期スクレイピングを実行
             try:
                 print("テーブルがまだないため、初期スクレイピングを実行します...")
-                asyncio.create_task(periodic_scraping())
+                await submit_scraping_job()
                 print("初期スクレイピングタスクが開始されました")
             except Exception as e:
                 print(f"初期スクレイピングの開始中にエラー: {str(e)}")
                 print(traceback.format_exc())
         
         # スクレイピング状態を読み込む
-        load_scraping_state()
+        await load_scraping_state()
         print("Scraping state loaded successfully")
         
+        # スクレイパー共有のHTTPセッションを生成
+        create_http_session()
+        
+        # 予定時刻ごとにスクレイピングを実行するスケジューラーを開始
+        if SCHEDULER_ENABLED:
+            start_scheduler()
+        
         APP_INITIALIZED = True
         print("Application startup completed")
         
@@ -343,5 +543,29 @@ async def startup_event():
         print(f"起動処理エラー: {str(e)}")
         print(traceback.format_exc())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """アプリケーション終了時の後処理イベント"""
+    try:
+        # スケジューラーと実行中のジョブを停止（HTTPセッションやデータベースを閉じる前に行う）
+        await stop_scheduler()
+        
+        # 共有HTTPセッションを閉じる
+        await close_http_session()
+        
+        # 解析用のエグゼキューターを終了
+        shutdown_executor()
+        
+        # レビューのセグメントファイルを同期して閉じる
+        close_segment_writer()
+        close_bigram_index()
+        close_page_cache()
+        
+        # データベース接続を閉じる
+        close_thread_db()
+        await close_async_db()
+    except Exception as e:
+        print(f"終了処理エラー: {str(e)}")
+
 if __name__ == "__main__":
     uvicorn.run("app.direct_html_app:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
@@ -8,8 +8,14 @@ import traceback
 from pathlib import Path
 
 # サウナスクレイパーと関連モジュールをインポート
-from app.services.scraper import SaunaScraper
-from app.database import save_reviews
+from app.services.scraper import SaunaScraper, close_http_session
+from app.services.pipeline import run_incremental, run_backfill, run_gap_fill, next_high_water_mark
+from app.services.github_storage import write_json_atomic
+from app.models.database import close_async_db
+from app.config import POSTS_SEARCH_URL
+
+# 1回の実行でさかのぼる過去ページ数（GitHub Actionsではより多めに処理）
+BACKFILL_PAGES_PER_RUN = 6
 
 # データディレクトリの設定
 IS_RENDER = os.environ.get('RENDER', 'False') == 'True'
@@ -21,76 +27,121 @@ else:
     DATA_DIR = Path('data')
     DATA_DIR.mkdir(exist_ok=True)
 
+# このスクリプト専用の状態ファイル
+# アプリの scraping_state.json はワーカー間で共有する状態の書き出し先のため、別のファイルに保存する
+STATE_FILE = DATA_DIR / "github_action_state.json"
+
+def default_state():
+    """スクレイピング状態の初期値（キー名はアプリの scraping_state と同じ）"""
+    return {
+        "last_page": 0,
+        "total_pages_scraped": 0,
+        "auto_scraping_enabled": True,
+        "last_run": "",
+        "next_scraping": (datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')
+    }
+
 async def main_async():
-    """非同期メイン関数"""
+    """
+    非同期メイン関数
+
+    ランナーのデータベースはランナーごとに作られるため、アプリ側とのリースによる排他は行いません。
+    """
+    try:
+        await run_scraper()
+    finally:
+        # データベース接続を閉じる
+        await close_async_db()
+
+async def run_scraper():
+    """スクレイピングを実行する"""
     
     print(f"GitHub Actions scraper starting at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     try:
         # スクレイピング状態を読み込む
         try:
-            state_file_path = DATA_DIR / "scraping_state.json"
+            state_file_path = STATE_FILE
+            scraping_state = default_state()
             if os.path.exists(state_file_path):
                 with open(state_file_path, 'r', encoding='utf-8') as f:
-                    scraping_state = json.load(f)
+                    scraping_state.update(json.load(f))
                 
-                # 古いキー名を新しいキー名に変換（互換性のため）
-                if "last_page" in scraping_state and "last_scraped_page" not in scraping_state:
-                    scraping_state["last_scraped_page"] = scraping_state.pop("last_page")
+                # 古いキー名をアプリと同じキー名に変換（互換性のため）
+                if "last_scraped_page" in scraping_state:
+                    scraping_state["last_page"] = scraping_state.pop("last_scraped_page")
                     
-                if "total_pages_scraped" in scraping_state and "total_scraped_pages" not in scraping_state:
-                    scraping_state["total_scraped_pages"] = scraping_state.pop("total_pages_scraped")
+                if "total_scraped_pages" in scraping_state:
+                    scraping_state["total_pages_scraped"] = scraping_state.pop("total_scraped_pages")
                 
-                print(f"Loaded scraping state: last page = {scraping_state.get('last_scraped_page', 0)}")
+                print(f"Loaded scraping state: last page = {scraping_state.get('last_page', 0)}")
             else:
-                # 状態ファイルがない場合は初期状態を設定
-                scraping_state = {
-                    "last_scraped_page": 0,
-                    "total_scraped_pages": 0,
-                    "is_running": False,
-                    "auto_scraping_enabled": True,
-                    "last_run": "",
-                    "next_scraping": (datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')
-                }
+                # 状態ファイルがない場合は初期状態のまま
                 print("No state file found, starting with initial state")
         except Exception as e:
             print(f"Error loading scraping state: {str(e)}")
             print(traceback.format_exc())
             # エラー時はデフォルト状態を設定
-            scraping_state = {
-                "last_scraped_page": 0,
-                "total_scraped_pages": 0,
-                "is_running": False,
-                "auto_scraping_enabled": True,
-                "last_run": "",
-                "next_scraping": (datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')
-            }
-        
-        # 実行中フラグを設定
-        scraping_state["is_running"] = True
-        save_state(scraping_state, state_file_path)
+            state_file_path = STATE_FILE
+            scraping_state = default_state()
         
         # スクレイパーを初期化
         scraper = SaunaScraper()
         
-        # スクレイピングするページ範囲を決定
-        start_page = int(scraping_state.get("last_scraped_page", 0)) + 1
-        end_page = start_page + 5  # 1回の実行で5ページをスクレイピング（GitHub Actionsではより多めに処理）
+        # 1ページ目から前回取得済みのレビューまでを取得し、ページごとに保存（新着分）
+        incremental = await run_incremental(scraper, POSTS_SEARCH_URL, scraping_state.get("high_water_mark") or [])
+        pages_scraped = incremental["pages"]
+        saved_count = incremental["saved"]
+        print(f"Incremental crawl: {incremental['reviews']} new reviews in {incremental['pages']} pages")
+        
+        # 高水位標は新着分をすべて保存できた場合だけ進める
+        previous_mark = scraping_state.get("high_water_mark") or []
+        high_water_mark, gap_page = next_high_water_mark(incremental, previous_mark)
+        if high_water_mark != previous_mark:
+            scraping_state["high_water_mark"] = high_water_mark
+            if gap_page is not None:
+                # 前回の位置までの残りのページは、バックフィルの位置を戻さず別の範囲として取り直す
+                scraping_state.setdefault("pending_gaps", []).append({"page": gap_page, "until": previous_mark})
+            elif not previous_mark and not scraping_state.get("backfill_page") and not scraping_state.get("last_page"):
+                # 初回は新着分として取得したページの次からバックフィルを始める
+                scraping_state["backfill_page"] = incremental["next_page"]
+            save_state(scraping_state, state_file_path)
         
-        print(f"Scraping pages {start_page} to {end_page}")
+        # 取り漏れた範囲を、その時点の高水位標に届くまで取得
+        page_budget = BACKFILL_PAGES_PER_RUN
+        if scraping_state.get("pending_gaps"):
+            print(f"Filling {len(scraping_state['pending_gaps'])} pending gap(s)")
+            gap_fill = await run_gap_fill(scraper, POSTS_SEARCH_URL, scraping_state["pending_gaps"], page_budget,
+                                          on_checkpoint=lambda progress: save_state(scraping_state, state_file_path))
+            save_state(scraping_state, state_file_path)
+            pages_scraped += gap_fill["pages"]
+            saved_count += gap_fill["saved"]
+            page_budget = max(page_budget - gap_fill["pages"], 0)
         
-        # スクレイピングを実行
-        results = await scraper.scrape_sauna_reviews(start_page, end_page)
+        # 過去のレビューを数ページずつさかのぼって取得（バックフィル）
+        start_page = int(scraping_state.get("backfill_page") or int(scraping_state.get("last_page", 0)) + 1)
+        end_page = start_page - 1
+        if not scraping_state.get("backfill_done", False) and page_budget > 0:
+            print(f"Backfilling from page {start_page}")
+            
+            # ページを保存するたびに再開位置を記録（中断しても次回は続きから取得）
+            def checkpoint(progress):
+                scraping_state["backfill_page"] = progress["next_page"]
+                scraping_state["last_page"] = progress["next_page"] - 1
+                save_state(scraping_state, state_file_path)
+            
+            backfill = await run_backfill(scraper, POSTS_SEARCH_URL, start_page, page_budget, on_checkpoint=checkpoint)
+            pages_scraped += backfill["pages"]
+            saved_count += backfill["saved"]
+            end_page = backfill["next_page"] - 1
+            scraping_state["backfill_page"] = backfill["next_page"]
+            scraping_state["backfill_done"] = backfill["done"]
         
-        # レビューを保存（非同期関数）
-        print(f"Scraped {len(results)} reviews")
-        saved_count = await save_reviews(results)
         print(f"Saved {saved_count} reviews to database")
         
         # 状態を更新
-        scraping_state["is_running"] = False
-        scraping_state["last_scraped_page"] = end_page
-        scraping_state["total_scraped_pages"] += (end_page - start_page + 1)
+        scraping_state["last_page"] = max(end_page, 0)
+        scraping_state["total_pages_scraped"] += pages_scraped
         scraping_state["last_run"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         scraping_state["next_scraping"] = (datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')
         
@@ -104,12 +155,11 @@ async def main_async():
         print(f"Error in GitHub Actions scraper: {str(e)}")
         print(traceback.format_exc())
         
-        # エラー発生時も状態を更新
-        if 'scraping_state' in locals() and 'state_file_path' in locals():
-            scraping_state["is_running"] = False
-            save_state(scraping_state, state_file_path)
-        
         print("GitHub Actions scraper failed")
+    
+    finally:
+        # 共有HTTPセッションを閉じる
+        await close_http_session()
 
 def main():
     """GitHub Actionsから実行されるメイン関数"""
@@ -121,9 +171,8 @@ def save_state(state, filepath):
         # 保存先ディレクトリを確認
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
-        # 状態をJSONファイルとして保存
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+        # 状態をJSONファイルとして保存（一時ファイルに書き出してから置き換える）
+        write_json_atomic(filepath, state)
         
         print(f"Saved scraping state to {filepath}")
     except Exception as e:
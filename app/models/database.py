@@ -1,10 +1,22 @@
 import sqlite3
-from datetime import datetime
+import asyncio
+import json
+from contextlib import contextmanager, asynccontextmanager
+from datetime import datetime, timezone
 from pathlib import Path
+import threading
+import time
 import traceback
 import os
 import sys
 
+import aiosqlite
+
+from app.config import HIDDEN_GEM_KEYWORDS
+from app.services.bigram import bigram_tokens, split_runs, run_bigrams
+from app.services.dedup import db_review_filter
+from app.services.keyword_matcher import get_matcher
+
 # 環境情報は起動時に1度だけ表示
 IS_RENDER = os.environ.get('RENDER', 'False') == 'True'
 ENV_INFO_DISPLAYED = False
@@ -31,52 +43,257 @@ def display_env_info_once():
             print(f"環境: ローカル (データベース: {DATABASE_PATH})")
         ENV_INFO_DISPLAYED = True
 
+# SQLite接続に適用するPRAGMA設定
+# WALモードにより、スクレイパーの書き込み中もランキング等の読み込みが待たされない
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),  # WALではNORMALでもコミットの整合性は保たれる
+    ("mmap_size", 64 * 1024 * 1024),  # 64MBまでメモリマップで読み込む
+    ("cache_size", -16 * 1024),  # ページキャッシュ約16MB（負値はKiB単位）
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),  # ロック待ちの上限（ミリ秒）
+)
+
+# スレッドごとに再利用する接続
+_thread_local = threading.local()
+
+def _connect():
+    """PRAGMA設定済みの新しい接続を作成する"""
+    # 環境情報を表示
+    display_env_info_once()
+    
+    # データベースディレクトリが存在することを確認
+    DATABASE_PATH.parent.mkdir(exist_ok=True)
+    
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.row_factory = sqlite3.Row  # 辞書形式で結果を取得
+    for name, value in SQLITE_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
 def get_db():
-    """データベース接続を取得"""
+    """データベース接続を取得（呼び出し側で閉じる独立した接続）"""
     try:
-        # 環境情報を表示
-        display_env_info_once()
-        
-        # データベースディレクトリが存在することを確認
-        DATABASE_PATH.parent.mkdir(exist_ok=True)
-        
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row  # 辞書形式で結果を取得
-        return conn
+        return _connect()
     except Exception as e:
         print(f"データベース接続エラー: {e}")
         print(traceback.format_exc())
         # エラーを再発生させる
         raise
 
-# テーブル初期化の状態を記録
-DB_INITIALIZED = False
+def get_thread_db():
+    """現在のスレッド専用の接続を取得する（初回のみ接続を作成）"""
+    conn = getattr(_thread_local, "conn", None)
+    if conn is None:
+        conn = get_db()
+        _thread_local.conn = conn
+    return conn
 
-async def init_db(conn=None):
-    """データベースの初期化"""
-    global DB_INITIALIZED
+def close_thread_db():
+    """現在のスレッド専用の接続を閉じる"""
+    conn = getattr(_thread_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _thread_local.conn = None
+
+@contextmanager
+def db_connection(conn=None):
+    """
+    データベース接続を貸し出すコンテキストマネージャー
     
-    # 既に初期化済みの場合はスキップ
-    if DB_INITIALIZED:
-        return True
+    接続を指定しない場合はスレッドごとに再利用する接続を使用し、ブロックを正常に抜けると
+    コミット、例外時はロールバックします。接続を指定した場合はその接続をそのまま使用します。
+    """
+    if conn is not None:
+        yield conn
+        return
     
+    conn = get_thread_db()
     try:
-        if conn is None:
-            conn = get_db()
-        
-        cur = conn.cursor()
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+# コルーチンから使用する非同期接続（専用スレッドで動作するaiosqlite接続）
+_async_conn = None
+_async_lock = None
+
+# 読み込み専用の非同期接続のプール（書き込み用の接続のロックを待たずに読み込む）
+READ_POOL_SIZE = 2
+_read_pool = None
+_read_conns = []
+
+async def _open_async_connection(read_only=False):
+    """PRAGMA設定済みの新しい非同期接続を作成する"""
+    # 環境情報を表示
+    display_env_info_once()
+    
+    # データベースディレクトリが存在することを確認
+    DATABASE_PATH.parent.mkdir(exist_ok=True)
+    
+    conn = await aiosqlite.connect(DATABASE_PATH)
+    conn.row_factory = sqlite3.Row  # 辞書形式で結果を取得
+    for name, value in SQLITE_PRAGMAS:
+        await conn.execute(f"PRAGMA {name} = {value}")
+    if read_only:
+        await conn.execute("PRAGMA query_only = ON")
+    return conn
+
+async def get_async_db():
+    """PRAGMA設定済みの共有非同期接続を取得する（初回のみ接続を作成）"""
+    global _async_conn
+    
+    if _async_conn is None:
+        _async_conn = await _open_async_connection()
+    
+    return _async_conn
+
+async def close_async_db():
+    """共有非同期接続と読み込み用の接続を閉じる"""
+    global _async_conn, _read_pool
+    
+    if _async_conn is not None:
+        await _async_conn.close()
+        _async_conn = None
+    
+    _read_pool = None
+    while _read_conns:
+        await _read_conns.pop().close()
+
+@asynccontextmanager
+async def async_db_connection(conn=None):
+    """
+    非同期接続を貸し出すコンテキストマネージャー
+    
+    接続を指定しない場合は共有の非同期接続を排他的に使用し、ブロックを正常に抜けると
+    コミット、例外時はロールバックします。クエリは専用スレッドで実行されるため、
+    ディスクI/Oの遅延がイベントループを止めることはありません。
+    """
+    global _async_lock
+    
+    if conn is not None:
+        yield conn
+        return
+    
+    if _async_lock is None:
+        _async_lock = asyncio.Lock()
+    
+    # 共有接続上でトランザクションが混ざらないよう1件ずつ処理する
+    async with _async_lock:
+        conn = await get_async_db()
+        try:
+            yield conn
+            if conn.in_transaction:
+                await conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                await conn.rollback()
+            raise
+
+@asynccontextmanager
+async def async_read_connection(conn=None):
+    """
+    読み込み専用の非同期接続を貸し出すコンテキストマネージャー
+    
+    書き込み用の共有接続とは別の接続をプールから貸し出すため、書き込みのトランザクション
+    （BEGIN IMMEDIATE のロック待ちを含む）の終了を待たずに読み込めます。
+    WALモードでは書き込み中もコミット済みの内容を読み込めます。
+    接続を指定した場合（書き込みと同じトランザクションで読み込む場合）はその接続を使います。
+    """
+    global _read_pool
+    
+    if conn is not None:
+        yield conn
+        return
+    
+    pool = _read_pool
+    if pool is None:
+        # 接続の作成中に呼び出された場合は、作成した接続がプールに入るのを待つ
+        pool = _read_pool = asyncio.Queue()
+        for _ in range(READ_POOL_SIZE):
+            read_conn = await _open_async_connection(read_only=True)
+            _read_conns.append(read_conn)
+            pool.put_nowait(read_conn)
+    
+    conn = await pool.get()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            await conn.rollback()
+        pool.put_nowait(conn)
+
+# 全文検索の索引をまとめて登録する件数
+FTS_BATCH_SIZE = 1000
+
+# 関連度順に並べる一致件数の上限（超えた場合は新しい順に並べる）
+FTS_RANK_LIMIT = 2000
+
+# 検索結果の総件数を数える上限（超えた場合は上限値を返す）
+FTS_COUNT_LIMIT = 10000
+
+async def index_reviews_fts(conn, after_rowid=0) -> int:
+    """
+    指定したrowidより後に追加されたレビューを全文検索の索引に登録する
+    
+    レビュー本文はPythonでbigramに分割してから登録します（FTS5の unicode61 で空白区切りの単語として扱われる）。
+    
+    Returns:
+        登録したレビュー数
+    """
+    indexed = 0
+    while True:
+        rows = await conn.execute_fetchall(
+            "SELECT rowid, review_text FROM reviews WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (after_rowid, FTS_BATCH_SIZE)
+        )
+        if not rows:
+            return indexed
         
-        # テーブルの作成
-        cur.execute('''
+        await conn.executemany(
+            "INSERT INTO reviews_fts (rowid, tokens) VALUES (?, ?)",
+            [(row[0], bigram_tokens(row[1])) for row in rows]
+        )
+        indexed += len(rows)
+        after_rowid = rows[-1][0]
+
+async def _backfill_reviews_fts(conn):
+    """既存のレビューを全文検索の索引に登録する（マイグレーション用）"""
+    indexed = await index_reviews_fts(conn)
+    print(f"全文検索の索引に既存のレビューを登録しました: {indexed}件")
+
+async def _backfill_hidden_gem_scores(conn):
+    """既存のレビューの穴場スコアを算出し、サウナごとの合計を sauna_stats に反映する（マイグレーション用）"""
+    matcher = get_matcher(HIDDEN_GEM_KEYWORDS)
+    rows = await conn.execute_fetchall("SELECT rowid, review_text FROM reviews")
+    scores = [(matcher.score(review_text or ""), rowid) for rowid, review_text in rows]
+    await conn.executemany("UPDATE reviews SET hidden_gem_score = ? WHERE rowid = ?", [row for row in scores if row[0]])
+    await conn.execute(
+        """
+        UPDATE sauna_stats SET score = COALESCE(
+            (SELECT SUM(hidden_gem_score) FROM reviews WHERE reviews.sauna_id = sauna_stats.sauna_id), 0
+        )
+        """
+    )
+    print(f"既存のレビューの穴場スコアを算出しました: {len(rows)}件")
+
+# スキーマのマイグレーション（適用済みのバージョンは PRAGMA user_version で管理）
+# 各ステップはSQL文、またはSQLでは書けない処理を行う非同期関数
+SCHEMA_MIGRATIONS = [
+    (1, "基本テーブルの作成", [
+        """
         CREATE TABLE IF NOT EXISTS reviews (
             review_id TEXT PRIMARY KEY,
             sauna_name TEXT,
             review_text TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        ''')
-        
-        cur.execute('''
+        """,
+        """
         CREATE TABLE IF NOT EXISTS sauna_stats (
             sauna_id TEXT PRIMARY KEY,
             sauna_name TEXT,
@@ -84,42 +301,151 @@ async def init_db(conn=None):
             score REAL DEFAULT 0,
             last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        ''')
-        
-        conn.commit()
-        
-        # テーブルが作成されたか確認
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reviews'")
-        has_reviews_table = cur.fetchone() is not None
-        
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='sauna_stats'")
-        has_stats_table = cur.fetchone() is not None
+        """,
+    ]),
+    (2, "最新レビュー・ランキング取得用のインデックス", [
+        "CREATE INDEX IF NOT EXISTS idx_reviews_created_at ON reviews (created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_reviews_sauna_name ON reviews (sauna_name)",
+        # ランキング取得で参照する列をすべて含むカバリングインデックス
+        """
+        CREATE INDEX IF NOT EXISTS idx_sauna_stats_ranking
+        ON sauna_stats (review_count DESC, last_updated DESC, sauna_id, sauna_name)
+        """,
+    ]),
+    (3, "レビューにサウナURLとサウナIDを追加", [
+        "ALTER TABLE reviews ADD COLUMN sauna_url TEXT",
+        "ALTER TABLE reviews ADD COLUMN sauna_id TEXT",
+        "UPDATE reviews SET sauna_id = lower(replace(sauna_name, ' ', '_')) WHERE sauna_id IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_reviews_sauna_id ON reviews (sauna_id)",
+    ]),
+    (4, "レビュー本文の全文検索用索引（bigram）", [
+        # 本文は reviews にあるため索引のみを保持する（rowid は reviews の rowid）
+        "CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5(tokens, content='', tokenize='unicode61')",
+        _backfill_reviews_fts,
+    ]),
+    (5, "ジョブの実行権（リース）の管理テーブル", [
+        """
+        CREATE TABLE IF NOT EXISTS job_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            acquired_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+    ]),
+    (6, "ワーカー間で共有する状態のテーブル", [
+        # 名前→JSON、更新のたびに version を1つ進める
+        """
+        CREATE TABLE IF NOT EXISTS shared_state (
+            name TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+    ]),
+    (7, "レビューの穴場スコア（サウナごとの合計は sauna_stats.score）", [
+        "ALTER TABLE reviews ADD COLUMN hidden_gem_score INTEGER NOT NULL DEFAULT 0",
+        _backfill_hidden_gem_scores,
+    ]),
+    (8, "バックグラウンドジョブの状態（全ワーカーから参照）", [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            owner TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            result TEXT,
+            error TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at DESC)",
+    ]),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+async def migrate_schema(conn) -> int:
+    """
+    未適用のマイグレーションを順に適用する
+    
+    各バージョンは書き込みロックを取得したトランザクション内で適用するため、
+    複数プロセスが同時に起動しても二重に適用されることはありません。
+    
+    Returns:
+        適用後のスキーマバージョン
+    """
+    for version, description, statements in SCHEMA_MIGRATIONS:
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = await conn.execute_fetchall("PRAGMA user_version")
+            if rows[0][0] >= version:
+                await conn.rollback()
+                continue
+            
+            for statement in statements:
+                if callable(statement):
+                    await statement(conn)
+                else:
+                    await conn.execute(statement)
+            await conn.execute(f"PRAGMA user_version = {version}")
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+        
+        print(f"スキーマを更新しました: v{version} ({description})")
+    
+    rows = await conn.execute_fetchall("PRAGMA user_version")
+    return rows[0][0]
+
+# テーブル初期化の状態を記録
+DB_INITIALIZED = False
+
+async def init_db(conn=None):
+    """データベースの初期化（スキーマのマイグレーションを含む）"""
+    global DB_INITIALIZED
+    
+    # 既に初期化済みの場合はスキップ
+    if DB_INITIALIZED:
+        return True
+    
+    try:
+        async with async_db_connection(conn) as conn:
+            # テーブルとインデックスを最新のスキーマに更新
+            version = await migrate_schema(conn)
+            
+            # テーブルが作成されたか確認
+            rows = await conn.execute_fetchall("SELECT name FROM sqlite_master WHERE type='table' AND name='reviews'")
+            has_reviews_table = len(rows) > 0
+            
+            rows = await conn.execute_fetchall("SELECT name FROM sqlite_master WHERE type='table' AND name='sauna_stats'")
+            has_stats_table = len(rows) > 0
         
-        if has_reviews_table and has_stats_table:
-            print(f"データベーステーブル初期化完了 (reviews, sauna_stats)")
+        if has_reviews_table and has_stats_table and version == SCHEMA_VERSION:
+            print(f"データベーステーブル初期化完了 (reviews, sauna_stats, スキーマ v{version})")
             DB_INITIALIZED = True
             return True
         else:
-            print(f"警告: テーブル初期化に問題があります (reviews: {has_reviews_table}, sauna_stats: {has_stats_table})")
+            print(f"警告: テーブル初期化に問題があります (reviews: {has_reviews_table}, sauna_stats: {has_stats_table}, スキーマ v{version})")
             return False
             
     except Exception as e:
         print(f"データベース初期化エラー: {str(e)}")
         print(traceback.format_exc())
         return False
-    finally:
-        if conn is not None and conn != get_db():
-            conn.close()
 
 async def save_review(conn_or_review_id, sauna_name=None, review_text=None, sauna_url=None) -> bool:
     """レビューをデータベースに保存"""
     conn = None
     review_id = None
-    close_conn = False
     
     try:
         # 最初の引数が接続オブジェクトかレビューIDかを判定
-        if isinstance(conn_or_review_id, sqlite3.Connection):
+        if isinstance(conn_or_review_id, aiosqlite.Connection):
             conn = conn_or_review_id
             # URLからレビューIDを生成
             if sauna_url:
@@ -128,79 +454,68 @@ async def save_review(conn_or_review_id, sauna_name=None, review_text=None, saun
                 review_id = f"{sauna_name}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
         else:
             # 最初の引数がレビューIDの場合
-            conn = get_db()
-            close_conn = True
             review_id = conn_or_review_id
         
         # データベーステーブルを初期化
-        await init_db(conn)
-        
-        cur = conn.cursor()
-        
-        # 重複チェック（短いログメッセージ）
-        cur.execute("SELECT COUNT(*) FROM reviews WHERE review_id = ?", (review_id,))
-        if cur.fetchone()[0] > 0:
-            return False
-        
-        # 新しいレビューを挿入
-        cur.execute(
-            "INSERT INTO reviews (review_id, sauna_name, review_text) VALUES (?, ?, ?)",
-            (review_id, sauna_name, review_text)
-        )
-        
-        # サウナ統計の更新（存在しない場合は作成）
-        sauna_id = sauna_name.replace(" ", "_").lower()
-        
-        cur.execute("SELECT review_count FROM sauna_stats WHERE sauna_id = ?", (sauna_id,))
-        result = cur.fetchone()
+        await init_db()
         
-        if result:
-            # 既存のサウナ統計を更新
-            cur.execute(
-                "UPDATE sauna_stats SET review_count = review_count + 1, last_updated = CURRENT_TIMESTAMP WHERE sauna_id = ?",
-                (sauna_id,)
+        async with async_db_connection(conn) as conn:
+            # 重複チェック（フィルタで確実に未保存と分かる場合は照会を省く）
+            if db_review_filter.might_contain(review_id):
+                rows = await conn.execute_fetchall("SELECT COUNT(*) FROM reviews WHERE review_id = ?", (review_id,))
+                if rows[0][0] > 0:
+                    return False
+            
+            # 新しいレビューを挿入
+            sauna_id = sauna_name.replace(" ", "_").lower()
+            cursor = await conn.execute(
+                "INSERT INTO reviews (review_id, sauna_name, review_text, sauna_url, sauna_id) VALUES (?, ?, ?, ?, ?)",
+                (review_id, sauna_name, review_text, sauna_url, sauna_id)
             )
-        else:
-            # 新しいサウナ統計を作成
-            cur.execute(
-                "INSERT INTO sauna_stats (sauna_id, sauna_name, review_count) VALUES (?, ?, 1)",
+            
+            # 全文検索の索引に登録
+            await conn.execute(
+                "INSERT INTO reviews_fts (rowid, tokens) VALUES (?, ?)",
+                (cursor.lastrowid, bigram_tokens(review_text))
+            )
+            
+            # サウナ統計の更新（存在しない場合は作成）
+            await conn.execute(
+                """
+                INSERT INTO sauna_stats (sauna_id, sauna_name, review_count) VALUES (?, ?, 1)
+                ON CONFLICT(sauna_id) DO UPDATE SET
+                    review_count = review_count + 1,
+                    last_updated = CURRENT_TIMESTAMP
+                """,
                 (sauna_id, sauna_name)
             )
-        
-        conn.commit()
-        return True
+            
+            await conn.commit()
+            db_review_filter.add_many([review_id])
+            return True
         
     except Exception as e:
         print(f"レビュー保存エラー ({review_id}): {str(e)}")
         print(traceback.format_exc())
         return False
-    finally:
-        if close_conn and conn:
-            conn.close()
 
 async def get_sauna_ranking(limit: int = 20, conn=None) -> list:
     """サウナのランキングを取得"""
-    close_conn = False
     try:
         # データベーステーブルを初期化
         await init_db()
         
-        if conn is None:
-            conn = get_db()
-            close_conn = True
-        
-        cur = conn.cursor()
-        
-        # レビュー数の多い順にサウナを取得
-        cur.execute("""
-        SELECT sauna_id, sauna_name, review_count, last_updated
-        FROM sauna_stats
-        ORDER BY review_count DESC, last_updated DESC
-        LIMIT ?
-        """, (limit,))
+        async with async_read_connection(conn) as conn:
+            # レビュー数の多い順にサウナを取得
+            rows = await conn.execute_fetchall("""
+            SELECT sauna_id, sauna_name, review_count, last_updated
+            FROM sauna_stats
+            ORDER BY review_count DESC, last_updated DESC
+            LIMIT ?
+            """, (limit,))
         
         results = []
-        for row in cur.fetchall():
+        for row in rows:
             results.append({
                 "sauna_id": row["sauna_id"],
                 "name": row["sauna_name"],
@@ -213,81 +528,193 @@ async def get_sauna_ranking(limit: int = 20, conn=None) -> list:
         print(f"ランキング取得エラー: {str(e)}")
         print(traceback.format_exc())
         return []
-    finally:
-        if close_conn and conn:
-            conn.close()
 
 async def get_review_count(conn=None) -> int:
     """保存されているレビューの総数を取得"""
-    close_conn = False
     try:
         # データベーステーブルを初期化
         await init_db()
         
-        if conn is None:
-            conn = get_db()
-            close_conn = True
-        
-        cur = conn.cursor()
-        
-        cur.execute("SELECT COUNT(*) FROM reviews")
-        count = cur.fetchone()[0]
+        async with async_read_connection(conn) as conn:
+            rows = await conn.execute_fetchall("SELECT COUNT(*) FROM reviews")
         
-        return count
+        return rows[0][0]
     except Exception as e:
         print(f"レビュー数取得エラー: {str(e)}")
         return 0
-    finally:
-        if close_conn and conn:
-            conn.close()
+
+async def get_data_version(conn=None) -> tuple:
+    """
+    レビューデータの版（最新レビューのrowidと追加時刻）を取得する
+    ETagなどの条件付きレスポンスの判定に使用します
+    
+    レビューは追加のみ（リセット時は全削除）のため、最新のrowidが変わらなければデータも変わっていません。
+    COUNT(*) や MAX(created_at) のように全件を走査せず、rowidの索引の末尾の1行だけを読みます。
+    
+    Returns:
+        (最新レビューのrowid（レビューがない場合は0）, 最新レビューの追加時刻（UTCのUNIX時刻、レビューがない場合はNone）)
+    """
+    try:
+        # データベーステーブルを初期化
+        await init_db()
+        
+        async with async_read_connection(conn) as conn:
+            rows = await conn.execute_fetchall("SELECT rowid, created_at FROM reviews ORDER BY rowid DESC LIMIT 1")
+        
+        if not rows:
+            return 0, None
+        
+        last_rowid, latest = rows[0]
+        if latest is None:
+            return last_rowid, None
+        
+        # created_at はUTCのCURRENT_TIMESTAMP（"YYYY-MM-DD HH:MM:SS"）
+        return last_rowid, datetime.strptime(latest, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+    except Exception as e:
+        print(f"データ版の取得エラー: {str(e)}")
+        return 0, None
+
+def _build_fts_query(query):
+    """
+    検索語からFTS5のMATCH式を作成する
+    
+    空白で区切られた語ごとにbigramのフレーズ（連続した並び＝部分一致）を作り、AND で結合します。
+    1文字の語はbigramで表せないため None を返します（呼び出し側でLIKE検索に切り替える）。
+    """
+    runs = split_runs(query)
+    if not runs or any(len(run) < 2 for run in runs):
+        return None
+    
+    phrases = []
+    for run in runs:
+        phrase = ' '.join(run_bigrams(run)).replace('"', '""')
+        phrases.append(f'"{phrase}"')
+    return ' AND '.join(phrases)
+
+def _escape_like(text):
+    """LIKE検索のワイルドカードをエスケープする"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+async def search_reviews_fts(query, limit=20, offset=0, conn=None) -> dict:
+    """
+    全文検索の索引を使ってレビューを検索する（関連度順、ページ分割）
+    
+    Args:
+        query: 検索語（空白区切りで複数指定するとすべてを含むレビュー）
+        limit: 1ページの件数
+        offset: 読み飛ばす件数
+    
+    一致件数が FTS_RANK_LIMIT を超える語は、全件のスコア計算を避けるため新しい順に並べます。
+    総件数は FTS_COUNT_LIMIT で打ち切ります（total_exact が False の場合は下限値）。
+    
+    Returns:
+        総件数・並び順と検索結果（レビューID・サウナ名・URL・本文・追加日時・スコア）
+    """
+    # データベーステーブルを初期化
+    await init_db()
+    
+    match = _build_fts_query(query)
+    
+    async with async_read_connection(conn) as conn:
+        if match is not None:
+            rows = await conn.execute_fetchall(
+                "SELECT COUNT(*) FROM (SELECT 1 FROM reviews_fts WHERE reviews_fts MATCH ? LIMIT ?)",
+                (match, FTS_COUNT_LIMIT + 1)
+            )
+            total = min(rows[0][0], FTS_COUNT_LIMIT)
+            total_exact = rows[0][0] <= FTS_COUNT_LIMIT
+            
+            # 一致件数が多い場合は索引の並び（rowid＝追加順）のまま新しい順に返す
+            order = "relevance" if rows[0][0] <= FTS_RANK_LIMIT else "newest"
+            order_by = "rank" if order == "relevance" else "rowid DESC"
+            
+            # 索引だけで並べ替えと絞り込みを行い、そのページ分だけ本文を結合する
+            rows = await conn.execute_fetchall(
+                f"""
+                SELECT r.review_id, r.sauna_name, r.sauna_url, r.review_text, r.created_at, hits.rank
+                FROM (
+                    SELECT rowid, rank FROM reviews_fts WHERE reviews_fts MATCH ?
+                    ORDER BY {order_by} LIMIT ? OFFSET ?
+                ) AS hits
+                JOIN reviews r ON r.rowid = hits.rowid
+                ORDER BY {"hits.rank" if order == "relevance" else "hits.rowid DESC"}
+                """,
+                (match, limit, offset)
+            )
+        else:
+            # 1文字の語はLIKEで検索する（新しい順）
+            runs = split_runs(query)
+            if not runs:
+                return {"total": 0, "total_exact": True, "order": "newest", "results": []}
+            
+            where = " AND ".join("lower(review_text) LIKE ? ESCAPE '\\'" for _ in runs)
+            params = [f"%{_escape_like(run)}%" for run in runs]
+            
+            rows = await conn.execute_fetchall(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM reviews WHERE {where} LIMIT ?)",
+                params + [FTS_COUNT_LIMIT + 1]
+            )
+            total = min(rows[0][0], FTS_COUNT_LIMIT)
+            total_exact = rows[0][0] <= FTS_COUNT_LIMIT
+            order = "newest"
+            
+            rows = await conn.execute_fetchall(
+                f"""
+                SELECT review_id, sauna_name, sauna_url, review_text, created_at, 0 AS rank
+                FROM reviews WHERE {where}
+                ORDER BY created_at DESC LIMIT ? OFFSET ?
+                """,
+                params + [limit, offset]
+            )
+    
+    results = [
+        {
+            "review_id": row[0],
+            "sauna_name": row[1],
+            "sauna_url": row[2],
+            "review_text": row[3],
+            "created_at": row[4],
+            # bm25は小さいほど関連度が高いため、符号を反転して返す
+            "score": round(-row[5], 4)
+        }
+        for row in rows
+    ]
+    return {"total": total, "total_exact": total_exact, "order": order, "results": results}
 
 def count_reviews(conn=None) -> int:
     """
     レビューの数を数える同期版関数
     この関数はget_review_countの同期バージョンとして機能します
     """
-    close_conn = False
     try:
-        if conn is None:
-            conn = get_db()
-            close_conn = True
-        
-        cur = conn.cursor()
-        
-        cur.execute("SELECT COUNT(*) FROM reviews")
-        count = cur.fetchone()[0]
+        with db_connection(conn) as conn:
+            cur = conn.cursor()
+            
+            cur.execute("SELECT COUNT(*) FROM reviews")
+            count = cur.fetchone()[0]
         
         return count
     except Exception as e:
         print(f"レビュー数取得エラー: {str(e)}")
         return 0
-    finally:
-        if close_conn and conn:
-            conn.close()
 
 async def get_latest_reviews(limit: int = 10, conn=None) -> list:
     """最新のレビューを取得"""
-    close_conn = False
     try:
         # データベーステーブルを初期化
         await init_db()
         
-        if conn is None:
-            conn = get_db()
-            close_conn = True
-        
-        cur = conn.cursor()
-        
-        # 最新のレビューを取得
-        cur.execute("""
-        SELECT review_id, sauna_name, review_text, created_at
-        FROM reviews
-        ORDER BY created_at DESC
-        LIMIT ?
-        """, (limit,))
+        async with async_read_connection(conn) as conn:
+            # 最新のレビューを取得
+            rows = await conn.execute_fetchall("""
+            SELECT review_id, sauna_name, review_text, created_at
+            FROM reviews
+            ORDER BY created_at DESC
+            LIMIT ?
+            """, (limit,))
         
         results = []
-        for row in cur.fetchall():
+        for row in rows:
             results.append({
                 "review_id": row["review_id"],
                 "sauna_name": row["sauna_name"],
@@ -300,33 +727,214 @@ async def get_latest_reviews(limit: int = 10, conn=None) -> list:
         print(f"最新レビュー取得エラー: {str(e)}")
         print(traceback.format_exc())
         return []
-    finally:
-        if close_conn and conn:
-            conn.close()
 
 async def reset_database(conn=None):
     """データベースをリセットする"""
-    close_conn = False
     try:
-        if conn is None:
-            conn = get_db()
-            close_conn = True
-        
-        cur = conn.cursor()
-        
-        # レビューテーブルを空にする
-        cur.execute("DELETE FROM reviews")
+        async with async_db_connection(conn) as conn:
+            # レビューテーブルと全文検索の索引を空にする
+            await conn.execute("DELETE FROM reviews")
+            await conn.execute("INSERT INTO reviews_fts (reviews_fts) VALUES ('delete-all')")
+            
+            # サウナ統計テーブルを空にする
+            await conn.execute("DELETE FROM sauna_stats")
+            
+            await conn.commit()
         
-        # サウナ統計テーブルを空にする
-        cur.execute("DELETE FROM sauna_stats")
+        # 保存済みのレビューIDがなくなったため重複判定フィルタも空にする
+        db_review_filter.reset()
         
-        conn.commit()
         print("データベースリセット完了")
         return True
     except Exception as e:
         print(f"データベースリセットエラー: {str(e)}")
         print(traceback.format_exc())
         return False
-    finally:
-        if close_conn and conn:
-            conn.close() 
\ No newline at end of file
+
+async def acquire_lease(name, owner, ttl, conn=None) -> bool:
+    """
+    ジョブの実行権（リース）を取得する
+    
+    書き込みロックを取得したトランザクション内で確認と更新を行うため、複数のプロセスが同時に
+    取得しようとしても成功するのは1つだけです。有効期限の切れたリースは他の所有者でも取得できます。
+    
+    Args:
+        name: ジョブ名
+        owner: 所有者の識別子
+        ttl: 有効期間（秒）
+    
+    Returns:
+        取得できたかどうか（同じ所有者が保持している場合は期限を延長してTrue）
+    """
+    async with async_db_connection(conn) as conn:
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            rows = await conn.execute_fetchall("SELECT owner, expires_at FROM job_leases WHERE name = ?", (name,))
+            if rows and rows[0][0] != owner:
+                if rows[0][1] > now:
+                    await conn.rollback()
+                    return False
+                print(f"期限切れのリースを回収しました ({name}): {rows[0][0]}")
+            
+            await conn.execute(
+                """
+                INSERT INTO job_leases (name, owner, acquired_at, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    owner = excluded.owner,
+                    acquired_at = excluded.acquired_at,
+                    expires_at = excluded.expires_at
+                """,
+                (name, owner, now, now + ttl)
+            )
+            await conn.commit()
+            return True
+        except BaseException:
+            await conn.rollback()
+            raise
+
+async def renew_lease(name, owner, ttl, conn=None) -> bool:
+    """保持しているリースの期限を延長する（他の所有者に回収されていた場合はFalse）"""
+    async with async_db_connection(conn) as conn:
+        cursor = await conn.execute(
+            "UPDATE job_leases SET expires_at = ? WHERE name = ? AND owner = ?",
+            (time.time() + ttl, name, owner)
+        )
+        await conn.commit()
+        return cursor.rowcount == 1
+
+async def release_lease(name, owner, conn=None) -> bool:
+    """保持しているリースを解放する"""
+    async with async_db_connection(conn) as conn:
+        cursor = await conn.execute("DELETE FROM job_leases WHERE name = ? AND owner = ?", (name, owner))
+        await conn.commit()
+        return cursor.rowcount == 1
+
+async def get_lease(name, conn=None):
+    """有効なリースの情報（所有者・取得時刻・期限）を取得する（なければNone）"""
+    async with async_read_connection(conn) as conn:
+        rows = await conn.execute_fetchall(
+            "SELECT owner, acquired_at, expires_at FROM job_leases WHERE name = ? AND expires_at > ?",
+            (name, time.time())
+        )
+    if not rows:
+        return None
+    return {"owner": rows[0][0], "acquired_at": rows[0][1], "expires_at": rows[0][2]}
+
+# ジョブの状態の列（jobs テーブル）
+JOB_COLUMNS = ("job_id", "name", "status", "owner", "created_at", "started_at", "finished_at", "result", "error")
+
+def _job_from_row(row):
+    """jobs テーブルの行をジョブの情報の辞書にする"""
+    job = dict(zip(JOB_COLUMNS, row))
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+async def save_job(job, conn=None):
+    """ジョブの状態を保存する（どのワーカーからも参照できるようにする）"""
+    result = json.dumps(job["result"], ensure_ascii=False, default=str) if job.get("result") is not None else None
+    async with async_db_connection(conn) as conn:
+        await conn.execute(
+            f"""
+            INSERT INTO jobs ({", ".join(JOB_COLUMNS)}) VALUES ({", ".join("?" * len(JOB_COLUMNS))})
+            ON CONFLICT(job_id) DO UPDATE SET
+                status = excluded.status,
+                started_at = excluded.started_at,
+                finished_at = excluded.finished_at,
+                result = excluded.result,
+                error = excluded.error
+            """,
+            tuple(result if column == "result" else job.get(column) for column in JOB_COLUMNS)
+        )
+        await conn.commit()
+
+async def get_job(job_id, conn=None):
+    """ジョブの状態を取得する（見つからない場合はNone）"""
+    async with async_read_connection(conn) as conn:
+        rows = await conn.execute_fetchall(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,))
+    return _job_from_row(rows[0]) if rows else None
+
+async def list_jobs(limit, conn=None):
+    """ジョブの一覧を新しい順に取得する"""
+    async with async_read_connection(conn) as conn:
+        rows = await conn.execute_fetchall(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY created_at DESC, rowid DESC LIMIT ?",
+            (limit,)
+        )
+    return [_job_from_row(row) for row in rows]
+
+async def trim_jobs(keep, conn=None):
+    """新しい順に keep 件より古い終了済みのジョブを削除する"""
+    async with async_db_connection(conn) as conn:
+        await conn.execute(
+            """
+            DELETE FROM jobs
+            WHERE status NOT IN ('queued', 'running')
+              AND job_id NOT IN (SELECT job_id FROM jobs ORDER BY created_at DESC, rowid DESC LIMIT ?)
+            """,
+            (keep,)
+        )
+        await conn.commit()
+
+async def read_shared_state(name, known_version=None, conn=None):
+    """
+    共有状態を読み込む
+    
+    バージョンが known_version と同じ場合は本文を読み込まずに返すため、変更がないかの確認は
+    主キーで1行のバージョンを参照するだけで済みます。
+    
+    Returns:
+        (バージョン, 状態の辞書) の組。未作成の場合は (None, None)、変更がない場合は (バージョン, None)
+    """
+    async with async_read_connection(conn) as conn:
+        rows = await conn.execute_fetchall(
+            "SELECT version, CASE WHEN version = ? THEN NULL ELSE data END FROM shared_state WHERE name = ?",
+            (known_version, name)
+        )
+    if not rows:
+        return None, None
+    return rows[0][0], (json.loads(rows[0][1]) if rows[0][1] is not None else None)
+
+async def update_shared_state(name, changes, replace=False, create_only=False, conn=None):
+    """
+    共有状態を更新してバージョンを進める
+    
+    書き込みロックを取得したトランザクション内で読み込み・マージ・書き込みを行うため、
+    複数のプロセスが別々の項目を同時に更新しても互いの変更を失いません。
+    
+    Args:
+        name: 状態の名前
+        changes: 更新する項目の辞書
+        replace: Trueの場合は既存の項目を破棄して changes で置き換える
+        create_only: Trueの場合は未作成のときだけ作成し、既にあれば変更しない
+    
+    Returns:
+        更新後の (バージョン, 状態の辞書)
+    """
+    async with async_db_connection(conn) as conn:
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = await conn.execute_fetchall("SELECT version, data FROM shared_state WHERE name = ?", (name,))
+            row = rows[0] if rows else None
+            if row is not None and create_only:
+                await conn.rollback()
+                return row[0], json.loads(row[1])
+            
+            data = {} if row is None or replace else json.loads(row[1])
+            data.update(changes)
+            version = (row[0] if row is not None else 0) + 1
+            await conn.execute(
+                """
+                INSERT INTO shared_state (name, data, version, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    data = excluded.data,
+                    version = excluded.version,
+                    updated_at = excluded.updated_at
+                """,
+                (name, json.dumps(data, ensure_ascii=False), version, time.time())
+            )
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+    return version, data
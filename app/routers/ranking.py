@@ -1,7 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
 from app.services.scraper import SaunaScraper
 from app.config import HIDDEN_GEM_KEYWORDS
-from app.models.database import get_sauna_ranking, get_review_count
+from app.services.keyword_matcher import get_matcher
+from app.models.database import get_sauna_ranking, get_review_count, get_data_version
+from app.services.cache import response_cache, make_etag, validator_headers, is_not_modified
 
 router = APIRouter()
 scraper = SaunaScraper()
@@ -28,9 +30,7 @@ async def test_scraping():
             sauna_counts[sauna_name]["reviews"].append(review["review"])
             
             # レビュー内のキーワードを抽出
-            for keyword in HIDDEN_GEM_KEYWORDS.keys():
-                if keyword in review["review"]:
-                    sauna_counts[sauna_name]["keywords"].add(keyword)
+            sauna_counts[sauna_name]["keywords"].update(get_matcher(HIDDEN_GEM_KEYWORDS).find(review["review"]))
         
         # ランキング形式でソート
         ranking = []
@@ -62,12 +62,27 @@ async def test_scraping():
         }
 
 @router.get("/api/ranking")
-async def get_ranking(limit: int = 40):
+async def get_ranking(request: Request, response: Response, limit: int = 40):
     """データベースに基づいたサウナランキングを取得"""
     try:
-        # データベースからランキングを取得
-        ranking = await get_sauna_ranking(limit)
-        total_reviews = await get_review_count()
+        # 最新レビューのrowidと追加時刻が変わっていなければ304を返す
+        last_rowid, last_modified = await get_data_version()
+        etag = make_etag("/api/ranking", limit, last_rowid, last_modified)
+        headers = validator_headers(etag, last_modified)
+        if is_not_modified(request.headers, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        
+        # データベースからランキングを取得（同じ版のキャッシュがあれば再利用）
+        # キャッシュキーにETagと同じ版を含め、ETagと異なる版の本文を返さないようにする
+        async def compute():
+            return await get_sauna_ranking(limit), await get_review_count()
+        
+        ranking, total_reviews = await response_cache.get_or_compute(
+            response_cache.make_key("/api/ranking", {"limit": limit, "version": (last_rowid, last_modified)}),
+            compute,
+            should_cache=lambda result: bool(result[0])
+        )
         
         return {
             "status": "success",
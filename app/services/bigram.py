@@ -0,0 +1,43 @@
+"""
+日本語テキストを文字bigram（2文字ずつ）に分割するモジュール
+単語の区切りがない日本語でも部分一致で検索できるよう、全文検索の索引と検索語の両方に使用します
+"""
+
+import unicodedata
+
+def normalize_text(text):
+    """検索用にテキストを正規化する（全角英数字・半角カナの統一と小文字化）"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+def _is_word_char(char):
+    """文字・数字かどうか（記号や空白は区切りとして扱う）"""
+    return unicodedata.category(char)[0] in ('L', 'N')
+
+def split_runs(text):
+    """正規化したテキストを、記号や空白で区切られた文字列の並びに分割する"""
+    runs = []
+    current = []
+    for char in normalize_text(text):
+        if _is_word_char(char):
+            current.append(char)
+        elif current:
+            runs.append(''.join(current))
+            current = []
+    if current:
+        runs.append(''.join(current))
+    return runs
+
+def run_bigrams(run):
+    """1つの文字列をbigramに分割する（1文字の場合はその1文字）"""
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+def iter_bigrams(text):
+    """テキストに含まれるbigramを出現順に返す"""
+    for run in split_runs(text):
+        yield from run_bigrams(run)
+
+def bigram_tokens(text):
+    """FTS5に登録する空白区切りのbigram列を作成する"""
+    return ' '.join(iter_bigrams(text))
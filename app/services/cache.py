@@ -0,0 +1,188 @@
+"""
+ルートとクエリパラメータをキーにした計算結果のキャッシュモジュール
+ランキングなど、スクレイピング完了時にしか変わらないデータを一定時間再利用します
+ETag / Last-Modified による条件付きレスポンスの判定もここで行います
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from app.config import RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAXSIZE, ANALYZE_CACHE_TTL, ANALYZE_CACHE_MAXSIZE
+
+class _ComputeCancelled(Exception):
+    """計算していた呼び出しがキャンセルされたことを、結果を待っている呼び出しに知らせる例外"""
+
+class ResponseCache:
+    """
+    TTL付きの計算結果キャッシュ
+    
+    同じキーへの同時アクセスでキャッシュが切れていた場合も、再計算は1回だけ行い、
+    他の呼び出しはその結果を待ちます。計算していた呼び出しがキャンセルされた場合
+    （クライアントの切断など）は、待っていた呼び出しのうち1つが計算し直します。
+    """
+    
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, maxsize=None):
+        """
+        Args:
+            ttl: 計算結果を保持する秒数
+            maxsize: 保持するキーの最大数（超えた場合は最も古く使われたものから削除、Noneは無制限）
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(route, params=None):
+        """ルートとクエリパラメータからキャッシュキーを作成する"""
+        return (route, tuple(sorted((params or {}).items())))
+    
+    async def get_or_compute(self, key, compute, should_cache=None):
+        """
+        キャッシュされた結果を返し、なければ計算して保存する
+        
+        Args:
+            key: キャッシュキー（make_keyで作成）
+            compute: 結果を計算するコルーチン関数（引数なし）
+            should_cache: 結果を保存するかどうかを判定する関数（省略時は常に保存）
+        
+        Returns:
+            計算結果
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+        
+        # 同じキーを計算中であれば、その結果を待つ
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            try:
+                return await asyncio.shield(inflight)
+            except _ComputeCancelled:
+                # 計算していた呼び出しがキャンセルされたため、最初に再開した呼び出しが計算し直す
+                return await self.get_or_compute(key, compute, should_cache)
+        
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            # キャンセルは待っている呼び出しには伝えず、計算し直させる
+            self._inflight.pop(key, None)
+            future.set_exception(_ComputeCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 待っている呼び出しがない場合に警告が出ないよう、例外を取り出しておく
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            # 計算中に無効化された場合は古いデータの可能性があるため保存しない
+            if generation == self._generation and (should_cache is None or should_cache(value)):
+                self._store(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+    
+    def _store(self, key, value):
+        """結果を保存し、上限を超えた場合は最も古く使われたものから削除する"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        if self.maxsize is not None:
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, route=None):
+        """
+        キャッシュを無効化する
+        
+        Args:
+            route: 無効化するルート（省略時はすべて）
+        """
+        self._generation += 1
+        if route is None:
+            self._entries.clear()
+        else:
+            for key in [key for key in self._entries if key[0] == route]:
+                del self._entries[key]
+    
+    def stats(self):
+        """ヒット数・ミス数・ヒット率を返す"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+            "ttl": self.ttl
+        }
+
+# ランキングなどのページ・APIで共有するキャッシュ
+# （キーにデータの版を含めて、ETagと本文の版をそろえる）
+response_cache = ResponseCache(maxsize=RESPONSE_CACHE_MAXSIZE)
+
+# 施設ページの分析結果のキャッシュ（正規化したURLごと）
+analysis_cache = ResponseCache(ttl=ANALYZE_CACHE_TTL, maxsize=ANALYZE_CACHE_MAXSIZE)
+
+def make_etag(*parts):
+    """データの版を表す値からETagを作成する"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode('utf-8')).hexdigest()[:20]
+    return f'"{digest}"'
+
+def validator_headers(etag, last_modified=None):
+    """
+    ETag / Last-Modified のレスポンスヘッダーを作成する
+    
+    Args:
+        etag: make_etagで作成したETag
+        last_modified: 最終更新時刻（UNIX時刻）
+    """
+    # キャッシュは保持してよいが、使う前に必ず再検証させる
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+def is_not_modified(request_headers, etag, last_modified=None):
+    """
+    条件付きリクエストに304で応答できるかを判定する
+    
+    If-None-Match がある場合はそれだけで判定し、ない場合に If-Modified-Since を使います。
+    
+    Args:
+        request_headers: リクエストヘッダー
+        etag: 現在のETag
+        last_modified: 現在の最終更新時刻（UNIX時刻）
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # 弱いETagも同じ値として比較する
+        return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+    
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTPの日付は秒単位のため、秒未満を切り捨てて比較する
+        return int(last_modified) <= since
+    
+    return False
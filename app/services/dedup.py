@@ -0,0 +1,134 @@
+"""
+保存済みレビューの重複判定フィルタ（ブルームフィルタ）モジュール
+起動時に保存済みのキーを登録しておき、データベースやJSONファイルへの書き込み前に既知のレビューを除きます
+"""
+
+import hashlib
+import math
+import threading
+
+from app.config import DEDUP_FILTER_CAPACITY, DEDUP_FILTER_ERROR_RATE
+
+class BloomFilter:
+    """
+    固定サイズのブルームフィルタ
+
+    「含まれない」という判定は確実で、「含まれる」という判定は error_rate 以下の確率で誤ります。
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        # 容量と誤判定率から最適なビット数とハッシュ関数の数を求める
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        """キーに対応するビット位置（2つのハッシュ値から拡張ダブルハッシュで num_hashes 個を作る）"""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        x = int.from_bytes(digest[:8], 'little')
+        y = int.from_bytes(digest[8:], 'little')
+        for i in range(self.num_hashes):
+            yield x % self.num_bits
+            x += y
+            y += i
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class ReviewFilter:
+    """
+    保存先ごとの既知レビューのフィルタ
+
+    登録数が容量を超えると、容量を倍にしたブルームフィルタを追加していくため、
+    件数が増えても誤判定率はおおむね設定値に保たれます。
+    """
+
+    def __init__(self, name, capacity=DEDUP_FILTER_CAPACITY, error_rate=DEDUP_FILTER_ERROR_RATE):
+        self.name = name
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.seeded = False
+        self.hits = 0
+        self.misses = 0
+        self._filters = []
+        self._lock = threading.Lock()
+        self._add_filter(capacity)
+
+    def _add_filter(self, capacity):
+        # 追加するフィルタほど誤判定率を小さくし、全体の誤判定率が発散しないようにする
+        error_rate = self.error_rate * (0.5 ** (len(self._filters) + 1))
+        self._filters.append(BloomFilter(capacity, error_rate))
+
+    def _add(self, key):
+        current = self._filters[-1]
+        if current.count >= current.capacity:
+            self._add_filter(current.capacity * 2)
+            current = self._filters[-1]
+        current.add(key)
+
+    def seed(self, keys):
+        """保存済みのキーでフィルタを作り直す"""
+        with self._lock:
+            self._filters = []
+            self._add_filter(self.capacity)
+            count = 0
+            for key in keys:
+                self._add(key)
+                count += 1
+            self.seeded = True
+        print(f"重複判定フィルタを初期化しました ({self.name}): {count}件")
+        return count
+
+    def add_many(self, keys):
+        """保存したレビューのキーを登録する"""
+        with self._lock:
+            for key in keys:
+                self._add(key)
+
+    def might_contain(self, key):
+        """
+        キーが登録済みの可能性があるか
+
+        Falseの場合は確実に未登録です。初期化前は判定できないため常にTrueを返します。
+        """
+        with self._lock:
+            if not self.seeded:
+                return True
+            found = any(key in bloom for bloom in self._filters)
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return found
+
+    def reset(self):
+        """フィルタを空にする（保存先を空にした場合）"""
+        with self._lock:
+            self._filters = []
+            self._add_filter(self.capacity)
+            self.seeded = True
+
+    def stats(self):
+        """フィルタの統計情報"""
+        with self._lock:
+            return {
+                "seeded": self.seeded,
+                "keys": sum(bloom.count for bloom in self._filters),
+                "filters": len(self._filters),
+                "bytes": sum(len(bloom.bits) for bloom in self._filters),
+                "maybe_known": self.hits,
+                "definitely_new": self.misses
+            }
+
+# データベースのレビューID（reviews.review_id）のフィルタ
+db_review_filter = ReviewFilter("database")
+
+# JSONファイルのレビュー（内容のキー）のフィルタ
+json_review_filter = ReviewFilter("json")
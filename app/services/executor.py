@@ -0,0 +1,54 @@
+"""
+HTML解析や穴場スコア計算などのCPU負荷の高い処理を実行するモジュール
+イベントループをブロックしないよう、スレッドプールまたはプロセスプールで処理します
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+
+from app.config import EXECUTOR_KIND, EXECUTOR_MAX_WORKERS
+
+# アプリ全体で共有するエグゼキューター（初回利用時に生成）
+_executor = None
+
+def get_executor():
+    """
+    設定に応じたエグゼキューターを取得する
+
+    EXECUTOR_KIND が "thread"（既定）の場合はスレッドプール、"process" の場合はプロセスプールを使用します。
+    プロセスプールは、データベース接続などのスレッドを持つ親プロセスを fork しないよう spawn で起動します。
+    """
+    global _executor
+
+    if _executor is None:
+        if EXECUTOR_KIND == "thread":
+            _executor = ThreadPoolExecutor(max_workers=EXECUTOR_MAX_WORKERS, thread_name_prefix="sauna-cpu")
+        else:
+            _executor = ProcessPoolExecutor(max_workers=EXECUTOR_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        print(f"エグゼキューターを初期化しました: {EXECUTOR_KIND} (ワーカー数: {EXECUTOR_MAX_WORKERS})")
+
+    return _executor
+
+async def run_cpu_bound(func, *args, **kwargs):
+    """
+    CPU負荷の高い関数をエグゼキューターで実行し、結果を待つ
+
+    Args:
+        func: 実行する関数（プロセスプールの場合はモジュールレベルの関数であること）
+        *args, **kwargs: 関数に渡す引数
+
+    Returns:
+        関数の戻り値
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(func, *args, **kwargs))
+
+def shutdown_executor():
+    """エグゼキューターを終了する"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
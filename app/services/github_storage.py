@@ -1,15 +1,26 @@
 """
 GitHubリポジトリをストレージとして使用するためのモジュール
-スクレイピングしたデータをJSON形式で保存し、GitHub Actionsを通じてコミットします
+スクレイピングしたデータを日付ごとのJSON Linesセグメントに保存し、GitHub Actionsを通じてコミットします
 """
 
+import hashlib
 import json
 import os
+import threading
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 import subprocess
 import traceback
 
+try:
+    import fcntl
+except ImportError:
+    # Windows ではファイルロックを使わない（開発環境の単一プロセスでの実行を想定）
+    fcntl = None
+
+from app.services.dedup import json_review_filter
+
 # 環境変数
 IS_RENDER = os.environ.get('RENDER', 'False') == 'True'
 
@@ -24,6 +35,34 @@ else:
 
 SCRAPING_DIR = DATA_DIR / 'scraping'
 
+# 保存済みファイルの一覧（ファイル→件数・期間・サイズ）を追記していくマニフェスト
+MANIFEST_FILE = SCRAPING_DIR / 'manifest.jsonl'
+
+# 読み込み済みのマニフェスト（追記分だけを読み足すため、読み込んだ位置も保持）
+_manifest_cache = {"offset": 0, "entries": [], "inode": None}
+
+# マニフェストの追記と置き換えを排他するロック
+_manifest_lock = threading.Lock()
+
+# 日付ごとのセグメントファイル名の接頭辞
+SEGMENT_PREFIX = 'segment_'
+
+# 圧縮済みセグメントのファイル名の接頭辞
+COMPACTED_PREFIX = 'compacted_'
+
+# セグメントへの追記をfsyncでディスクに反映する間隔（レコード数）
+SEGMENT_FSYNC_EVERY = 200
+
+# ファイルを後ろから読み込む際のブロックサイズ
+READ_BLOCK_SIZE = 64 * 1024
+
+# 圧縮でマニフェストから外したファイルの一覧（ファイル→外した時刻）
+RETIRED_FILE = SCRAPING_DIR / 'retired.json'
+
+# マニフェストから外したファイルを削除するまでの猶予（秒）
+# （古いマニフェストを読み込んだ読み込み側が、読み終えるまでファイルを残しておく）
+RETIRED_GRACE_SECONDS = 3600
+
 def ensure_data_dirs():
     """データディレクトリが存在することを確認"""
     try:
@@ -47,33 +86,154 @@ def ensure_data_dirs():
         else:
             return Path('.')
 
+class SegmentWriter:
+    """
+    日付ごとのJSON Linesセグメントにレビューを追記するライター
+    
+    1レビュー1行のコンパクトな形式で追記し、fsyncは一定件数ごとにまとめて行います。
+    日付が変わると新しいセグメントに切り替わります。
+    同じセグメントに複数のプロセスが追記するため、追記の間はファイルをロックし、
+    書き込み開始位置はロックを取得してから末尾の位置を取り直して決めます。
+    """
+    
+    def __init__(self, fsync_every=SEGMENT_FSYNC_EVERY):
+        self.fsync_every = fsync_every
+        self._file = None
+        self._path = None
+        self._unsynced = 0
+    
+    def _open_segment(self):
+        """今日のセグメントを開く（日付が変わっていれば切り替える）"""
+        today_dir = ensure_data_dirs()
+        path = today_dir / f"{SEGMENT_PREFIX}{today_dir.name.replace('-', '')}.jsonl"
+        
+        if self._path != path:
+            self.close()
+            self._file = open(path, 'ab')
+            self._path = path
+        return self._file
+    
+    def append(self, reviews):
+        """
+        レビューをセグメントに追記する
+        
+        Returns:
+            (セグメントのパス, 書き込み開始位置, 書き込んだバイト数)
+        """
+        f = self._open_segment()
+        data = b"".join(
+            json.dumps(review, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b"\n"
+            for review in reviews
+        )
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            # 他のプロセスが追記している場合があるため、開いたときの位置ではなく現在の末尾を使う
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+            f.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        
+        # fsyncは一定件数ごとにまとめて行う
+        self._unsynced += len(reviews)
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+        
+        return self._path, offset, len(data)
+    
+    def sync(self):
+        """未同期の書き込みをディスクに反映する"""
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+    
+    def close(self):
+        """現在のセグメントを同期して閉じる"""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+            self._path = None
+
+# アプリ全体で共有するセグメントライター
+_segment_writer = SegmentWriter()
+
+# レビューの保存時に呼び出すリスナー（集計結果の差分更新などに使用）
+_ingest_listeners = []
+
+def register_ingest_listener(listener):
+    """
+    レビューの保存時に呼び出すリスナーを登録する
+    
+    Args:
+        listener: 保存したレビューのリストを受け取る関数
+    """
+    if listener not in _ingest_listeners:
+        _ingest_listeners.append(listener)
+
+def _notify_ingest_listeners(records):
+    """登録済みのリスナーに保存したレビューを通知する"""
+    for listener in _ingest_listeners:
+        try:
+            listener(records)
+        except Exception as e:
+            print(f"保存通知の処理エラー ({getattr(listener, '__name__', listener)}): {e}")
+            print(traceback.format_exc())
+
+def close_segment_writer():
+    """共有セグメントライターを同期して閉じる"""
+    _segment_writer.close()
+
 def save_reviews_to_json(reviews, batch_name=None):
     """
-    スクレイピングしたレビューデータをJSONファイルとして保存
+    スクレイピングしたレビューデータを今日のJSON Linesセグメントに追記
     
     Args:
         reviews: 保存するレビューのリスト
-        batch_name: バッチ名（指定されていなければタイムスタンプを使用）
+        batch_name: バッチ名（マニフェストに記録される）
     
     Returns:
-        保存したファイルのパス
+        追記したセグメントのパス
     """
     try:
-        # データディレクトリの確保
-        today_dir = ensure_data_dirs()
+        if not reviews:
+            return None
         
-        # ファイル名の生成
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{batch_name}_{timestamp}.json" if batch_name else f"reviews_{timestamp}.json"
+        # 保存済みのレビュー（とバッチ内の重複）を書き込む前に除く
+        # （フィルタを初期化できなかった場合は除かずに追記し、重複は圧縮時に除く）
+        if not json_review_filter.seeded:
+            seed_json_review_filter()
+        new_reviews = {}
+        for review in reviews:
+            key = review_key(review)
+            if key in new_reviews:
+                continue
+            if json_review_filter.seeded and json_review_filter.might_contain(key):
+                continue
+            new_reviews[key] = review
+        if not new_reviews:
+            print(f"保存済みのレビューのみのため、セグメントへの追記を省略しました ({len(reviews)}件)")
+            return None
+        
+        # 取得時刻を記録（ソートや期間の集計に使用）
+        written_at = datetime.now().isoformat(timespec='seconds')
+        records = [dict(review, scraped_at=review.get('scraped_at') or written_at) for review in new_reviews.values()]
+        
+        # セグメントに追記
+        file_path, offset, nbytes = _segment_writer.append(records)
         
-        # ファイルパスの生成
-        file_path = today_dir / filename
+        # マニフェストに追記（読み込み側はこの範囲だけを参照する）
+        entry = _build_manifest_entry(file_path, records, written_at, offset=offset, nbytes=nbytes)
+        if batch_name:
+            entry["batch"] = batch_name
+        append_manifest_entry(entry)
+        json_review_filter.add_many(new_reviews)
         
-        # JSONに変換して保存
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(reviews, f, ensure_ascii=False, indent=2)
+        print(f"レビューデータをセグメントに保存しました: {file_path} ({len(records)}件、保存済み{len(reviews) - len(records)}件を除外)")
         
-        print(f"レビューデータをJSONに保存しました: {file_path}")
+        _notify_ingest_listeners(records)
         return file_path
     
     except Exception as e:
@@ -137,9 +297,264 @@ def commit_and_push_data():
         print(traceback.format_exc())
         return False
 
+def _build_manifest_entry(file_path, reviews, written_at=None, offset=None, nbytes=None):
+    """保存したファイル（またはセグメントへの追記分）のマニフェスト項目を作成する"""
+    written_at = written_at or datetime.now().isoformat(timespec='seconds')
+    
+    # レビューに時刻があればその範囲を、なければ書き込み時刻を期間とする
+    timestamps = [r.get('scraped_at') for r in reviews if isinstance(r, dict) and r.get('scraped_at')]
+    
+    entry = {
+        "file": Path(file_path).relative_to(SCRAPING_DIR).as_posix(),
+        "count": len(reviews),
+        "bytes": nbytes if nbytes is not None else Path(file_path).stat().st_size,
+        "first_at": min(timestamps) if timestamps else written_at,
+        "last_at": max(timestamps) if timestamps else written_at,
+        "written_at": written_at
+    }
+    if offset is not None:
+        entry["offset"] = offset
+    return entry
+
+def append_manifest_entry(entry):
+    """マニフェストに1件追記する"""
+    with _manifest_lock:
+        with open(MANIFEST_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def _list_review_files():
+    """日付ディレクトリ内のレビューファイル（JSON配列・JSON Linesセグメント）を列挙する"""
+    review_files = []
+    for date_dir in SCRAPING_DIR.glob('*'):
+        if date_dir.is_dir():
+            for review_file in date_dir.iterdir():
+                if not review_file.is_file() or 'state.json' in review_file.name:
+                    continue
+                if review_file.suffix in ('.json', '.jsonl'):
+                    review_files.append(review_file)
+    return review_files
+
+def _read_legacy_array(file_path):
+    """旧形式（整形済みJSON配列）のファイルを読み込む"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        file_reviews = json.load(f)
+    return file_reviews if isinstance(file_reviews, list) else []
+
+def _count_lines(file_path):
+    """セグメントのレコード数（行数）を数える"""
+    count = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+            count += block.count(b"\n")
+    return count
+
+def rebuild_manifest():
+    """
+    日付ディレクトリを走査してマニフェストを作り直す
+    マニフェストがまだない既存データの移行用で、通常の読み込みでは使用しません
+    
+    Returns:
+        マニフェスト項目のリスト（古い順）
+    """
+    # 日付ディレクトリごとに更新日時の古い順に並べる（マニフェストは追記順＝古い順）
+    # 圧縮でマニフェストから外したファイル（削除待ち）は含めない
+    retired = _load_retired_files()
+    review_files = sorted(
+        (p for p in _list_review_files() if p.relative_to(SCRAPING_DIR).as_posix() not in retired),
+        key=lambda x: (x.parent.name, x.stat().st_mtime)
+    )
+    
+    entries = []
+    for file_path in review_files:
+        try:
+            written_at = datetime.fromtimestamp(file_path.stat().st_mtime).isoformat(timespec='seconds')
+            if file_path.suffix == '.jsonl':
+                entry = _build_manifest_entry(file_path, [], written_at, offset=0)
+                entry["count"] = _count_lines(file_path)
+            else:
+                entry = _build_manifest_entry(file_path, _read_legacy_array(file_path), written_at)
+            entries.append(entry)
+        except Exception as e:
+            print(f"JSONファイルの読み込みエラー ({file_path}): {e}")
+    
+    write_manifest(entries)
+    
+    print(f"マニフェストを再構築しました: {len(entries)}ファイル")
+    return entries
+
+def write_manifest(entries):
+    """マニフェストを一時ファイルに書き出してから置き換える"""
+    tmp_path = MANIFEST_FILE.with_suffix('.jsonl.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, MANIFEST_FILE)
+    
+    _manifest_cache["offset"] = 0
+    _manifest_cache["entries"] = []
+
+def load_manifest():
+    """
+    マニフェストを読み込む（前回から追記された部分だけを読み足す）
+    
+    Returns:
+        マニフェスト項目のリスト（古い順）
+    """
+    if not MANIFEST_FILE.exists():
+        if not SCRAPING_DIR.exists():
+            return []
+        rebuild_manifest()
+    
+    stat = MANIFEST_FILE.stat()
+    if stat.st_size < _manifest_cache["offset"] or stat.st_ino != _manifest_cache.get("inode"):
+        # 作り直された場合は最初から読み直す
+        _manifest_cache["offset"] = 0
+        _manifest_cache["entries"] = []
+        _manifest_cache["inode"] = stat.st_ino
+    
+    if stat.st_size > _manifest_cache["offset"]:
+        with open(MANIFEST_FILE, 'rb') as f:
+            f.seek(_manifest_cache["offset"])
+            data = f.read()
+        
+        # 書き込み途中の最終行は次回に回す
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            if line.strip():
+                _manifest_cache["entries"].append(json.loads(line))
+        _manifest_cache["offset"] += len(complete)
+    
+    return _manifest_cache["entries"]
+
+def get_manifest_inode():
+    """最後に読み込んだマニフェストのiノード番号（作り直されると変わる）"""
+    return _manifest_cache.get("inode")
+
+def iter_entry_reviews(entries):
+    """
+    マニフェスト項目が指すレビューを古い順に1件ずつ返すジェネレーター
+
+    iter_recent_reviews の逆順と同じ順序で返すため、追記された項目だけを読んでも
+    全件を読み込んだ場合と同じ順序で集計できます。
+    """
+    for entry in entries:
+        file_path = SCRAPING_DIR / entry["file"]
+        try:
+            if file_path.suffix == '.jsonl':
+                with open(file_path, 'rb') as f:
+                    if "offset" in entry:
+                        f.seek(entry["offset"])
+                        data = f.read(entry["bytes"])
+                    else:
+                        data = f.read()
+                for line in data.splitlines():
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で中断された行は読み飛ばす
+                        continue
+            else:
+                yield from reversed(_read_legacy_array(file_path))
+        except FileNotFoundError:
+            print(f"JSONファイルが見つかりません ({file_path})")
+            continue
+        except Exception as e:
+            print(f"JSONファイルの読み込みエラー ({file_path}): {e}")
+            continue
+
+def count_stored_reviews():
+    """
+    保存されているレビューの総数をマニフェストから取得する
+    
+    Returns:
+        レビューの総数
+    """
+    try:
+        return sum(entry["count"] for entry in load_manifest())
+    except Exception as e:
+        print(f"レビュー数の集計エラー: {e}")
+        return 0
+
+def get_storage_version():
+    """
+    保存済みデータの版（レビュー数と最終書き込み時刻）をマニフェストから取得する
+    ETagなどの条件付きレスポンスの判定に使用します
+    
+    Returns:
+        (レビュー数, 最終書き込み時刻（UNIX時刻、データがない場合はNone）)
+    """
+    try:
+        entries = load_manifest()
+        if not entries:
+            return 0, None
+        
+        latest = max(entry["written_at"] for entry in entries)
+        return sum(entry["count"] for entry in entries), datetime.fromisoformat(latest).timestamp()
+    except Exception as e:
+        print(f"データ版の取得エラー: {e}")
+        return 0, None
+
+def _iter_lines_reversed(file_path, start=0, end=None):
+    """ファイルの指定範囲の行を末尾から順に返す（ブロック単位で後ろから読み込む）"""
+    with open(file_path, 'rb') as f:
+        if end is None:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+        
+        position = end
+        remainder = b""
+        while position > start:
+            read_size = min(READ_BLOCK_SIZE, position - start)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            
+            lines = block.split(b"\n")
+            # 先頭の行は前のブロックに続いている可能性があるので持ち越す
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        
+        if remainder.strip():
+            yield remainder
+
+def iter_recent_reviews():
+    """
+    保存済みのレビューを新しい順に1件ずつ返すジェネレーター
+    
+    JSON Linesセグメントは必要な範囲だけを後ろから読み、ファイル全体を読み込みません。
+    旧形式のJSON配列ファイルも読み込めます（ファイル内の順序はそのまま）。
+    """
+    for entry in reversed(load_manifest()):
+        file_path = SCRAPING_DIR / entry["file"]
+        try:
+            if file_path.suffix == '.jsonl':
+                start = entry.get("offset", 0)
+                end = start + entry["bytes"] if "offset" in entry else None
+                for line in _iter_lines_reversed(file_path, start, end):
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で中断された行は読み飛ばす
+                        continue
+            else:
+                yield from _read_legacy_array(file_path)
+        except FileNotFoundError:
+            print(f"JSONファイルが見つかりません ({file_path})")
+            continue
+        except Exception as e:
+            print(f"JSONファイルの読み込みエラー ({file_path}): {e}")
+            continue
+
 def load_recent_reviews(limit=100):
     """
     最近のレビューデータをJSONファイルから読み込む
+    マニフェストを新しい順にたどり、必要な件数に達した時点で読み込みを打ち切ります
     
     Args:
         limit: 返すレビューの最大数
@@ -153,47 +568,273 @@ def load_recent_reviews(limit=100):
             print(f"スクレイピングディレクトリが存在しません: {SCRAPING_DIR}")
             return []
         
-        # 全てのJSONファイルを探す
-        all_json_files = []
-        
-        # 日付ディレクトリ内のJSONファイルを検索
-        for date_dir in SCRAPING_DIR.glob('*'):
-            if date_dir.is_dir():
-                for json_file in date_dir.glob('*.json'):
-                    if json_file.is_file() and 'state.json' not in json_file.name:
-                        all_json_files.append(json_file)
+        reviews = list(islice(iter_recent_reviews(), limit))
         
         # ファイルが見つからない場合
-        if not all_json_files:
+        if not reviews and not load_manifest():
             print("レビューデータのJSONファイルが見つかりません")
-            return []
         
-        # 最新の更新日時でソート
-        all_json_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+        return reviews
         
-        # レビューデータを読み込む
-        reviews = []
+    except Exception as e:
+        print(f"レビューデータ読み込みエラー: {e}")
+        print(traceback.format_exc())
+        return []
+
+def review_key(review):
+    """
+    レビューの安定したキーを返す（重複除去用）
+    
+    実行ごとに変わるレビューIDではなく、サウナのURL・名前と空白を正規化した本文から算出します。
+    """
+    sauna_url = review.get('sauna_url') or review.get('url') or ''
+    sauna_name = review.get('sauna_name') or review.get('name') or ''
+    text = review.get('review_text') or review.get('review') or ''
+    source = f"{sauna_url}\n{sauna_name}\n{' '.join(text.split())}"
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def seed_json_review_filter():
+    """保存済みのレビューのキーで重複判定フィルタを初期化する"""
+    try:
+        return json_review_filter.seed(review_key(review) for review in iter_recent_reviews())
+    except Exception as e:
+        print(f"重複判定フィルタの初期化エラー (json): {e}")
+        print(traceback.format_exc())
+        return 0
+
+def _read_day_records(entries):
+    """1日分のマニフェスト項目が指すレビューを古い順に読み込む"""
+    records = []
+    for entry in entries:
+        file_path = SCRAPING_DIR / entry["file"]
+        written_at = entry.get("written_at", "")
         
-        for file_path in all_json_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    file_reviews = json.load(f)
-                    
-                if isinstance(file_reviews, list):
-                    reviews.extend(file_reviews)
-                    if len(reviews) >= limit:
-                        break
-            except Exception as e:
-                print(f"JSONファイルの読み込みエラー ({file_path}): {e}")
-                continue
+        if file_path.suffix == '.jsonl':
+            with open(file_path, 'rb') as f:
+                if "offset" in entry:
+                    f.seek(entry["offset"])
+                    data = f.read(entry["bytes"])
+                else:
+                    data = f.read()
+            file_reviews = []
+            for line in data.splitlines():
+                try:
+                    file_reviews.append(json.loads(line))
+                except ValueError:
+                    continue
+        else:
+            file_reviews = _read_legacy_array(file_path)
         
-        # 上限数に調整
-        return reviews[:limit]
+        for review in file_reviews:
+            if isinstance(review, dict):
+                # 時刻のない旧形式のレビューはファイルの書き込み時刻で並べる
+                records.append(dict(review, scraped_at=review.get('scraped_at') or written_at))
+    return records
+
+def _load_retired_files():
+    """マニフェストから外した削除待ちのファイルの一覧を読み込む"""
+    try:
+        with open(RETIRED_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _retire_files(file_paths):
+    """マニフェストから外したファイルを削除待ちの一覧に加える（_manifest_lock を保持して呼び出す）"""
+    retired = _load_retired_files()
+    now = datetime.now().timestamp()
+    for file_path in file_paths:
+        retired.setdefault(file_path.relative_to(SCRAPING_DIR).as_posix(), now)
+    write_json_atomic(RETIRED_FILE, retired)
+
+def purge_retired_files(grace_seconds=RETIRED_GRACE_SECONDS):
+    """
+    マニフェストから外してから猶予を過ぎたファイルを削除する
+    
+    Returns:
+        削除したファイル数
+    """
+    with _manifest_lock:
+        retired = _load_retired_files()
+        if not retired:
+            return 0
         
+        deadline = datetime.now().timestamp() - grace_seconds
+        listed = {entry["file"] for entry in load_manifest()}
+        removed = 0
+        for name, retired_at in list(retired.items()):
+            if retired_at > deadline:
+                continue
+            # 念のため、マニフェストに載っているファイルは削除しない
+            if name not in listed:
+                try:
+                    (SCRAPING_DIR / name).unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            del retired[name]
+        write_json_atomic(RETIRED_FILE, retired)
+    
+    if removed:
+        print(f"圧縮済みの古いレビューファイルを削除しました: {removed}ファイル")
+    return removed
+
+def compact_day(date_dir):
+    """
+    1日分のレビューファイルを、重複を除いて時刻順に並べた1つのセグメントにまとめる
+    
+    新しいセグメントを一時ファイルに書き出してfsyncした後に名前を変更し、マニフェストを
+    置き換えるため、読み込み側が途中の状態を見ることはありません。
+    古いファイルはすぐには削除せず、置き換え前のマニフェストを読み込んだ読み込み側が読み終えられるよう
+    RETIRED_GRACE_SECONDS が過ぎてから以降の圧縮時に削除します。
+    
+    Args:
+        date_dir: 日付ディレクトリ
+    
+    Returns:
+        圧縮前後のファイル数・バイト数・レコード数（圧縮不要の場合はNone）
+    """
+    day = date_dir.name
+    day_files = [p for p in date_dir.iterdir() if p.is_file() and p.suffix in ('.json', '.jsonl')]
+    if not day_files:
+        return None
+    
+    with _manifest_lock:
+        entries = [e for e in load_manifest() if e["file"].split('/')[0] == day]
+    
+    # マニフェストに載っていないファイル（削除待ちのものを含む）は読み込み対象外のため、そのまま残す
+    listed = {SCRAPING_DIR / e["file"] for e in entries}
+    old_files = [p for p in day_files if p in listed]
+    
+    # 既に圧縮済みの1ファイルだけの日は対象外
+    if not old_files or (len(old_files) == 1 and old_files[0].name.startswith(COMPACTED_PREFIX)):
+        return None
+    
+    report = {
+        "day": day,
+        "files_before": len(old_files),
+        "bytes_before": sum(p.stat().st_size for p in old_files),
+        "records_before": sum(e["count"] for e in entries)
+    }
+    
+    # 重複を除き（最初に取得したものを残す）、取得時刻順に並べる
+    seen = set()
+    records = []
+    for review in _read_day_records(entries):
+        key = review_key(review)
+        if key not in seen:
+            seen.add(key)
+            records.append(review)
+    records.sort(key=lambda r: r['scraped_at'])
+    
+    # 一時ファイルに書き出してから名前を変更する
+    new_path = date_dir / f"{COMPACTED_PREFIX}{day.replace('-', '')}_{datetime.now().strftime('%H%M%S%f')}.jsonl"
+    tmp_path = new_path.with_suffix('.jsonl.tmp')
+    with open(tmp_path, 'wb') as f:
+        for review in records:
+            f.write(json.dumps(review, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, new_path)
+    
+    new_entry = _build_manifest_entry(new_path, records, offset=0)
+    
+    # マニフェストを置き換える（その日の最初の項目の位置に新しいセグメントを入れる）
+    with _manifest_lock:
+        old_names = {p.relative_to(SCRAPING_DIR).as_posix() for p in old_files}
+        new_entries = []
+        for entry in load_manifest():
+            if entry["file"] in old_names:
+                if new_entry is not None:
+                    new_entries.append(new_entry)
+                    new_entry = None
+                continue
+            new_entries.append(entry)
+        write_manifest(new_entries)
+        
+        # 古いファイルは猶予を過ぎてから削除する
+        _retire_files(old_files)
+    
+    report.update({
+        "files_after": 1,
+        "bytes_after": new_path.stat().st_size,
+        "records_after": len(records)
+    })
+    return report
+
+def compact_storage(include_today=False):
+    """
+    日付ディレクトリごとにレビューファイルを圧縮する
+    
+    書き込み中のセグメントと競合しないよう、通常は前日までのディレクトリのみを対象とします。
+    
+    Args:
+        include_today: 今日のディレクトリも対象にするかどうか
+    
+    Returns:
+        全体と日ごとの圧縮前後のファイル数・バイト数
+    """
+    summary = {
+        "days": [],
+        "files_before": 0,
+        "files_after": 0,
+        "bytes_before": 0,
+        "bytes_after": 0,
+        "files_purged": 0
+    }
+    
+    if not SCRAPING_DIR.exists():
+        return summary
+    
+    # 前回までの圧縮でマニフェストから外し、猶予を過ぎたファイルを削除する
+    try:
+        summary["files_purged"] = purge_retired_files()
     except Exception as e:
-        print(f"レビューデータ読み込みエラー: {e}")
+        print(f"古いレビューファイルの削除エラー: {e}")
         print(traceback.format_exc())
-        return []
+    
+    today = datetime.now().strftime('%Y-%m-%d')
+    if include_today:
+        # 今日のセグメントを閉じてから圧縮する
+        close_segment_writer()
+    
+    for date_dir in sorted(p for p in SCRAPING_DIR.iterdir() if p.is_dir()):
+        if date_dir.name >= today and not include_today:
+            continue
+        try:
+            report = compact_day(date_dir)
+        except Exception as e:
+            print(f"レビューファイルの圧縮エラー ({date_dir}): {e}")
+            print(traceback.format_exc())
+            continue
+        
+        if report is None:
+            continue
+        
+        summary["days"].append(report)
+        for key in ("files_before", "files_after", "bytes_before", "bytes_after"):
+            summary[key] += report[key]
+        print(f"レビューファイルを圧縮しました: {report['day']} "
+              f"{report['files_before']}ファイル/{report['bytes_before']}バイト → "
+              f"{report['files_after']}ファイル/{report['bytes_after']}バイト "
+              f"({report['records_before']}件 → {report['records_after']}件)")
+    
+    return summary
+
+def write_json_atomic(path, data):
+    """
+    JSONを一時ファイルに書き出してから置き換える
+    
+    書き込み途中で中断しても、読み込み側は置き換え前か後のどちらかの完全な内容を読み込みます。
+    一時ファイル名にプロセスIDを含めるため、複数のプロセスが同時に書き込んでも互いの一時ファイルを壊しません。
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
 def get_scraping_state():
     """
@@ -254,8 +895,7 @@ def save_scraping_state(state):
             # Render環境では代替のパスを使用
             if IS_RENDER:
                 alt_path = Path('/opt/render/project/src/scraping_state.json')
-                with open(alt_path, 'w', encoding='utf-8') as f:
-                    json.dump(state, f, ensure_ascii=False, indent=2)
+                write_json_atomic(alt_path, state)
                 print(f"代替パスに状態を保存: {alt_path}")
                 return True
             return False
@@ -263,9 +903,8 @@ def save_scraping_state(state):
         # 状態ファイルのパス
         state_file = DATA_DIR / 'scraping_state.json'
         
-        # JSONとして保存
-        with open(state_file, 'w', encoding='utf-8') as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+        # JSONとして保存（一時ファイルに書き出してから置き換える）
+        write_json_atomic(state_file, state)
         
         print(f"スクレイピング状態を保存しました: {state_file}")
         return True
@@ -278,8 +917,7 @@ def save_scraping_state(state):
         if IS_RENDER:
             try:
                 alt_path = Path('/opt/render/project/src/scraping_state.json')
-                with open(alt_path, 'w', encoding='utf-8') as f:
-                    json.dump(state, f, ensure_ascii=False, indent=2)
+                write_json_atomic(alt_path, state)
                 print(f"代替パスに状態を保存: {alt_path}")
                 return True
             except Exception as alt_error:
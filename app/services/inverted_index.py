@@ -0,0 +1,445 @@
+"""
+保存済みレビューの文字bigram転置索引モジュール
+データベースを使わない環境（JSONファイルのみ）でも、全件を走査せずにキーワード検索できるようにします
+
+索引は次のファイルで構成され、ポスティングリストはメモリマップで読み込みます。
+    index.json           : 世代・文書数・bigram→ポスティングの位置
+    postings.<世代>.bin  : 全bigramのポスティングリスト（文書番号の昇順、uint32）を連結したもの
+    offsets.<世代>.bin   : 文書番号→docs.jsonl内の位置（uint64）
+    docs.jsonl           : 索引に登録したレビュー（1行1件、追記のみ）
+"""
+
+import json
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+from app.services.bigram import normalize_text, split_runs, run_bigrams, iter_bigrams
+from app.services.github_storage import DATA_DIR, iter_recent_reviews, count_stored_reviews, register_ingest_listener
+
+# 索引ファイルを保存するディレクトリ
+INDEX_DIR = DATA_DIR / 'bigram_index'
+
+# ディスクに書き出すまでに追加できる文書数
+INDEX_SAVE_EVERY = 500
+
+def _contains(parts, doc_id):
+    """昇順のポスティングリスト（永続化済み部分と追加分）に文書番号が含まれるか"""
+    for posting in parts:
+        i = bisect_left(posting, doc_id)
+        if i < len(posting) and posting[i] == doc_id:
+            return True
+    return False
+
+class BigramIndex:
+    """
+    文字bigram→文書番号のポスティングリストによる転置索引
+
+    文書番号は保存順（古い順）に振るため、ポスティングリストは常に昇順です。
+    ディスクに書き出した部分はメモリマップで参照し、その後の追加分はメモリ上の array('I') に保持します。
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self.doc_count = 0
+        self.review_total = 0
+        self.generation = 0
+
+        # 永続化済みの部分（bigram→(開始位置, 件数)、メモリマップ）
+        self._terms = {}
+        self._mmap = None
+        self._postings = memoryview(array('I'))
+        self._offsets = array('Q')
+        self._saved_docs = 0
+
+        # 永続化前の追加分
+        self._delta = {}
+        self._docs_file = None
+        self._docs_bytes = 0
+
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    # ---- 読み込み・書き出し ----
+
+    def _path(self, name):
+        return self.index_dir / name
+
+    def _close_files(self):
+        """メモリマップと文書ファイルを閉じる"""
+        self._postings = memoryview(array('I'))
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._docs_file is not None:
+            self._docs_file.close()
+            self._docs_file = None
+
+    def _open_docs_file(self):
+        """文書ファイルを開き、最後に書き出した位置より後の書きかけの部分を切り捨てる"""
+        self._docs_file = open(self._path('docs.jsonl'), 'a+b')
+        self._docs_file.truncate(self._docs_bytes)
+        self._docs_file.seek(self._docs_bytes)
+
+    def _load(self):
+        """ディスクから索引を読み込む"""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            meta_path = self._path('index.json')
+            if meta_path.exists():
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+
+                generation = meta["generation"]
+                with open(self._path(f'postings.{generation}.bin'), 'rb') as f:
+                    if os.fstat(f.fileno()).st_size > 0:
+                        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        self._postings = memoryview(self._mmap).cast('I')
+
+                offsets = array('Q')
+                with open(self._path(f'offsets.{generation}.bin'), 'rb') as f:
+                    offsets.frombytes(f.read())
+
+                self._terms = {term: tuple(span) for term, span in meta["terms"].items()}
+                self._offsets = offsets
+                self.generation = generation
+                self.doc_count = self._saved_docs = meta["doc_count"]
+                self.review_total = meta["review_total"]
+                self._docs_bytes = meta["docs_bytes"]
+        except Exception as e:
+            print(f"転置索引の読み込みエラー: {e}")
+            self._reset()
+
+        self._open_docs_file()
+
+    def _reset(self):
+        """索引を空にする"""
+        self._close_files()
+        self._terms = {}
+        self._offsets = array('Q')
+        self._delta = {}
+        self.doc_count = self._saved_docs = 0
+        self.review_total = 0
+        self._docs_bytes = 0
+
+    def _save(self):
+        """
+        永続化済みの部分と追加分をまとめて新しい世代のファイルに書き出す
+
+        ファイルを書き終えてから index.json を置き換えるため、途中で中断しても前の世代が残ります。
+        """
+        self._docs_file.flush()
+        os.fsync(self._docs_file.fileno())
+
+        generation = self.generation + 1
+        terms = {}
+        position = 0
+        postings_path = self._path(f'postings.{generation}.bin')
+        with open(postings_path, 'wb') as f:
+            for term in set(self._terms) | set(self._delta):
+                start, count = self._terms.get(term, (0, 0))
+                saved = self._postings[start:start + count]
+                added = self._delta.get(term, ())
+                f.write(saved.tobytes())
+                if added:
+                    f.write(added.tobytes())
+                terms[term] = (position, count + len(added))
+                position += count + len(added)
+                # メモリマップを閉じられるよう参照を残さない
+                saved.release()
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(self._path(f'offsets.{generation}.bin'), 'wb') as f:
+            f.write(self._offsets.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        meta = {
+            "generation": generation,
+            "doc_count": self.doc_count,
+            "review_total": self.review_total,
+            "docs_bytes": self._docs_bytes,
+            "terms": terms
+        }
+        tmp_path = self._path('index.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path('index.json'))
+
+        # 新しい世代をメモリマップで開き直し、古い世代のファイルを削除する
+        previous = self.generation
+        self._postings = memoryview(array('I'))
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        with open(postings_path, 'rb') as f:
+            if position > 0:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._postings = memoryview(self._mmap).cast('I')
+
+        self._terms = terms
+        self._delta = {}
+        self._saved_docs = self.doc_count
+        self.generation = generation
+
+        for name in (f'postings.{previous}.bin', f'offsets.{previous}.bin'):
+            try:
+                self._path(name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _rebuild(self):
+        """保存済みのレビュー全件から索引を作り直す"""
+        total = count_stored_reviews()
+
+        self._reset()
+        for name in os.listdir(self.index_dir):
+            if name.startswith(('postings.', 'offsets.')):
+                self._path(name).unlink()
+        self._open_docs_file()
+
+        reviews = list(iter_recent_reviews())
+        reviews.reverse()
+        self._add(reviews)
+        self.review_total = total
+        self._save()
+        print(f"転置索引を再構築しました: {self.doc_count}件 (bigram {len(self._terms)}種類)")
+
+    def _ensure_loaded(self):
+        """初回アクセス時に索引を読み込み、保存済みのレビュー数と合わない場合は作り直す"""
+        if not self._loaded:
+            self._load()
+            self._loaded = True
+
+        if self.review_total != count_stored_reviews():
+            self._rebuild()
+
+    # ---- 登録 ----
+
+    def _add(self, reviews):
+        """レビューを文書として追加する"""
+        for review in reviews:
+            doc_id = self.doc_count
+            line = json.dumps(review, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b"\n"
+            self._docs_file.write(line)
+            self._offsets.append(self._docs_bytes)
+            self._docs_bytes += len(line)
+            self.doc_count += 1
+
+            for term in set(iter_bigrams(review.get("review", ""))):
+                posting = self._delta.get(term)
+                if posting is None:
+                    posting = self._delta[term] = array('I')
+                posting.append(doc_id)
+
+    def add_reviews(self, reviews):
+        """保存したレビューを索引に追加する（保存時のリスナー）"""
+        with self._lock:
+            if not self._loaded:
+                # 未読み込みの場合は、次回の読み込み時に件数の差から作り直される
+                return
+            self._add(reviews)
+            self.review_total += len(reviews)
+            if self.doc_count - self._saved_docs >= INDEX_SAVE_EVERY:
+                self._save()
+
+    def close(self):
+        """未保存の追加分を書き出して索引を閉じる"""
+        with self._lock:
+            if not self._loaded:
+                return
+            if self.doc_count > self._saved_docs:
+                self._save()
+            self._close_files()
+            self._loaded = False
+
+    # ---- 検索 ----
+
+    def _posting_parts(self, term):
+        """bigramのポスティングリスト（永続化済み部分と追加分）"""
+        parts = []
+        span = self._terms.get(term)
+        if span is not None:
+            parts.append(self._postings[span[0]:span[0] + span[1]])
+        added = self._delta.get(term)
+        if added:
+            parts.append(added)
+        return parts
+
+    def _read_doc(self, doc_id):
+        """文書番号のレビューを読み込む（追記モードのため、読み込み位置は書き込みに影響しない）"""
+        start = self._offsets[doc_id]
+        end = self._offsets[doc_id + 1] if doc_id + 1 < self.doc_count else self._docs_bytes
+        self._docs_file.flush()
+        self._docs_file.seek(start)
+        return json.loads(self._docs_file.read(end - start))
+
+    def _candidates(self, runs):
+        """すべての語のbigramを含む文書番号を新しい順に返す"""
+        terms = {term for run in runs for term in run_bigrams(run)}
+        postings = []
+        for term in terms:
+            parts = self._posting_parts(term)
+            if not parts:
+                return
+            postings.append((sum(len(part) for part in parts), parts))
+
+        # 最も短いポスティングリストを基準に、他のリストに含まれるかを二分探索で確認する
+        postings.sort(key=lambda item: item[0])
+        shortest = [doc_id for part in postings[0][1] for doc_id in part]
+        for doc_id in reversed(shortest):
+            if all(_contains(parts, doc_id) for _, parts in postings[1:]):
+                yield doc_id
+
+    def _matching_docs(self, runs):
+        """すべての語を含む可能性のある文書番号を新しい順に返す（1文字の語を含む場合は全文書）"""
+        if any(len(run) < 2 for run in runs):
+            return range(self.doc_count - 1, -1, -1)
+        return self._candidates(runs)
+
+    def search(self, query, limit=50, offset=0):
+        """
+        キーワードを含むレビューを新しい順に検索する
+
+        bigramのポスティングリストを交差させて候補を絞り、本文に語が連続して含まれるかを確認します。
+        1文字の語はbigramで表せないため、全文書を新しい順に確認します。
+
+        Args:
+            query: 検索語（空白区切りで複数指定するとすべてを含むレビュー）
+            limit: 返す結果の最大数
+            offset: 読み飛ばす件数
+
+        Returns:
+            マッチしたレビューのリスト
+        """
+        runs = split_runs(query)
+        if not runs:
+            return []
+
+        with self._lock:
+            self._ensure_loaded()
+
+            matched = []
+            for doc_id in self._matching_docs(runs):
+                review = self._read_doc(doc_id)
+                review_text = normalize_text(review.get("review", ""))
+                if not all(run in review_text for run in runs):
+                    continue
+                if offset > 0:
+                    offset -= 1
+                    continue
+                matched.append(review)
+                if len(matched) >= limit:
+                    break
+            return matched
+
+    def search_any(self, keywords, limit=50, offset=0):
+        """
+        いずれかのキーワードを含むレビューを新しい順に検索する（穴場キーワードでの絞り込み用）
+
+        キーワードごとの候補（ポスティングリストの交差）の和集合だけを確認し、
+        本文に含まれていたキーワードを matched_keywords として付けて返します。
+
+        Args:
+            keywords: キーワードのリスト
+            limit: 返す結果の最大数
+            offset: 読み飛ばす件数
+
+        Returns:
+            マッチしたレビューのリスト
+        """
+        queries = [(keyword, split_runs(keyword)) for keyword in keywords]
+        queries = [(keyword, runs) for keyword, runs in queries if runs]
+        if not queries:
+            return []
+
+        with self._lock:
+            self._ensure_loaded()
+
+            candidates = set()
+            for _, runs in queries:
+                candidates.update(self._matching_docs(runs))
+
+            matched = []
+            for doc_id in sorted(candidates, reverse=True):
+                review = self._read_doc(doc_id)
+                review_text = normalize_text(review.get("review", ""))
+                found = [keyword for keyword, runs in queries if all(run in review_text for run in runs)]
+                if not found:
+                    continue
+                if offset > 0:
+                    offset -= 1
+                    continue
+                matched.append(dict(review, matched_keywords=found))
+                if len(matched) >= limit:
+                    break
+            return matched
+
+    def verify(self, queries):
+        """
+        索引による検索結果を保存済みのレビュー全件の走査と比較する
+
+        Args:
+            queries: 確認する検索語のリスト（いずれかを含む検索もあわせて確認）
+
+        Returns:
+            一致したかどうかと、検索語ごとの件数
+        """
+        reviews = list(iter_recent_reviews())
+        texts = [normalize_text(review.get("review", "")) for review in reviews]
+
+        def fingerprint(found):
+            return sorted(json.dumps(review, ensure_ascii=False, sort_keys=True) for review in found)
+
+        checks = []
+        for query in queries:
+            runs = split_runs(query)
+            expected = [review for review, text in zip(reviews, texts) if runs and all(run in text for run in runs)]
+            actual = self.search(query, limit=len(reviews) + 1)
+            checks.append({
+                "query": query,
+                "expected": len(expected),
+                "actual": len(actual),
+                "consistent": fingerprint(expected) == fingerprint(actual)
+            })
+
+        keyword_runs = [split_runs(query) for query in queries]
+        expected = [
+            review for review, text in zip(reviews, texts)
+            if any(runs and all(run in text for run in runs) for runs in keyword_runs)
+        ]
+        actual = [
+            {key: value for key, value in review.items() if key != "matched_keywords"}
+            for review in self.search_any(queries, limit=len(reviews) + 1)
+        ]
+        checks.append({
+            "query": " OR ".join(queries),
+            "expected": len(expected),
+            "actual": len(actual),
+            "consistent": fingerprint(expected) == fingerprint(actual)
+        })
+
+        return {
+            "consistent": all(check["consistent"] for check in checks),
+            "doc_count": self.doc_count,
+            "review_total": self.review_total,
+            "generation": self.generation,
+            "checks": checks
+        }
+
+# アプリ全体で共有する転置索引
+_bigram_index = BigramIndex()
+register_ingest_listener(_bigram_index.add_reviews)
+
+def get_bigram_index():
+    """共有の転置索引を取得する"""
+    return _bigram_index
+
+def close_bigram_index():
+    """共有の転置索引を書き出して閉じる"""
+    _bigram_index.close()
@@ -0,0 +1,153 @@
+"""
+バックグラウンドジョブの登録・状態管理モジュール
+リクエストの処理とは別のタスクでジョブを実行し、ジョブIDで進捗と結果を参照できるようにします
+ジョブの状態はデータベースに記録するため、どのワーカープロセスからも参照できます
+"""
+
+import asyncio
+import traceback
+import uuid
+from datetime import datetime
+
+from app.config import JOB_HISTORY_SIZE
+from app.models.database import init_db, save_job, get_job, list_jobs, trim_jobs
+from app.services.lease import PROCESS_ID
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+class JobRegistry:
+    """
+    実行中・実行済みのジョブの一覧
+
+    ジョブは登録したプロセスで実行し、状態の変化をデータベースの jobs テーブルに記録します。
+    同じ名前のジョブがこのプロセスで実行中の場合は新たに実行せず、実行中のジョブを返します
+    （プロセスをまたいだ同時実行はジョブ側のリースで防ぎます）。
+    実行済みのジョブは新しいものから history_size 件まで保持します。
+    """
+
+    def __init__(self, history_size=JOB_HISTORY_SIZE):
+        self.history_size = history_size
+        self._jobs = {}
+        self._tasks = {}
+
+    async def _record(self, job):
+        """ジョブの状態をデータベースに記録する（記録に失敗してもジョブは続ける）"""
+        try:
+            await save_job(job)
+        except Exception as e:
+            print(f"ジョブの状態の記録エラー ({job['name']}): {str(e)}")
+            print(traceback.format_exc())
+
+    async def submit(self, name, func, *args, **kwargs):
+        """
+        ジョブを登録してバックグラウンドで実行する
+
+        Args:
+            name: ジョブ名（同じ名前のジョブは同時に1つだけ実行）
+            func: 実行するコルーチン関数
+            *args, **kwargs: func に渡す引数
+
+        Returns:
+            ジョブの情報（job_id・status など）と、新たに実行したかどうか
+        """
+        # 同時に呼ばれても1つだけ実行するよう、最初の await より前に名前を予約する
+        # （_jobs には終了していないジョブだけが残る）
+        for job in self._jobs.values():
+            if job["name"] == name:
+                return dict(job), False
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "name": name,
+            "status": "queued",
+            "owner": PROCESS_ID,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None
+        }
+        self._jobs[job_id] = job
+        try:
+            await init_db()
+            # 他のワーカーへの問い合わせでも見つかるよう、実行前に記録する
+            await self._record(job)
+        except BaseException:
+            self._jobs.pop(job_id, None)
+            raise
+        self._tasks[job_id] = asyncio.create_task(self._run(job, func, args, kwargs))
+
+        try:
+            await trim_jobs(self.history_size)
+        except Exception as e:
+            print(f"ジョブの履歴の削除エラー: {str(e)}")
+        return dict(job), True
+
+    async def _run(self, job, func, args, kwargs):
+        job["status"] = "running"
+        job["started_at"] = _now()
+        try:
+            await self._record(job)
+            job["result"] = await func(*args, **kwargs)
+            job["status"] = "succeeded"
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            raise
+        except Exception as e:
+            print(f"ジョブの実行エラー ({job['name']}): {str(e)}")
+            print(traceback.format_exc())
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = _now()
+            # キャンセル中でも記録できるよう、記録のタスクはキャンセルから切り離す
+            await asyncio.shield(self._record(job))
+            self._tasks.pop(job["job_id"], None)
+            self._jobs.pop(job["job_id"], None)
+
+    async def get(self, job_id):
+        """ジョブの情報を取得する（見つからない場合はNone）"""
+        try:
+            await init_db()
+            job = await get_job(job_id)
+        except Exception as e:
+            print(f"ジョブの状態の取得エラー: {str(e)}")
+            job = None
+        if job is None and job_id in self._jobs:
+            # 記録に失敗した場合もこのプロセスで実行中のジョブは返す
+            job = dict(self._jobs[job_id])
+        return job
+
+    async def list(self):
+        """ジョブの一覧を新しい順に取得する"""
+        await init_db()
+        return await list_jobs(self.history_size)
+
+    async def wait(self, job_id):
+        """このプロセスで実行中のジョブの終了を待ち、ジョブの情報を返す"""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+        return await self.get(job_id)
+
+    async def shutdown(self):
+        """実行中のジョブをキャンセルして終了を待つ"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        # 開始前にキャンセルされたジョブは _run が実行されないため、ここでキャンセル済みとして記録する
+        for job_id in list(self._jobs):
+            job = self._jobs.pop(job_id)
+            self._tasks.pop(job_id, None)
+            if job["finished_at"] is None:
+                job["status"] = "cancelled"
+                job["finished_at"] = _now()
+                await self._record(job)
+
+# アプリ全体で共有するジョブの一覧
+job_registry = JobRegistry()
@@ -0,0 +1,102 @@
+"""
+Aho-Corasick法による複数キーワードの一括検出モジュール
+キーワード辞書ごとにオートマトンを1度だけ構築し、テキストを1回走査するだけで全キーワードを検出します
+"""
+
+from collections import deque
+
+class KeywordMatcher:
+    """複数キーワードをテキストの1回の走査で検出するオートマトン"""
+
+    def __init__(self, keywords):
+        """
+        Args:
+            keywords: キーワードのリスト、または キーワード→重み の辞書
+        """
+        if isinstance(keywords, dict):
+            self.weights = dict(keywords)
+        else:
+            self.weights = {keyword: 1 for keyword in keywords}
+
+        # 状態遷移表・失敗遷移・各状態で検出されるキーワード
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        for keyword in self.weights:
+            if keyword:
+                self._add_keyword(keyword)
+        self._build_failure_links()
+
+    def _add_keyword(self, keyword):
+        """キーワードをトライ木に追加する"""
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] = self._output[state] + (keyword,)
+
+    def _build_failure_links(self):
+        """幅優先探索で失敗遷移を構築し、出力を失敗先の出力と統合する"""
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """テキスト中のキーワードの出現を順に返す（重複した出現もすべて返す）"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield from output[state]
+
+    def find(self, text) -> set:
+        """テキストに含まれるキーワードの集合を返す"""
+        return set(self.iter_matches(text))
+
+    def contains_any(self, text) -> bool:
+        """いずれかのキーワードを含むかどうか（最初の検出で走査を打ち切る）"""
+        for _ in self.iter_matches(text):
+            return True
+        return False
+
+    def score(self, text) -> int:
+        """テキストに含まれるキーワードの重みの合計を返す（同じキーワードは1回のみ加算）"""
+        return sum(self.weights[keyword] for keyword in self.find(text))
+
+# キーワード辞書ごとに構築済みのオートマトンを保持
+_matcher_cache = {}
+
+def get_matcher(keywords) -> KeywordMatcher:
+    """キーワード辞書に対応する構築済みのオートマトンを取得する（初回のみ構築）"""
+    if isinstance(keywords, dict):
+        cache_key = tuple(keywords.items())
+    else:
+        cache_key = tuple(keywords)
+
+    matcher = _matcher_cache.get(cache_key)
+    if matcher is None:
+        matcher = KeywordMatcher(keywords)
+        _matcher_cache[cache_key] = matcher
+    return matcher
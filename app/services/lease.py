@@ -0,0 +1,77 @@
+"""
+ジョブの実行権（リース）モジュール
+SQLiteのリースで、複数のワーカープロセスが同時に起動しても同じジョブを1つだけ実行します
+"""
+
+import asyncio
+import os
+import socket
+import traceback
+import uuid
+
+from app.models.database import init_db, acquire_lease, renew_lease, release_lease
+
+# このプロセスの識別子（ホスト名・プロセスID・起動ごとの乱数）
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class JobLease:
+    """
+    期限付きのジョブの実行権
+
+    保持している間は有効期間の1/3ごとに期限を延長します。プロセスが異常終了して延長が止まると
+    期限切れになり、次に取得しようとしたプロセスが自動的に回収します。
+    延長に失敗した（他のプロセスに回収された）場合は、リースを取得したタスクをキャンセルします。
+
+    使用例:
+        async with JobLease("scraping", 300) as lease:
+            if not lease.acquired:
+                return  # 他のプロセスが実行中
+            ...
+    """
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{PROCESS_ID}:{uuid.uuid4().hex[:8]}"
+        self.acquired = False
+        self.lost = False
+        self._heartbeat = None
+        self._holder = None
+
+    async def _keep_alive(self):
+        """期限が切れる前にリースを延長し続ける"""
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                renewed = await renew_lease(self.name, self.owner, self.ttl)
+            except Exception as e:
+                # 一時的なエラーは次の延長で再試行する（期限までに延長できなければ回収される）
+                print(f"リースの延長エラー ({self.name}): {str(e)}")
+                continue
+            if not renewed:
+                print(f"リースが他のプロセスに回収されたため、ジョブを中断します ({self.name})")
+                self.lost = True
+                self._holder.cancel()
+                return
+
+    async def __aenter__(self):
+        await init_db()
+        self.acquired = await acquire_lease(self.name, self.owner, self.ttl)
+        if self.acquired:
+            self._holder = asyncio.current_task()
+            self._heartbeat = asyncio.create_task(self._keep_alive())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self.acquired:
+            return False
+        self._heartbeat.cancel()
+        await asyncio.gather(self._heartbeat, return_exceptions=True)
+        try:
+            await release_lease(self.name, self.owner)
+        except Exception as e:
+            # 解放できなくても期限切れで回収される
+            print(f"リースの解放エラー ({self.name}): {str(e)}")
+            print(traceback.format_exc())
+        self.acquired = False
+        return False
@@ -0,0 +1,180 @@
+"""
+スクレイパーが取得したページをディスクにキャッシュするモジュール
+本文をzlibで圧縮して保存し、ETag / Last-Modified による条件付きリクエストで再利用します
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+from app.config import PAGE_CACHE_MAX_BYTES
+
+# 環境変数
+IS_RENDER = os.environ.get('RENDER', 'False') == 'True'
+
+# データディレクトリの設定
+if IS_RENDER:
+    DATA_DIR = Path('/opt/render/project/src/data')
+else:
+    DATA_DIR = Path('data')
+
+# キャッシュの保存先
+PAGE_CACHE_DIR = DATA_DIR / 'page_cache'
+
+class PageCache:
+    """
+    URLごとのページ本文と検証用ヘッダー（ETag / Last-Modified）を保持するディスクキャッシュ
+    
+    圧縮後の合計サイズが上限を超えると、最も長く使われていないページから削除します。
+    """
+    
+    def __init__(self, cache_dir=PAGE_CACHE_DIR, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._loaded = False
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+    
+    def _body_path(self, key):
+        return self.cache_dir / f"{key}.z"
+    
+    def _ensure_loaded(self):
+        """初回アクセス時に索引を読み込む"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            index_path = self.cache_dir / 'index.json'
+            if index_path.exists():
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    for key, entry in json.load(f):
+                        self._entries[key] = entry
+                self.total_bytes = sum(entry["size"] for entry in self._entries.values())
+        except Exception as e:
+            print(f"ページキャッシュの索引の読み込みエラー: {e}")
+            self._entries.clear()
+            self.total_bytes = 0
+    
+    def _save_index(self):
+        """索引（最も長く使われていない順）を一時ファイルに書き出してから置き換える"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_dir / 'index.json.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(self._entries.items()), f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_dir / 'index.json')
+        except Exception as e:
+            print(f"ページキャッシュの索引の保存エラー: {e}")
+    
+    def _remove(self, key):
+        """ページをキャッシュから削除する"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry["size"]
+        try:
+            self._body_path(key).unlink()
+        except FileNotFoundError:
+            pass
+    
+    def lookup(self, url):
+        """
+        キャッシュされたページの情報を返す（なければNone）
+        
+        Returns:
+            ETag・Last-Modified・最後に取得または検証した時刻（UNIX時刻）を含む辞書
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(self._key(url))
+            return dict(entry) if entry is not None else None
+    
+    def read(self, url):
+        """キャッシュされた本文を読み込む（ファイルがなくなっていればキャッシュから削除してNone）"""
+        key = self._key(url)
+        with self._lock:
+            self._ensure_loaded()
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        
+        try:
+            with open(self._body_path(key), 'rb') as f:
+                return zlib.decompress(f.read()).decode('utf-8')
+        except (OSError, zlib.error) as e:
+            print(f"ページキャッシュの読み込みエラー ({url}): {e}")
+            with self._lock:
+                self._remove(key)
+            return None
+    
+    def touch(self, url):
+        """304で本文が変わっていないことを確認したページの検証時刻を更新する"""
+        with self._lock:
+            entry = self._entries.get(self._key(url))
+            if entry is not None:
+                entry["validated_at"] = time.time()
+    
+    def store(self, url, body, etag=None, last_modified=None):
+        """本文を圧縮して保存し、上限を超えた分を古いものから削除する"""
+        key = self._key(url)
+        data = zlib.compress(body.encode('utf-8'), 6)
+        
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._body_path(key).with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._body_path(key))
+        except OSError as e:
+            print(f"ページキャッシュの保存エラー ({url}): {e}")
+            return
+        
+        with self._lock:
+            self._ensure_loaded()
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous["size"]
+            
+            self._entries[key] = {
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "validated_at": time.time(),
+                "size": len(data)
+            }
+            self.total_bytes += len(data)
+            
+            # 合計サイズが上限を超えた場合は最も長く使われていないページから削除
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+            
+            self._save_index()
+    
+    def close(self):
+        """使用順を反映した索引を書き出す"""
+        with self._lock:
+            if self._loaded:
+                self._save_index()
+
+# スクレイパーで共有するページキャッシュ
+page_cache = PageCache()
+
+def close_page_cache():
+    """共有ページキャッシュの索引を書き出す"""
+    try:
+        page_cache.close()
+    except Exception as e:
+        print(f"ページキャッシュの終了処理エラー: {e}")
+        print(traceback.format_exc())
@@ -0,0 +1,346 @@
+"""
+スクレイピング結果を1ページずつ保存するパイプラインモジュール
+取得→解析→採点→重複除去→保存の各段を上限付きのキューでつなぎ、ページごとにコミットして再開位置を記録します
+"""
+
+import asyncio
+import inspect
+import traceback
+from collections import deque
+
+from app.config import (
+    POSTS_SEARCH_URL, SCRAPING_CONCURRENCY, SCRAPING_RATE_PER_SEC, SCRAPING_BURST,
+    INCREMENTAL_MAX_PAGES, HIGH_WATER_MARK_SIZE, BACKFILL_PAGES_PER_RUN, BACKFILL_MAX_PAGE,
+    PIPELINE_QUEUE_SIZE
+)
+from app.services.executor import run_cpu_bound
+from app.services.scraper import TokenBucket, HIDDEN_GEM_MATCHER, parse_review_list, crawl_key
+from app.models.database import init_db
+from app.database import save_reviews_bulk
+
+# キューの終端を表す目印
+_END = object()
+
+async def _iter_queue(queue):
+    """キューから終端の目印まで順に取り出す"""
+    while True:
+        item = await queue.get()
+        if item is _END:
+            return
+        yield item
+
+class ScrapePipeline:
+    """
+    レビュー一覧のページを取得→解析→採点→重複除去→保存の順に流すパイプライン
+
+    各段は非同期ジェネレーターで、段と段の間は上限付きの asyncio.Queue でつなぎます。
+    保存が追いつかない場合はキューが埋まって前段が待機するため、保持するページ数は一定に保たれます。
+    レビューはページごとにコミットし、そのたびに on_checkpoint に再開位置を渡します。
+    """
+
+    def __init__(self, scraper, base_url, pages, known_keys=None, concurrency=1,
+                 queue_size=PIPELINE_QUEUE_SIZE, max_ahead=None, on_checkpoint=None):
+        """
+        Args:
+            scraper: ページの取得に使う SaunaScraper
+            base_url: レビュー一覧のURL
+            pages: 取得するページ番号（昇順）
+            known_keys: 取得済みのレビューのキー（高水位標、到達した時点で打ち切る）
+            concurrency: 同時に取得するページ数
+            queue_size: 各段の間のキューに保持するページ数
+            max_ahead: 重複除去を終えたページより先に取得してよいページ数（Noneはキューの上限のみ）
+            on_checkpoint: ページをコミットするたびに呼び出す関数またはコルーチン関数（再開位置などの辞書を受け取る）
+        """
+        self.scraper = scraper
+        self.base_url = base_url
+        self.pages = list(pages)
+        self.known_keys = set(known_keys or [])
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.on_checkpoint = on_checkpoint
+        self._ahead = asyncio.Semaphore(max_ahead + 1) if max_ahead is not None else None
+
+        self.result = {
+            "pages": 0,
+            "reviews": 0,
+            "saved": 0,
+            "next_page": self.pages[0] if self.pages else 1,
+            "failed_page": None,
+            "reached_end": False,
+            "reached_known": False,
+            "newest_keys": [],
+            "errors": []
+        }
+
+    # ---- 各段 ----
+
+    def _allow_next_page(self):
+        """重複除去を終えたページの分だけ、先のページの取得を許可する"""
+        if self._ahead is not None:
+            self._ahead.release()
+
+    async def _fetch(self):
+        """ページを番号順に取得する（最大concurrencyページを並行して取得）"""
+        limiter = TokenBucket(SCRAPING_RATE_PER_SEC, SCRAPING_BURST)
+        in_flight = deque()
+
+        async def fetch_page(page):
+            self.result["pages"] += 1
+            try:
+                return await self.scraper.fetch_list_page(self.base_url, page, limiter)
+            except Exception as e:
+                print(f"エラー: ページ {page} の取得に失敗: {str(e)}")
+                return None
+
+        try:
+            for page in self.pages:
+                if self._ahead is not None:
+                    await self._ahead.acquire()
+                in_flight.append((page, asyncio.create_task(fetch_page(page))))
+                if len(in_flight) >= self.concurrency:
+                    page, task = in_flight.popleft()
+                    yield {"page": page, "html": await task}
+            while in_flight:
+                page, task = in_flight.popleft()
+                yield {"page": page, "html": await task}
+        finally:
+            # 打ち切られた場合は取得中のページをキャンセル
+            for _, task in in_flight:
+                task.cancel()
+
+    async def _parse(self, items):
+        """HTMLをレビューのリストに変換する（エグゼキューターで実行）"""
+        async for item in items:
+            if item["html"] is None:
+                yield dict(item, failed=True)
+                continue
+
+            card_count, reviews = await run_cpu_bound(parse_review_list, item["html"], self.scraper.hidden_gem_keywords)
+            if card_count == 0:
+                # 最終ページを過ぎたのでそれ以降は流さない
+                print(f"ページ {item['page']}: レビューカードが見つかりませんでした。以降のページは取得しません")
+                yield {"page": item["page"], "end": True}
+                return
+
+            yield {"page": item["page"], "reviews": reviews}
+
+    async def _score(self, items):
+        """レビューごとに穴場キーワードの重みの合計を付ける（保存時に reviews.hidden_gem_score に記録）"""
+        async for item in items:
+            for review in item.get("reviews", ()):
+                review["hidden_gem_score"] = HIDDEN_GEM_MATCHER.score(review["review_text"])
+            yield item
+
+    async def _dedup(self, items):
+        """今回の実行で既に流したレビューを除き、取得済みのレビューに到達したら打ち切る"""
+        seen = set()
+        async for item in items:
+            if "reviews" not in item:
+                self._allow_next_page()
+                yield item
+                continue
+
+            reviews = []
+            reached_known = False
+            for review in item["reviews"]:
+                key = crawl_key(review)
+                if item["page"] == self.pages[0] and len(self.result["newest_keys"]) < HIGH_WATER_MARK_SIZE:
+                    self.result["newest_keys"].append(key)
+                if key in self.known_keys:
+                    reached_known = True
+                    break
+                if review["review_id"] not in seen:
+                    seen.add(review["review_id"])
+                    reviews.append(review)
+
+            if reached_known:
+                yield dict(item, reviews=reviews, reached_known=True)
+                return
+            self._allow_next_page()
+            yield dict(item, reviews=reviews, reached_known=False)
+
+    async def _write(self, items):
+        """ページごとにレビューをコミットし、再開位置を記録する"""
+        async for item in items:
+            page = item["page"]
+
+            if item.get("failed"):
+                # 失敗したページから次回取得し直す（後続のページの保存は続ける）
+                if self.result["failed_page"] is None:
+                    self.result["failed_page"] = page
+                    self.result["next_page"] = page
+                continue
+
+            if item.get("end"):
+                self.result["reached_end"] = True
+                if self.result["failed_page"] is None:
+                    self.result["next_page"] = page
+                break
+
+            reviews = item["reviews"]
+            counts = await save_reviews_bulk(reviews) if reviews else {"inserted": 0}
+            self.result["reviews"] += len(reviews)
+            self.result["saved"] += counts["inserted"]
+            if self.result["failed_page"] is None:
+                self.result["next_page"] = page + 1
+
+            if self.on_checkpoint is not None:
+                checkpoint = self.on_checkpoint(dict(self.result, page=page))
+                if inspect.isawaitable(checkpoint):
+                    await checkpoint
+
+            if item.get("reached_known"):
+                self.result["reached_known"] = True
+                break
+
+    # ---- 実行 ----
+
+    async def _pump(self, stage, queue):
+        """段の出力を次のキューに流し、終了時（エラー時も含む）に終端の目印を入れる"""
+        try:
+            async for item in stage:
+                await queue.put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"パイプラインの処理エラー: {str(e)}")
+            print(traceback.format_exc())
+            self.result["errors"].append(str(e))
+        finally:
+            await stage.aclose()
+        await queue.put(_END)
+
+    async def run(self):
+        """
+        パイプラインを実行する
+
+        Returns:
+            pages: リクエストしたページ数
+            reviews: 保存対象にしたレビュー数
+            saved: 新たに保存したレビュー数
+            next_page: 次回取得を始めるページ（取得に失敗したページがあればそのページ）
+            failed_page: 最初に取得に失敗したページ
+            reached_end: レビューカードのないページ（最終ページの次）に到達したかどうか
+            reached_known: 取得済みのレビューに到達したかどうか
+            newest_keys: 先頭ページの先頭から HIGH_WATER_MARK_SIZE 件のキー（次回の高水位標）
+            errors: 各段で発生したエラー
+        """
+        if not self.pages:
+            return self.result
+
+        await init_db()
+
+        fetched = asyncio.Queue(self.queue_size)
+        parsed = asyncio.Queue(self.queue_size)
+        scored = asyncio.Queue(self.queue_size)
+        deduped = asyncio.Queue(self.queue_size)
+
+        tasks = [
+            asyncio.create_task(self._pump(self._fetch(), fetched)),
+            asyncio.create_task(self._pump(self._parse(_iter_queue(fetched)), parsed)),
+            asyncio.create_task(self._pump(self._score(_iter_queue(parsed)), scored)),
+            asyncio.create_task(self._pump(self._dedup(_iter_queue(scored)), deduped)),
+        ]
+        try:
+            await self._write(_iter_queue(deduped))
+        finally:
+            # 保存を打ち切った場合は前段を止める
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        return self.result
+
+async def run_incremental(scraper, base_url=POSTS_SEARCH_URL, known_keys=None, max_pages=INCREMENTAL_MAX_PAGES, on_checkpoint=None):
+    """
+    1ページ目から取得済みのレビューに到達するまでをパイプラインで保存する
+
+    既読のレビューがない場合（初回）は1ページ目のみ取得します。
+    どのページを取得したかは既読の判定で決まるため、ページは1つずつ取得します。
+    """
+    pages = range(1, (max_pages if known_keys else 1) + 1)
+    pipeline = ScrapePipeline(scraper, base_url, pages, known_keys=known_keys, max_ahead=0, on_checkpoint=on_checkpoint)
+    result = await pipeline.run()
+
+    if result["failed_page"] is not None or result["errors"]:
+        print(f"増分クロール: ページ {result['failed_page']} 以降を保存できなかったため、次回は1ページ目から取り直します")
+    elif known_keys and not result["reached_known"] and not result["reached_end"]:
+        print(f"増分クロール: {result['pages']}ページ以内に既読のレビューが見つかりませんでした（取り漏れはバックフィルで補完）")
+    return result
+
+def next_high_water_mark(result, previous_mark):
+    """
+    増分クロールの結果から次回の高水位標を決める
+
+    途中のページの取得・保存に失敗した場合は前回の高水位標を残し、次回は1ページ目から取り直します。
+    上限のページ数までに前回の位置に届かなかった場合は高水位標を進め、残りのページを取り漏れとして取り直します。
+    新着のキーの後ろには前回の高水位標を続けるため、新着が少なくても高水位標は HIGH_WATER_MARK_SIZE 件を保ち、
+    先頭の投稿が削除・編集されても残りのキーで前回の位置を判定できます。
+
+    Args:
+        result: run_incremental の結果
+        previous_mark: 前回の高水位標
+
+    Returns:
+        (次回の高水位標, バックフィルで取り直す最初のページ（不要な場合はNone）)
+    """
+    if not result["newest_keys"] or result["failed_page"] is not None or result["errors"]:
+        return previous_mark, None
+    newest_keys = result["newest_keys"]
+    mark = (newest_keys + [key for key in previous_mark if key not in newest_keys])[:HIGH_WATER_MARK_SIZE]
+    if result["reached_known"] or result["reached_end"] or not previous_mark:
+        return mark, None
+    return mark, result["next_page"]
+
+async def run_backfill(scraper, base_url=POSTS_SEARCH_URL, start_page=1, max_pages=BACKFILL_PAGES_PER_RUN, on_checkpoint=None,
+                       known_keys=None):
+    """
+    過去のレビューを指定ページから最大max_pagesページ分さかのぼってパイプラインで保存する
+
+    ページをコミットするたびに on_checkpoint に再開位置（next_page）を渡すため、
+    途中で中断しても次回は保存済みのページの次から再開できます。
+    known_keys を指定した場合は、そのキーのレビューに到達した時点で完了とします。
+    """
+    end_page = min(start_page + max_pages - 1, BACKFILL_MAX_PAGE)
+    pipeline = ScrapePipeline(scraper, base_url, range(start_page, end_page + 1), known_keys=known_keys,
+                              concurrency=SCRAPING_CONCURRENCY, on_checkpoint=on_checkpoint)
+    result = await pipeline.run()
+    if start_page > end_page:
+        result["next_page"] = start_page
+    result["done"] = result["reached_end"] or result["reached_known"] or result["next_page"] > BACKFILL_MAX_PAGE
+    return result
+
+async def run_gap_fill(scraper, base_url=POSTS_SEARCH_URL, gaps=None, max_pages=BACKFILL_PAGES_PER_RUN, on_checkpoint=None):
+    """
+    増分クロールで取り漏れた範囲を、範囲ごとにその時点の高水位標に届くまで取得する
+
+    gaps は {"page": 再開するページ, "until": 範囲の終わりの高水位標} のリストで、古い範囲から順に処理します。
+    取得し終えた範囲は取り除き、途中の範囲は page を進めるため、バックフィルの位置は変わりません。
+    ページをコミットするたびに on_checkpoint を呼び出します。
+
+    Returns:
+        pages: リクエストしたページ数
+        saved: 新たに保存したレビュー数
+    """
+    total = {"pages": 0, "saved": 0}
+    while gaps and total["pages"] < max_pages:
+        gap = gaps[0]
+
+        async def checkpoint(progress):
+            gap["page"] = progress["next_page"]
+            if on_checkpoint is not None:
+                result = on_checkpoint(progress)
+                if inspect.isawaitable(result):
+                    await result
+
+        result = await run_backfill(scraper, base_url, gap["page"], max_pages - total["pages"],
+                                    on_checkpoint=checkpoint, known_keys=gap["until"])
+        total["pages"] += result["pages"]
+        total["saved"] += result["saved"]
+        if not result["done"]:
+            # 取得に失敗したページ、または今回の上限のページから次回再開する
+            gap["page"] = result["next_page"]
+            break
+        print(f"取り漏れの範囲を取得し終えました（ページ {result['next_page'] - 1} まで）")
+        gaps.pop(0)
+    return total
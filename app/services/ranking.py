@@ -1,11 +1,21 @@
 """
 JSONファイルからレビューデータを読み込み、サウナランキングを生成するモジュール
-GitHub上のJSONファイルを元にランキングを生成します
+サウナごとの集計結果をディスクに保持し、レビューの保存時に差分だけを更新します
 """
 
-import re
-from collections import defaultdict
-from app.services.github_storage import load_recent_reviews
+import asyncio
+import heapq
+import json
+import threading
+from app.config import STORAGE_BACKEND
+from app.services.github_storage import (
+    DATA_DIR, load_manifest, get_manifest_inode, iter_entry_reviews, count_stored_reviews,
+    register_ingest_listener, write_json_atomic
+)
+from app.services.keyword_matcher import KeywordMatcher
+from app.services.bigram import split_runs
+from app.services.inverted_index import get_bigram_index
+from app.models.database import search_reviews_fts
 
 # 穴場キーワードのリスト
 HIDDEN_GEM_KEYWORDS = {
@@ -22,6 +32,245 @@ HIDDEN_GEM_KEYWORDS = {
     "非公開": 2
 }
 
+# 穴場キーワード検出用のオートマトン（1度だけ構築）
+HIDDEN_GEM_MATCHER = KeywordMatcher(HIDDEN_GEM_KEYWORDS)
+
+# サウナごとの集計結果を保存するファイル
+RANKING_STORE_FILE = DATA_DIR / 'ranking_store.json'
+
+# サウナごとに保持するレビュー本文の数
+MAX_SAMPLE_REVIEWS = 5
+
+def ranking_score(data):
+    """ランキングのスコア（レビュー数とキーワードスコアの組み合わせ）"""
+    return data["review_count"] * 2 + data["keyword_score"] * 3
+
+def aggregate_reviews(reviews, sauna_data=None):
+    """
+    レビューをサウナごとの集計結果に加算する
+    
+    Args:
+        reviews: 古い順に並んだレビューのイテラブル
+        sauna_data: 加算先の集計結果（省略時は新規に作成）
+    
+    Returns:
+        サウナ名→集計結果（review_count・keyword_score・keywords・最新のレビュー本文）の辞書
+    """
+    if sauna_data is None:
+        sauna_data = {}
+    
+    for review in reviews:
+        sauna_name = review.get("name", "")
+        if not sauna_name:
+            continue
+        
+        data = sauna_data.get(sauna_name)
+        if data is None:
+            data = sauna_data[sauna_name] = {
+                "name": sauna_name,
+                "url": "",
+                "review_count": 0,
+                "keyword_score": 0,
+                "reviews": [],
+                "keywords": set()
+            }
+        
+        # サウナデータの更新（URLは最新のレビューのものを使う）
+        data["url"] = review.get("url", "") or data["url"]
+        data["review_count"] += 1
+        
+        # レビューテキストの取得
+        review_text = review.get("review", "")
+        if not review_text:
+            continue
+        
+        # 最新のレビューを先頭に保存（最大5件まで）
+        data["reviews"].insert(0, review_text)
+        del data["reviews"][MAX_SAMPLE_REVIEWS:]
+        
+        # キーワードの検索（レビューを1回だけ走査）
+        for keyword in HIDDEN_GEM_MATCHER.find(review_text):
+            data["keywords"].add(keyword)
+            data["keyword_score"] += HIDDEN_GEM_KEYWORDS[keyword]
+    
+    return sauna_data
+
+def _load_all_reviews_oldest_first():
+    """保存済みのレビューをすべて古い順に読み込む"""
+    return iter_entry_reviews(list(load_manifest()))
+
+class RankingStore:
+    """
+    サウナごとの集計結果を保持するランキングテーブル
+    
+    集計済みのマニフェストの項目数を記録し、マニフェストに追記された項目（他のプロセスの保存分を含む）の
+    レビューだけを加算します。ランキングの取得は上位K件の選択だけで済ませます。
+    圧縮でマニフェストが作り直された場合だけ全件から集計し直します。
+    集計結果はディスクに保存され、再起動時に読み込まれます。
+    ファイルの読み込みを伴うため、非同期処理からは asyncio.to_thread で呼び出します。
+    """
+    
+    def __init__(self, path=RANKING_STORE_FILE):
+        self.path = path
+        self.sauna_data = {}
+        self.review_total = 0
+        self.generation = 0
+        self.manifest_inode = None
+        self.manifest_entries = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+    
+    def _ensure_loaded(self):
+        """初回アクセス時に集計結果を読み込み、マニフェストに追記された分を反映する"""
+        if not self._loaded:
+            self._load()
+            self._loaded = True
+        self._sync()
+    
+    def _sync(self, allow_rebuild=True):
+        """
+        マニフェストに追記された項目のレビューだけを集計結果に加算する
+        
+        Args:
+            allow_rebuild: マニフェストが作り直されていた場合に全件から集計し直すかどうか
+        """
+        entries = load_manifest()
+        inode = get_manifest_inode()
+        if inode != self.manifest_inode or len(entries) < self.manifest_entries:
+            # 圧縮（重複除去）でマニフェストが作り直された場合は差分では追えないため集計し直す
+            if allow_rebuild:
+                self._rebuild(entries, inode)
+            return
+        
+        if len(entries) == self.manifest_entries:
+            return
+        new_entries = entries[self.manifest_entries:]
+        aggregate_reviews(iter_entry_reviews(new_entries), self.sauna_data)
+        self.review_total += sum(entry["count"] for entry in new_entries)
+        self.manifest_entries += len(new_entries)
+        self.generation += 1
+        self._save()
+    
+    def _load(self):
+        """ディスクから集計結果を読み込む"""
+        try:
+            if not self.path.exists():
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            self.sauna_data = {
+                name: dict(data, keywords=set(data["keywords"]))
+                for name, data in stored["saunas"].items()
+            }
+            self.review_total = stored["review_total"]
+            self.generation = stored.get("generation", 0)
+            self.manifest_inode = stored.get("manifest_inode")
+            self.manifest_entries = stored.get("manifest_entries", 0)
+        except Exception as e:
+            print(f"ランキング集計結果の読み込みエラー: {e}")
+            self.sauna_data = {}
+            self.review_total = 0
+            self.manifest_inode = None
+            self.manifest_entries = 0
+    
+    def _save(self):
+        """集計結果を一時ファイルに書き出してから置き換える（一時ファイルはプロセスごと）"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            stored = {
+                "review_total": self.review_total,
+                "generation": self.generation,
+                "manifest_inode": self.manifest_inode,
+                "manifest_entries": self.manifest_entries,
+                "saunas": {
+                    name: dict(data, keywords=sorted(data["keywords"]))
+                    for name, data in self.sauna_data.items()
+                }
+            }
+            write_json_atomic(self.path, stored)
+        except Exception as e:
+            print(f"ランキング集計結果の保存エラー: {e}")
+    
+    def _rebuild(self, entries, inode):
+        """マニフェストの全項目のレビューから集計し直す"""
+        entries = list(entries)
+        self.sauna_data = aggregate_reviews(iter_entry_reviews(entries))
+        self.review_total = sum(entry["count"] for entry in entries)
+        self.manifest_inode = inode
+        self.manifest_entries = len(entries)
+        self.generation += 1
+        self._save()
+        print(f"ランキング集計結果を再構築しました: {len(self.sauna_data)}施設 ({self.review_total}件)")
+    
+    def apply(self, reviews):
+        """
+        保存したレビューを集計結果に反映する（保存時のリスナー）
+        
+        保存した項目はマニフェストに追記済みのため、追記分だけを読み込んで加算します。
+        保存処理を止めないよう、全件の再集計が必要な場合は次回のランキングの取得時に行います。
+        """
+        with self._lock:
+            if not self._loaded:
+                # 未読み込みの場合は、次回の読み込み時にまとめて反映される
+                return
+            self._sync(allow_rebuild=False)
+    
+    def top_k(self, limit=20, min_reviews=1):
+        """
+        スコアの高い順に上位のサウナを返す
+        
+        Args:
+            limit: 返すランキングの最大数
+            min_reviews: ランキングに含めるための最小レビュー数
+        
+        Returns:
+            ランキングのリスト
+        """
+        with self._lock:
+            self._ensure_loaded()
+            candidates = (data for data in self.sauna_data.values() if data["review_count"] >= min_reviews)
+            top = heapq.nlargest(limit, candidates, key=ranking_score)
+            
+            # 呼び出し側で変更されても集計結果に影響しないようにコピーを返す
+            return [
+                dict(data, reviews=list(data["reviews"]), keywords=list(data["keywords"]), keyword_count=len(data["keywords"]))
+                for data in top
+            ]
+    
+    def verify(self):
+        """
+        差分更新した集計結果を全件からの再集計と比較する
+        
+        Returns:
+            一致したかどうかと、一致しなかったサウナの一覧
+        """
+        with self._lock:
+            self._ensure_loaded()
+            expected = aggregate_reviews(_load_all_reviews_oldest_first())
+            
+            mismatches = []
+            for name in sorted(set(expected) | set(self.sauna_data)):
+                actual_data = self.sauna_data.get(name)
+                expected_data = expected.get(name)
+                if actual_data != expected_data:
+                    mismatches.append({"name": name, "stored": actual_data is not None, "expected": expected_data is not None})
+            
+            return {
+                "consistent": not mismatches,
+                "saunas": len(expected),
+                "review_total": self.review_total,
+                "generation": self.generation,
+                "mismatches": mismatches[:20]
+            }
+
+# アプリ全体で共有するランキングテーブル
+_ranking_store = RankingStore()
+register_ingest_listener(_ranking_store.apply)
+
+def get_ranking_store():
+    """共有のランキングテーブルを取得する"""
+    return _ranking_store
+
 async def generate_sauna_ranking(limit=20, min_reviews=1):
     """
     レビューデータからサウナのランキングを生成
@@ -34,69 +283,8 @@ async def generate_sauna_ranking(limit=20, min_reviews=1):
         ランキングのリスト
     """
     try:
-        # 最近のレビューを読み込む（上限1000件）
-        reviews = load_recent_reviews(limit=1000)
-        if not reviews:
-            return []
-        
-        # サウナごとの集計データ
-        sauna_data = defaultdict(lambda: {
-            "name": "",
-            "url": "",
-            "review_count": 0,
-            "keyword_count": 0,
-            "keyword_score": 0,
-            "reviews": [],
-            "keywords": set()
-        })
-        
-        # レビューデータの集計
-        for review in reviews:
-            sauna_name = review.get("name", "")
-            if not sauna_name:
-                continue
-                
-            # サウナデータの更新
-            sauna_data[sauna_name]["name"] = sauna_name
-            sauna_data[sauna_name]["url"] = review.get("url", "")
-            sauna_data[sauna_name]["review_count"] += 1
-            
-            # レビューテキストの取得
-            review_text = review.get("review", "")
-            if not review_text:
-                continue
-                
-            # レビューを保存（最大5件まで）
-            if len(sauna_data[sauna_name]["reviews"]) < 5:
-                sauna_data[sauna_name]["reviews"].append(review_text)
-            
-            # キーワードの検索
-            for keyword, score in HIDDEN_GEM_KEYWORDS.items():
-                if keyword in review_text:
-                    sauna_data[sauna_name]["keywords"].add(keyword)
-                    sauna_data[sauna_name]["keyword_score"] += score
-        
-        # ランキングの作成
-        ranking = []
-        for name, data in sauna_data.items():
-            # 最小レビュー数を下回る場合はスキップ
-            if data["review_count"] < min_reviews:
-                continue
-                
-            # キーワード数を設定
-            data["keyword_count"] = len(data["keywords"])
-            
-            # キーワードをリストに変換
-            data["keywords"] = list(data["keywords"])
-            
-            # ランキングに追加
-            ranking.append(data)
-        
-        # スコアでソート（レビュー数とキーワードスコアの組み合わせ）
-        ranking.sort(key=lambda x: (x["review_count"] * 2 + x["keyword_score"] * 3), reverse=True)
-        
-        # 上位のみ返す
-        return ranking[:limit]
+        # 集計済みのテーブルから上位のみ取得（追記分の読み込みはスレッドで実行）
+        return await asyncio.to_thread(_ranking_store.top_k, limit, min_reviews)
         
     except Exception as e:
         import traceback
@@ -104,6 +292,19 @@ async def generate_sauna_ranking(limit=20, min_reviews=1):
         print(traceback.format_exc())
         return []
 
+async def verify_sauna_ranking():
+    """
+    集計済みのランキングテーブルが全件からの再集計と一致するか確認
+    
+    Returns:
+        確認結果
+    """
+    try:
+        return await asyncio.to_thread(_ranking_store.verify)
+    except Exception as e:
+        print(f"ランキングの整合性確認中にエラー: {e}")
+        return {"consistent": False, "error": str(e)}
+
 async def get_review_count():
     """
     保存されているレビューの総数を取得
@@ -112,45 +313,112 @@ async def get_review_count():
         レビューの総数
     """
     try:
-        reviews = load_recent_reviews(limit=10000)  # 大きな数値を指定して全数をカウント
-        return len(reviews)
+        # マニフェストの件数を合計するだけで、レビュー本体は読み込まない
+        return count_stored_reviews()
     except Exception as e:
         print(f"レビュー数取得中にエラー: {e}")
         return 0
 
-async def search_reviews(keyword, limit=50):
+async def search_reviews(keyword, limit=50, offset=0):
     """
     キーワードでレビューを検索
     
+    データベースの全文検索の索引（bigram）を使い、関連度の高い順に返します。
+    JSONファイルのみで運用している場合（STORAGE_BACKEND が "json"）やデータベースを利用できない場合は、
+    JSONデータのbigram転置索引で新しい順に検索します。
+    
     Args:
-        keyword: 検索キーワード
+        keyword: 検索キーワード（空白区切りで複数指定するとすべてを含むレビュー）
         limit: 返す結果の最大数
+        offset: 読み飛ばす件数
         
     Returns:
         マッチしたレビューのリスト
     """
     try:
         # キーワードが空の場合は空のリストを返す
-        if not keyword:
+        if not split_runs(keyword):
             return []
-            
-        # 検索用の正規表現を作成
-        pattern = re.compile(keyword, re.IGNORECASE)
-        
-        # レビューを読み込む
-        all_reviews = load_recent_reviews(limit=1000)
-        
-        # キーワードでフィルタリング
-        matched_reviews = []
-        for review in all_reviews:
-            review_text = review.get("review", "")
-            if pattern.search(review_text):
-                matched_reviews.append(review)
-                if len(matched_reviews) >= limit:
-                    break
-                    
-        return matched_reviews
+        
+        found = await search_reviews_page(keyword, limit=limit, offset=offset)
+        return [
+            {
+                "name": result["sauna_name"],
+                "url": result["sauna_url"] or "",
+                "review": result["review_text"],
+                "review_id": result["review_id"],
+                "score": result["score"]
+            }
+            for result in found["results"]
+        ]
         
     except Exception as e:
         print(f"レビュー検索中にエラー: {e}")
-        return [] 
\ No newline at end of file
+        return []
+
+def _to_search_result(review):
+    """JSONデータのレビューを全文検索の検索結果と同じ形式にする"""
+    return {
+        "review_id": review.get("review_id"),
+        "sauna_name": review.get("name", ""),
+        "sauna_url": review.get("url") or "",
+        "review_text": review.get("review", ""),
+        "created_at": review.get("scraped_at"),
+        "score": 0
+    }
+
+async def search_reviews_page(query, limit=20, offset=0):
+    """
+    レビューを検索する（ページ分割、結果は search_reviews_fts と同じ形式）
+    
+    JSONファイルのみで運用している場合はbigram転置索引で新しい順に検索します。
+    それ以外はデータベースの全文検索を使い、失敗した場合は転置索引で検索します。
+    
+    Returns:
+        総件数・並び順と検索結果（転置索引の場合、次のページがあれば total は下限値）
+    """
+    if STORAGE_BACKEND != "json":
+        try:
+            return await search_reviews_fts(query, limit=limit, offset=offset)
+        except Exception as e:
+            print(f"全文検索に失敗したため、JSONデータの転置索引で検索します: {e}")
+    
+    # ポスティングリストの交差で候補を絞るため、全件を走査しない（次のページの有無を知るため1件多く取得）
+    found = await asyncio.to_thread(get_bigram_index().search, query, limit + 1, offset)
+    has_more = len(found) > limit
+    return {
+        "total": offset + len(found),
+        "total_exact": not has_more,
+        "order": "newest",
+        "results": [_to_search_result(review) for review in found[:limit]]
+    }
+
+async def find_hidden_gem_reviews(limit=20, offset=0):
+    """
+    穴場キーワードを含む保存済みのレビューを新しい順に取得する
+    
+    bigram転置索引でキーワードごとの候補を絞るため、全件の本文を走査しません。
+    
+    Returns:
+        レビューのリスト（含まれていたキーワード matched_keywords とその重みの合計 hidden_gem_score 付き）
+    """
+    found = await asyncio.to_thread(get_bigram_index().search_any, list(HIDDEN_GEM_KEYWORDS), limit, offset)
+    for review in found:
+        review["hidden_gem_score"] = sum(HIDDEN_GEM_KEYWORDS[keyword] for keyword in review["matched_keywords"])
+    return found
+
+async def verify_search_index(queries=None):
+    """
+    転置索引による検索結果が全件の走査と一致するか確認
+    
+    Args:
+        queries: 確認する検索語のリスト（省略時は穴場キーワード）
+    
+    Returns:
+        確認結果
+    """
+    try:
+        return await asyncio.to_thread(get_bigram_index().verify, queries or list(HIDDEN_GEM_KEYWORDS))
+    except Exception as e:
+        print(f"転置索引の整合性確認中にエラー: {e}")
+        return {"consistent": False, "error": str(e)}
@@ -1,17 +1,379 @@
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import re
 from pathlib import Path
-from app.config import TEST_HTML_PATHS, HIDDEN_GEM_KEYWORDS
+from app.config import (
+    TEST_HTML_PATHS, HIDDEN_GEM_KEYWORDS,
+    HTTP_POOL_LIMIT, HTTP_LIMIT_PER_HOST, HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT, HTTP_REQUEST_TIMEOUT,
+    SCRAPING_CONCURRENCY, SCRAPING_RATE_PER_SEC, SCRAPING_BURST,
+    ANALYZE_FRESHNESS_SECONDS, SITE_URL
+)
 import aiohttp
 import asyncio
 import traceback
 import time
-import uuid
 import json
+import os
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from app.services.executor import run_cpu_bound
+from app.services.keyword_matcher import KeywordMatcher, get_matcher
+from app.services.page_cache import page_cache
+from app.services.cache import analysis_cache
+from app.services.github_storage import review_key
 
 # ログ抑制フラグ
 VERBOSE_LOGGING = False
 
+# HTMLパーサーの選択（環境変数で指定がなければ、lxmlがあれば優先して使用）
+def _detect_html_parser():
+    """利用可能なHTMLパーサーのうち最速のものを返す"""
+    parser = os.environ.get('HTML_PARSER')
+    if parser:
+        return parser
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+HTML_PARSER = _detect_html_parser()
+
+def _class_strainer(*class_names) -> SoupStrainer:
+    """指定したクラスのいずれかを持つ要素の部分木だけを構築するストレーナーを作る"""
+    targets = set(class_names)
+
+    def match(name, attrs):
+        # 解析中のclass属性は空白区切りの文字列のまま渡されるため分割して比較する
+        classes = attrs.get('class') or ''
+        if isinstance(classes, str):
+            classes = classes.split()
+        return not targets.isdisjoint(classes)
+
+    return SoupStrainer(match)
+
+# ページ種別ごとに必要な部分木だけを構築するためのストレーナー
+LIST_PAGE_STRAINER = _class_strainer('p-post-list__item')
+DETAIL_PAGE_STRAINER = _class_strainer('p-saunaDetailHeader_title', 'p-postCard_body')
+DETAIL_REVIEW_STRAINER = _class_strainer('p-saunaDetail__title', 'p-saunaDetail__reviewContent')
+
+def parse_html(html: str, parse_only=None) -> BeautifulSoup:
+    """選択済みのパーサーでHTMLを解析する（parse_onlyで対象の部分木を限定できる）"""
+    return BeautifulSoup(html, HTML_PARSER, parse_only=parse_only)
+
+# 混雑していないことを示すキーワード
+CROWD_KEYWORDS = ['空いている', '空いてる', '空き', '並ばず', '待たず', 'すいてる', 'すいている']
+
+# キーワード検出用のオートマトン（モジュール読み込み時に1度だけ構築）
+HIDDEN_GEM_MATCHER = KeywordMatcher(HIDDEN_GEM_KEYWORDS)
+CROWD_MATCHER = KeywordMatcher(CROWD_KEYWORDS)
+
+def evaluate_hidden_gem_score(review_texts: list) -> tuple:
+    """レビューテキストから穴場度を判定する"""
+    score = 0
+    max_score = 5
+    reasons = []
+    
+    # レビューの数をチェック（少ないほど穴場度が高い）
+    review_count = len(review_texts)
+    if review_count < 10:
+        score += 1
+        reasons.append(f"レビュー数が少ない（{review_count}件）")
+    elif review_count < 20:
+        score += 0.5
+        reasons.append(f"比較的レビュー数が少ない（{review_count}件）")
+    else:
+        reasons.append(f"レビュー数が多い（{review_count}件）")
+        
+    # キーワードの出現頻度をチェック（各レビューを1回だけ走査）
+    keyword_counts = {}
+    for text in review_texts:
+        for keyword in HIDDEN_GEM_MATCHER.find(text):
+            keyword_counts[keyword] = keyword_counts.get(keyword, 0) + 1
+    
+    keyword_matches = {}
+    for keyword in HIDDEN_GEM_KEYWORDS:
+        count = keyword_counts.get(keyword, 0)
+        if count > 0:
+            keyword_percentage = (count / review_count) * 100
+            keyword_matches[keyword] = keyword_percentage
+    
+    # 「穴場」という単語が直接使われている場合、大きくスコアアップ
+    if '穴場' in keyword_matches and keyword_matches['穴場'] > 10:
+        score += 2
+        reasons.append(f"「穴場」という表現が複数のレビューで使用されている ({keyword_matches['穴場']:.1f}%)")
+    elif '穴場' in keyword_matches:
+        score += 1
+        reasons.append(f"「穴場」という表現が使用されている ({keyword_matches['穴場']:.1f}%)")
+        
+    # その他のキーワードでスコアアップ（最大1.5点）
+    keyword_score = 0
+    for keyword, percentage in keyword_matches.items():
+        if keyword != '穴場' and percentage > 5:
+            if keyword_score < 1.5:
+                keyword_score += 0.5
+            reasons.append(f"「{keyword}」に関する言及がある ({percentage:.1f}%)")
+            
+    score += keyword_score
+    
+    # 混雑していないことを示すキーワードの出現をチェック
+    crowd_found = set()
+    for text in review_texts:
+        crowd_found.update(CROWD_MATCHER.find(text))
+    
+    crowd_score = 0
+    for keyword in CROWD_KEYWORDS:
+        if keyword in crowd_found:
+            if crowd_score < 0.5:  # 最大0.5点
+                crowd_score += 0.25
+            if not any(keyword in reason for reason in reasons):
+                reasons.append(f"混雑していないという言及がある")
+                
+    score += crowd_score
+    
+    # スコア上限を設定
+    score = min(score, max_score)
+    
+    # 穴場かどうかの判定（スコア3.5以上で穴場と判定）
+    is_hidden_gem = score >= 3.5
+    
+    # スコアが低い場合の理由を追加
+    if score < 3.5:
+        if not reasons or all("数が多い" in reason for reason in reasons):
+            reasons.append("穴場を示す特徴が見つかりませんでした")
+            
+    return score, max_score, reasons, is_hidden_gem
+
+def analyze_sauna_html(html: str, url: str) -> dict:
+    """施設ページのHTMLを解析し、穴場度の判定結果を返す（エグゼキューターで実行）"""
+    soup = parse_html(html, DETAIL_PAGE_STRAINER)
+    
+    # サウナ名を取得
+    sauna_name_element = soup.select_one('h1.p-saunaDetailHeader_title')
+    sauna_name = sauna_name_element.text.strip() if sauna_name_element else "不明なサウナ施設"
+    
+    # レビューテキストを取得
+    reviews = soup.select('div.p-postCard_body p.p-postCard_text')
+    all_review_texts = []
+    
+    for review in reviews:
+        # 改行を適切に処理
+        for br in review.find_all('br'):
+            br.replace_with('\n')
+        text = review.text.strip()
+        if text:
+            all_review_texts.append(text)
+    
+    # 穴場度の判定処理
+    score, max_score, reasons, is_hidden_gem = evaluate_hidden_gem_score(all_review_texts)
+    
+    return {
+        "name": sauna_name,
+        "url": url,
+        "review_count": len(all_review_texts),
+        "score": score,
+        "max_score": max_score,
+        "is_hidden_gem": is_hidden_gem,
+        "reasons": reasons
+    }
+
+def parse_review_list(html: str, hidden_gem_keywords: list) -> tuple:
+    """レビュー一覧ページのHTMLを解析し、(レビューカード数, レビューのリスト) を返す（エグゼキューターで実行）"""
+    # HTMLをBeautifulSoupで解析
+    soup = parse_html(html, LIST_PAGE_STRAINER)
+    
+    # サウナ施設のカードを抽出
+    review_cards = soup.select('.p-post-list__item')
+    
+    # 各レビューカードの情報を抽出
+    page_reviews = []
+    for card in review_cards:
+        try:
+            # サウナ名を取得
+            sauna_elem = card.select_one('.p-post-list__sauna-name')
+            if not sauna_elem:
+                continue
+                
+            sauna_name = sauna_elem.get_text(strip=True)
+            
+            # サウナURLを取得
+            sauna_url_elem = card.select_one('.p-post-list__sauna-name a')
+            sauna_url = ""
+            if sauna_url_elem:
+                sauna_url = sauna_url_elem.get('href', '')
+                
+            # レビューテキストを取得
+            review_elem = card.select_one('.p-post-list__text')
+            if not review_elem:
+                continue
+                
+            review_text = review_elem.get_text(strip=True)
+            
+            # 投稿のURLを取得（増分クロールの既読判定に使用）
+            post_url = ""
+            post_link = card.select_one('a[href*="/posts/"]')
+            if post_link:
+                post_url = urljoin(SITE_URL, post_link.get('href', ''))
+            
+            # 投稿URL（なければサウナURLと本文）から決まるレビューIDを生成（再取得しても同じIDになる）
+            review_id = make_review_id(post_url, sauna_url, sauna_name, review_text)
+            
+            # 隠れた名店関連のキーワードを含むか確認
+            has_hidden_gem_keyword = get_matcher(hidden_gem_keywords).contains_any(review_text)
+            
+            # レビュー情報を結果リストに追加
+            page_reviews.append({
+                'review_id': review_id,
+                'sauna_name': sauna_name,
+                'sauna_url': sauna_url,
+                'review_text': review_text,
+                'post_url': post_url,
+                'has_hidden_gem_keyword': has_hidden_gem_keyword
+            })
+            
+        except Exception as e:
+            if VERBOSE_LOGGING:
+                print(f"レビュー抽出エラー: {str(e)}")
+    
+    return len(review_cards), page_reviews
+
+def make_review_id(post_url: str, sauna_url: str, sauna_name: str, review_text: str) -> str:
+    """投稿URLのパス（例: posts_12345）、なければサウナURL・名前・正規化した本文のハッシュからレビューIDを作る"""
+    if post_url:
+        path = urlsplit(post_url).path.strip('/')
+        if path:
+            return path.replace('/', '_')
+    return review_key({'sauna_url': sauna_url, 'sauna_name': sauna_name, 'review_text': review_text})
+
+def crawl_key(review: dict) -> str:
+    """増分クロールで既読を判定するためのキー（投稿URL、なければ内容のハッシュ）"""
+    return review.get('post_url') or review_key(review)
+
+def analyze_sauna_review_html(html: str, hidden_gem_keywords: list) -> dict:
+    """施設ページのHTMLからレビューを抽出し、隠れた名店スコアを算出する（エグゼキューターで実行）"""
+    # HTMLを解析
+    soup = parse_html(html, DETAIL_REVIEW_STRAINER)
+    
+    # サウナ施設名を取得
+    sauna_name_elem = soup.select_one('h1.p-saunaDetail__title')
+    if not sauna_name_elem:
+        return {
+            "success": False,
+            "message": "施設名が見つかりませんでした"
+        }
+    
+    sauna_name = sauna_name_elem.get_text(strip=True)
+    
+    # レビューを取得
+    reviews = []
+    review_cards = soup.select('.p-saunaDetail__reviewContent')
+    
+    for card in review_cards[:10]:  # 最大10件のレビューを取得
+        review_text_elem = card.select_one('.p-saunaDetail__reviewText')
+        if review_text_elem:
+            review_text = review_text_elem.get_text(strip=True)
+            reviews.append(review_text)
+    
+    # 隠れた名店スコアを算出
+    hidden_gem_score = 0
+    keyword_matches = []
+    matcher = get_matcher(hidden_gem_keywords)
+    
+    for review in reviews:
+        found = matcher.find(review)
+        hidden_gem_score += len(found)
+        keyword_matches.extend(found)
+    
+    # 平均スコアを計算（レビューあたりの隠れた名店キーワード出現率）
+    if reviews:
+        avg_score = hidden_gem_score / len(reviews)
+    else:
+        avg_score = 0
+    
+    # レビュー数に基づいてスコアを調整（レビュー数が多いほど信頼性が高い）
+    if reviews:
+        adjusted_score = avg_score * min(1, len(reviews) / 5)
+    else:
+        adjusted_score = 0
+    
+    # 100点満点に換算（50%をベースラインとする）
+    final_score = min(100, int(adjusted_score * 200))
+    
+    # 結果を返す
+    result = {
+        "success": True,
+        "sauna_name": sauna_name,
+        "review_count": len(reviews),
+        "hidden_gem_keywords": list(set(keyword_matches)),
+        "hidden_gem_score": final_score,
+        "message": f"{sauna_name}の隠れた名店スコアは{final_score}点です",
+        "is_hidden_gem": final_score >= 50
+    }
+    return result
+
+# アプリ全体で共有するHTTPセッション（起動時に生成し、終了時に閉じる）
+_http_session = None
+
+def create_http_session():
+    """接続プール付きの共有HTTPセッションを生成する（既にあれば再利用）"""
+    global _http_session
+
+    if _http_session is None or _http_session.closed:
+        # ホストごとの接続数を制限し、DNS結果とアイドル接続を再利用する
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        )
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_REQUEST_TIMEOUT)
+        )
+
+    return _http_session
+
+def get_http_session():
+    """共有HTTPセッションを取得する（未生成の場合はその場で生成）"""
+    return create_http_session()
+
+async def close_http_session():
+    """共有HTTPセッションを閉じる"""
+    global _http_session
+
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+def normalize_sauna_url(url: str) -> str:
+    """施設ページのURLを正規化する（スキーム・ホストの小文字化、クエリ・フラグメント・末尾のスラッシュの除去）"""
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, '', ''))
+
+class TokenBucket:
+    """トークンバケット方式でリクエストの送信間隔を制御する"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate  # 1秒あたりに補充されるトークン数
+        self.capacity = capacity  # バケットの容量（連続送信できる上限）
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """トークンを1つ消費する（不足していれば補充まで待機）"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
 class SaunaScraper:
     def __init__(self):
         self.base_url = "https://sauna-ikitai.com"
@@ -32,50 +394,84 @@ class SaunaScraper:
         # 隠れた名店に関連するキーワード
         self.hidden_gem_keywords = ["穴場", "隠れた", "静か", "空いている", "人が少ない", "混雑していない", "穴スポ"]
 
+    async def _fetch_html(self, url: str, max_age: float = None) -> tuple:
+        """
+        共有セッションでページを取得し、(ステータスコード, HTML) を返す
+
+        取得したページはディスクにキャッシュし、次回は ETag / Last-Modified による
+        条件付きリクエストを送って、304の場合はキャッシュの本文を使う。
+        max_age を指定した場合、その秒数以内に取得・検証したページはリクエストせずに返す。
+        """
+        cached = await asyncio.to_thread(page_cache.lookup, url)
+
+        if cached is not None and max_age is not None and time.time() - cached["validated_at"] < max_age:
+            html = await asyncio.to_thread(page_cache.read, url)
+            if html is not None:
+                return 200, html
+
+        headers = dict(self.headers)
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        session = get_http_session()
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and cached is not None:
+                html = await asyncio.to_thread(page_cache.read, url)
+                if html is not None:
+                    page_cache.touch(url)
+                    return 200, html
+            elif response.status == 200:
+                html = await response.text()
+                await asyncio.to_thread(
+                    page_cache.store, url, html,
+                    response.headers.get("ETag"), response.headers.get("Last-Modified")
+                )
+                return 200, html
+            else:
+                return response.status, None
+
+        # 304だがキャッシュの本文が読めなかった場合は、条件なしで取得し直す
+        async with session.get(url, headers=self.headers) as response:
+            if response.status != 200:
+                return response.status, None
+
+            html = await response.text()
+            await asyncio.to_thread(
+                page_cache.store, url, html,
+                response.headers.get("ETag"), response.headers.get("Last-Modified")
+            )
+            return response.status, html
+
     async def analyze_sauna(self, url: str) -> dict:
-        """特定のサウナの穴場評価を行う（URL指定 - 機能2）"""
+        """
+        特定のサウナの穴場評価を行う（URL指定 - 機能2）
+
+        正規化したURLごとに分析結果をキャッシュし、同じURLへの同時リクエストは
+        1回の取得・分析の結果を共有する。エラーの結果はキャッシュしない。
+        """
+        url = normalize_sauna_url(url)
+        return await analysis_cache.get_or_compute(
+            analysis_cache.make_key("analyze_sauna", {"url": url}),
+            lambda: self._analyze_sauna(url),
+            should_cache=lambda result: "error" not in result
+        )
+
+    async def _analyze_sauna(self, url: str) -> dict:
+        """施設ページを取得・解析して穴場評価を行う"""
         try:
             if not url.startswith("https://sauna-ikitai.com/saunas/"):
                 return {"error": "URLがサウナイキタイの施設ページではありません"}
                 
-            # URLからサウナ情報とレビューを取得
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=self.headers) as response:
-                    if response.status != 200:
-                        return {"error": f"ページの取得に失敗しました (ステータスコード: {response.status})"}
-                    
-                    html = await response.text()
-            
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # サウナ名を取得
-            sauna_name_element = soup.select_one('h1.p-saunaDetailHeader_title')
-            sauna_name = sauna_name_element.text.strip() if sauna_name_element else "不明なサウナ施設"
-            
-            # レビューテキストを取得
-            reviews = soup.select('div.p-postCard_body p.p-postCard_text')
-            all_review_texts = []
-            
-            for review in reviews:
-                # 改行を適切に処理
-                for br in review.find_all('br'):
-                    br.replace_with('\n')
-                text = review.text.strip()
-                if text:
-                    all_review_texts.append(text)
-            
-            # 穴場度の判定処理
-            score, max_score, reasons, is_hidden_gem = self.evaluate_hidden_gem_score(all_review_texts)
-            
-            return {
-                "name": sauna_name,
-                "url": url,
-                "review_count": len(all_review_texts),
-                "score": score,
-                "max_score": max_score,
-                "is_hidden_gem": is_hidden_gem,
-                "reasons": reasons
-            }
+            # URLからサウナ情報とレビューを取得（直近に取得したページは再取得しない）
+            status, html = await self._fetch_html(url, max_age=ANALYZE_FRESHNESS_SECONDS)
+            if status != 200:
+                return {"error": f"ページの取得に失敗しました (ステータスコード: {status})"}
+
+            # 解析と穴場度の判定はエグゼキューターで実行する
+            return await run_cpu_bound(analyze_sauna_html, html, url)
             
         except Exception as e:
             print(f"サウナ分析エラー: {str(e)}")
@@ -84,173 +480,96 @@ class SaunaScraper:
 
     def evaluate_hidden_gem_score(self, review_texts: list) -> tuple:
         """レビューテキストから穴場度を判定する"""
-        score = 0
-        max_score = 5
-        reasons = []
+        return evaluate_hidden_gem_score(review_texts)
         
-        # レビューの数をチェック（少ないほど穴場度が高い）
-        review_count = len(review_texts)
-        if review_count < 10:
-            score += 1
-            reasons.append(f"レビュー数が少ない（{review_count}件）")
-        elif review_count < 20:
-            score += 0.5
-            reasons.append(f"比較的レビュー数が少ない（{review_count}件）")
-        else:
-            reasons.append(f"レビュー数が多い（{review_count}件）")
-            
-        # キーワードの出現頻度をチェック
-        keyword_matches = {}
-        for keyword in HIDDEN_GEM_KEYWORDS:
-            count = 0
-            for text in review_texts:
-                if keyword in text:
-                    count += 1
-            if count > 0:
-                keyword_percentage = (count / review_count) * 100
-                keyword_matches[keyword] = keyword_percentage
+    async def fetch_list_page(self, base_url: str, page: int, limiter) -> str:
+        """一覧の1ページ分のHTMLを取得する（取得失敗時はNone）"""
+        # ページURLを構築
+        page_url = f"{base_url}&page={page}" if page > 1 else base_url
         
-        # 「穴場」という単語が直接使われている場合、大きくスコアアップ
-        if '穴場' in keyword_matches and keyword_matches['穴場'] > 10:
-            score += 2
-            reasons.append(f"「穴場」という表現が複数のレビューで使用されている ({keyword_matches['穴場']:.1f}%)")
-        elif '穴場' in keyword_matches:
-            score += 1
-            reasons.append(f"「穴場」という表現が使用されている ({keyword_matches['穴場']:.1f}%)")
-            
-        # その他のキーワードでスコアアップ（最大1.5点）
-        keyword_score = 0
-        for keyword, percentage in keyword_matches.items():
-            if keyword != '穴場' and percentage > 5:
-                if keyword_score < 1.5:
-                    keyword_score += 0.5
-                reasons.append(f"「{keyword}」に関する言及がある ({percentage:.1f}%)")
-                
-        score += keyword_score
+        # 取得前にトークンを消費してリクエスト間隔を守る
+        await limiter.acquire()
         
-        # 混雑していないことを示すキーワードの出現をチェック
-        crowd_keywords = ['空いている', '空いてる', '空き', '並ばず', '待たず', 'すいてる', 'すいている']
-        crowd_score = 0
+        if VERBOSE_LOGGING:
+            print(f"ページ {page} をスクレイピング中... URL: {page_url}")
         
-        for keyword in crowd_keywords:
-            for text in review_texts:
-                if keyword in text:
-                    if crowd_score < 0.5:  # 最大0.5点
-                        crowd_score += 0.25
-                    if not any(keyword in reason for reason in reasons):
-                        reasons.append(f"混雑していないという言及がある")
-                    break
-                    
-        score += crowd_score
+        # 共有セッションでHTMLを取得
+        status, html = await self._fetch_html(page_url)
+        if status != 200:
+            print(f"エラー: ページ {page} の取得に失敗。ステータスコード: {status}")
+            return None
+        return html
         
-        # スコア上限を設定
-        score = min(score, max_score)
+    async def _scrape_page(self, base_url: str, page: int, limiter) -> tuple:
+        """1ページ分を取得・解析し、(レビューカード数, レビューのリスト) を返す（取得失敗時はNone）"""
+        html = await self.fetch_list_page(base_url, page, limiter)
+        if html is None:
+            return None
         
-        # 穴場かどうかの判定（スコア3.5以上で穴場と判定）
-        is_hidden_gem = score >= 3.5
+        # HTMLの解析はエグゼキューターで実行し、イベントループをブロックしない
+        card_count, page_reviews = await run_cpu_bound(parse_review_list, html, self.hidden_gem_keywords)
         
-        # スコアが低い場合の理由を追加
-        if score < 3.5:
-            if not reasons or all("数が多い" in reason for reason in reasons):
-                reasons.append("穴場を示す特徴が見つかりませんでした")
-                
-        return score, max_score, reasons, is_hidden_gem
+        if VERBOSE_LOGGING and card_count:
+            print(f"ページ {page}: {card_count} 件のレビューカードを検出")
         
-    async def scrape_sauna_reviews(self, base_url="https://sauna-ikitai.com/search/saunas?prefecture%5B%5D=13", start_page=1, end_page=3):
-        """指定したページ範囲のサウナ施設のレビューをスクレイピングする"""
-        results = []
-        total_reviews = 0
+        return card_count, page_reviews
         
+    async def scrape_sauna_reviews(self, base_url="https://sauna-ikitai.com/search/saunas?prefecture%5B%5D=13", start_page=1, end_page=3, concurrency=None):
+        """
+        指定したページ範囲のサウナ施設のレビューをスクレイピングする（保存はしない）
+
+        最大concurrencyページを並行して取得し、トークンバケットでリクエスト間隔を制御する。
+        結果はページ順に返し、レビューカードのないページに到達した時点で打ち切る。
+        定期スクレイピングでの取得・保存は ScrapePipeline（app/services/pipeline.py）が行う。
+        """
+        concurrency = max(1, concurrency or SCRAPING_CONCURRENCY)
+        limiter = TokenBucket(SCRAPING_RATE_PER_SEC, SCRAPING_BURST)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_page(page):
+            async with semaphore:
+                try:
+                    return await self._scrape_page(base_url, page, limiter)
+                except Exception as e:
+                    print(f"エラー: ページ {page} の処理に失敗: {str(e)}")
+                    return None
+
+        pages = range(start_page, end_page + 1)
+        tasks = [asyncio.create_task(fetch_page(page)) for page in pages]
+        results = []
+
         try:
-            if VERBOSE_LOGGING:
-                print(f"スクレイピング開始: {base_url} (ページ {start_page}～{end_page})")
-            
-            for page in range(start_page, end_page + 1):
-                # ページURLを構築
-                page_url = f"{base_url}&page={page}" if page > 1 else base_url
-                
-                if VERBOSE_LOGGING:
-                    print(f"ページ {page} をスクレイピング中... URL: {page_url}")
-                
-                # 非同期HTTPクライアントでHTMLを取得
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(page_url, headers=self.headers) as response:
-                        if response.status != 200:
-                            print(f"エラー: ページ {page} の取得に失敗。ステータスコード: {response.status}")
-                            continue
-                            
-                        html = await response.text()
-                        
-                # HTMLをBeautifulSoupで解析
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # サウナ施設のカードを抽出
-                review_cards = soup.select('.p-post-list__item')
-                
-                if not review_cards:
-                    print(f"ページ {page}: レビューカードが見つかりませんでした")
+            # ページ順に結果を受け取る（失敗したページは読み飛ばす）
+            for page, task in zip(pages, tasks):
+                outcome = await task
+                if outcome is None:
                     continue
-                
-                if VERBOSE_LOGGING:
-                    print(f"ページ {page}: {len(review_cards)} 件のレビューカードを検出")
-                
-                # 各レビューカードの情報を抽出
-                for card in review_cards:
-                    try:
-                        # サウナ名を取得
-                        sauna_elem = card.select_one('.p-post-list__sauna-name')
-                        if not sauna_elem:
-                            continue
-                            
-                        sauna_name = sauna_elem.get_text(strip=True)
-                        
-                        # サウナURLを取得
-                        sauna_url_elem = card.select_one('.p-post-list__sauna-name a')
-                        sauna_url = ""
-                        if sauna_url_elem:
-                            sauna_url = sauna_url_elem.get('href', '')
-                            
-                        # レビューテキストを取得
-                        review_elem = card.select_one('.p-post-list__text')
-                        if not review_elem:
-                            continue
-                            
-                        review_text = review_elem.get_text(strip=True)
-                        
-                        # 一意のレビューIDを生成
-                        review_id = str(uuid.uuid4())
-                        
-                        # 隠れた名店関連のキーワードを含むか確認
-                        has_hidden_gem_keyword = any(keyword in review_text for keyword in self.hidden_gem_keywords)
-                        
-                        # レビュー情報を結果リストに追加
-                        results.append({
-                            'review_id': review_id,
-                            'sauna_name': sauna_name,
-                            'sauna_url': sauna_url,
-                            'review_text': review_text,
-                            'has_hidden_gem_keyword': has_hidden_gem_keyword
-                        })
-                        
-                        total_reviews += 1
-                        
-                    except Exception as e:
-                        if VERBOSE_LOGGING:
-                            print(f"レビュー抽出エラー: {str(e)}")
-                
-                # ページ間の待機時間（サーバー負荷軽減のため）
-                if page < end_page:
-                    await asyncio.sleep(1)
-            
+
+                card_count, page_reviews = outcome
+                if card_count == 0:
+                    # 最終ページを過ぎたのでそれ以降は取得しない
+                    print(f"ページ {page}: レビューカードが見つかりませんでした。以降のページは取得しません")
+                    break
+
+                results.extend(page_reviews)
+
             if VERBOSE_LOGGING:
-                print(f"スクレイピング完了: {total_reviews} 件のレビューを抽出")
-                
+                print(f"スクレイピング完了: {len(results)} 件のレビューを抽出")
+
             return results
-            
+
         except Exception as e:
             print(f"スクレイピング処理エラー: {str(e)}")
             return []
-    
+
+        finally:
+            # 打ち切った後続ページの取得をキャンセル
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
     async def get_hidden_gem_reviews_test(self, count=5, fallback_to_regular=True):
         """隠れた名店のレビューを取得する（本番用）"""
         # 本番モードでは実際にWebからデータを取得
@@ -350,77 +669,19 @@ class SaunaScraper:
         print(f"分析開始: {url}")
         
         try:
-            # URLからサウナ施設の情報を取得
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=self.headers) as response:
-                    if response.status != 200:
-                        return {
-                            "success": False,
-                            "message": f"エラー: ステータスコード {response.status}"
-                        }
-                        
-                    html = await response.text()
-                    
-            # HTMLを解析
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # サウナ施設名を取得
-            sauna_name_elem = soup.select_one('h1.p-saunaDetail__title')
-            if not sauna_name_elem:
+            # URLからサウナ施設の情報を取得（直近に取得したページは再取得しない）
+            status, html = await self._fetch_html(url, max_age=ANALYZE_FRESHNESS_SECONDS)
+            if status != 200:
                 return {
                     "success": False,
-                    "message": "施設名が見つかりませんでした"
+                    "message": f"エラー: ステータスコード {status}"
                 }
-                
-            sauna_name = sauna_name_elem.get_text(strip=True)
-            
-            # レビューを取得
-            reviews = []
-            review_cards = soup.select('.p-saunaDetail__reviewContent')
-            
-            for card in review_cards[:10]:  # 最大10件のレビューを取得
-                review_text_elem = card.select_one('.p-saunaDetail__reviewText')
-                if review_text_elem:
-                    review_text = review_text_elem.get_text(strip=True)
-                    reviews.append(review_text)
-            
-            # 隠れた名店スコアを算出
-            hidden_gem_score = 0
-            keyword_matches = []
-            
-            for review in reviews:
-                for keyword in self.hidden_gem_keywords:
-                    if keyword in review:
-                        hidden_gem_score += 1
-                        keyword_matches.append(keyword)
-            
-            # 平均スコアを計算（レビューあたりの隠れた名店キーワード出現率）
-            if reviews:
-                avg_score = hidden_gem_score / len(reviews)
-            else:
-                avg_score = 0
-            
-            # レビュー数に基づいてスコアを調整（レビュー数が多いほど信頼性が高い）
-            if reviews:
-                adjusted_score = avg_score * min(1, len(reviews) / 5)
-            else:
-                adjusted_score = 0
-            
-            # 100点満点に換算（50%をベースラインとする）
-            final_score = min(100, int(adjusted_score * 200))
-            
-            # 結果を返す
-            result = {
-                "success": True,
-                "sauna_name": sauna_name,
-                "review_count": len(reviews),
-                "hidden_gem_keywords": list(set(keyword_matches)),
-                "hidden_gem_score": final_score,
-                "message": f"{sauna_name}の隠れた名店スコアは{final_score}点です",
-                "is_hidden_gem": final_score >= 50
-            }
+
+            # 解析とスコア算出はエグゼキューターで実行する
+            result = await run_cpu_bound(analyze_sauna_review_html, html, self.hidden_gem_keywords)
             
-            print(f"分析完了: {sauna_name} (スコア: {final_score})")
+            if result["success"]:
+                print(f"分析完了: {result['sauna_name']} (スコア: {result['hidden_gem_score']})")
             return result
             
         except Exception as e:
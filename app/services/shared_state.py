@@ -0,0 +1,110 @@
+"""
+ワーカー間で共有する状態モジュール
+状態をSQLiteの1行に保存し、バージョン（変更カウンター）が変わった場合だけ読み込み直します
+"""
+
+import asyncio
+import copy
+import json
+import traceback
+
+from app.models.database import init_db, read_shared_state, update_shared_state
+from app.services.github_storage import write_json_atomic
+
+# 保存済みの値がないことを表す目印
+_MISSING = object()
+
+class SharedState:
+    """
+    複数のワーカープロセスで共有する状態の辞書
+
+    各プロセスは読み込んだ状態とそのバージョンを保持し、load() ではバージョンだけを確認して
+    変更がなければ保持している状態をそのまま返します。
+    save() は前回の読み込み以降に変更した項目だけをデータベース上の状態にマージするため、
+    別のプロセスが同時に別の項目を更新しても上書きしません。
+    data は常に同じ辞書を更新するため、モジュールの外から参照していても最新の状態になります。
+    """
+
+    def __init__(self, name, defaults, mirror_file=None):
+        """
+        Args:
+            name: 状態の名前（shared_state テーブルの主キー）
+            defaults: 状態が未作成の場合の初期値を返す関数
+            mirror_file: 保存のたびに状態を書き出すJSONファイル（初回は既存のファイルから状態を取り込む）
+        """
+        self.name = name
+        self.defaults = defaults
+        self.mirror_file = mirror_file
+        self.data = {}
+        self.version = None
+        self.reloads = 0
+        self._saved = {}
+
+    def _replace(self, version, data):
+        """保持している状態をデータベースの内容で置き換える"""
+        self.data.clear()
+        self.data.update(data)
+        self._saved = copy.deepcopy(data)
+        self.version = version
+
+    def _initial_state(self):
+        """初回の状態（既存のJSONファイルがあればその内容、なければ初期値）"""
+        state = self.defaults()
+        if self.mirror_file is not None and self.mirror_file.exists():
+            try:
+                with open(self.mirror_file, 'r', encoding='utf-8') as f:
+                    state.update(json.load(f))
+                print(f"共有状態をファイルから取り込みました ({self.name}): {self.mirror_file}")
+            except Exception as e:
+                print(f"共有状態のファイルの読み込みに失敗しました ({self.name}): {str(e)}")
+        return state
+
+    async def load(self):
+        """
+        最新の状態を取得する
+
+        バージョンが変わっていない場合は保持している状態をそのまま返します。
+        """
+        await init_db()
+        version, data = await read_shared_state(self.name, self.version)
+        if version is None:
+            # 未作成の場合は作成する（同時に作成したプロセスがあればその状態を使う）
+            version, data = await update_shared_state(self.name, self._initial_state(), create_only=True)
+        if data is not None:
+            self._replace(version, data)
+            self.reloads += 1
+        return self.data
+
+    async def save(self, replace=False):
+        """
+        変更した項目を保存してバージョンを進める
+
+        Args:
+            replace: Trueの場合は data の内容で状態全体を置き換える
+        """
+        if replace:
+            changes = dict(self.data)
+        else:
+            changes = {key: value for key, value in self.data.items() if self._saved.get(key, _MISSING) != value}
+            if not changes and self.version is not None:
+                return self.version
+
+        await init_db()
+        version, data = await update_shared_state(self.name, changes, replace=replace)
+        self._replace(version, data)
+
+        if self.mirror_file is not None:
+            try:
+                await asyncio.to_thread(write_json_atomic, self.mirror_file, data)
+            except Exception as e:
+                # データベースへの保存は済んでいるため、ファイルへの書き出しの失敗は処理を止めない
+                print(f"共有状態のファイルへの書き出しに失敗しました ({self.name}): {str(e)}")
+                print(traceback.format_exc())
+        return version
+
+    def stats(self):
+        """共有状態の統計情報"""
+        return {
+            "version": self.version,
+            "reloads": self.reloads
+        }
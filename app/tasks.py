@@ -5,10 +5,20 @@ import asyncio
 import time
 from datetime import datetime, timedelta
 import traceback
-import json
+import random
 from app.services.scraper import SaunaScraper
+from app.config import (
+    POSTS_SEARCH_URL, BACKFILL_PAGES_PER_RUN,
+    SCHEDULER_POLL_SECONDS, SCHEDULER_JITTER_SECONDS, SCHEDULER_RETRY_SECONDS,
+    SCRAPING_LEASE_NAME, SCRAPING_LEASE_TTL
+)
 from app.models.database import get_db, save_review
-from app.database import save_reviews
+from app.services.pipeline import run_incremental, run_backfill, run_gap_fill, next_high_water_mark
+from app.services.github_storage import compact_storage
+from app.services.cache import response_cache
+from app.services.jobs import job_registry
+from app.services.lease import JobLease
+from app.services.shared_state import SharedState
 
 from fastapi import BackgroundTasks
 from fastapi.responses import JSONResponse
@@ -19,6 +29,9 @@ scraper = SaunaScraper()
 # 前回のスクレイピング時刻を記録する変数
 last_scraping_time = None
 
+# アプリ内スケジューラーのタスク
+_scheduler_task = None
+
 # 環境変数
 IS_RENDER = os.environ.get('RENDER', 'False') == 'True'
 
@@ -31,15 +44,21 @@ else:
 # スクレイピング状態を保存するファイルパス
 SCRAPING_STATE_FILE = DATA_DIR / 'scraping_state.json'
 
-# スクレイピングの状態管理用の辞書
-scraping_state = {
-    "last_page": 0,  # 最後にスクレイピングしたページ
-    "total_pages_scraped": 0,  # スクレイピングした総ページ数
-    "last_run": None,  # 最後に実行した時刻
-    "is_running": False,  # 現在実行中かどうか
-    "auto_scraping_enabled": True,  # 自動スクレイピングが有効かどうか
-    "next_scraping": None  # 次回スクレイピングの予定時刻
-}
+def default_scraping_state():
+    """スクレイピング状態の初期値"""
+    return {
+        "last_page": 0,  # 最後にスクレイピングしたページ
+        "total_pages_scraped": 0,  # スクレイピングした総ページ数
+        "last_run": "",  # 最後に実行した時刻
+        "auto_scraping_enabled": True,  # 自動スクレイピングが有効かどうか
+        "next_scraping": (datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')  # 次回スクレイピングの予定時刻
+    }
+
+# スクレイピングの状態（全ワーカーでデータベースの1行を共有し、JSONファイルにも書き出す）
+scraping_state_store = SharedState("scraping_state", default_scraping_state, mirror_file=SCRAPING_STATE_FILE)
+
+# スクレイピングの状態管理用の辞書（常に同じ辞書を更新するため、importした側でも最新の状態を参照できる）
+scraping_state = scraping_state_store.data
 
 # データディレクトリが存在しない場合は作成
 def ensure_data_dir():
@@ -52,63 +71,42 @@ def ensure_data_dir():
     
     return DATA_DIR
 
-def load_scraping_state():
-    """スクレイピング状態を読み込む"""
-    global scraping_state
+async def load_scraping_state():
+    """
+    スクレイピング状態を読み込む
     
+    他のワーカーが状態を更新していなければバージョンを確認するだけで、保持している状態をそのまま使います。
+    """
     try:
-        # データディレクトリの確保
-        ensure_data_dir()
-        
-        # スクレイピング状態ファイルが存在するか確認
-        if SCRAPING_STATE_FILE.exists():
-            with open(SCRAPING_STATE_FILE, 'r', encoding='utf-8') as f:
-                loaded_state = json.load(f)
-                scraping_state.update(loaded_state)
-                
-            print(f"スクレイピング状態を読み込みました: {SCRAPING_STATE_FILE}")
-        else:
-            # ファイルが存在しない場合はデフォルト状態を設定
-            scraping_state = {
-                "last_page": 0,
-                "total_pages_scraped": 0,
-                "is_running": False,
-                "auto_scraping_enabled": True,
-                "last_run": "",
-                "next_scraping": (datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')
-            }
-            print(f"スクレイピング状態ファイルが見つからないため、デフォルト状態を使用します")
-            
-            # デフォルト状態を保存
-            save_scraping_state()
+        await scraping_state_store.load()
     
     except Exception as e:
         print(f"スクレイピング状態の読み込みに失敗しました: {str(e)}")
         print(traceback.format_exc())
         
-        # エラー時はデフォルト状態を設定
-        scraping_state = {
-            "last_page": 0,
-            "total_pages_scraped": 0,
-            "is_running": False,
-            "auto_scraping_enabled": True,
-            "last_run": "",
-            "next_scraping": (datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')
-        }
+        # 一度も読み込めていない場合はデフォルト状態を設定
+        if not scraping_state:
+            scraping_state.update(default_scraping_state())
+    
+    return scraping_state
 
-def save_scraping_state():
-    """スクレイピング状態を保存する"""
-    global scraping_state
+async def save_scraping_state(replace=False):
+    """
+    スクレイピング状態を保存する
     
+    前回の読み込み以降に変更した項目だけを共有の状態にマージするため、
+    他のワーカーが同時に別の項目を更新しても上書きしません。
+    
+    Args:
+        replace: Trueの場合は現在の内容で状態全体を置き換える（リセット時）
+    """
     try:
-        # データディレクトリの確保
-        ensure_data_dir()
+        # データディレクトリの確保（JSONファイルへの書き出し用）
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
         
-        # 状態をJSONファイルとして保存
-        with open(SCRAPING_STATE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(scraping_state, f, ensure_ascii=False, indent=2)
-            
-        print(f"スクレイピング状態を保存しました: {SCRAPING_STATE_FILE}")
+        version = await scraping_state_store.save(replace=replace)
+        
+        print(f"スクレイピング状態を保存しました: バージョン {version}")
     
     except Exception as e:
         print(f"スクレイピング状態の保存に失敗しました: {str(e)}")
@@ -116,11 +114,9 @@ def save_scraping_state():
 
 async def toggle_auto_scraping(enable=None):
     """自動スクレイピングの有効/無効を切り替える"""
-    global scraping_state
-    
     try:
         # 現在のスクレイピング状態を読み込む
-        load_scraping_state()
+        await load_scraping_state()
         
         if enable is not None:
             scraping_state["auto_scraping_enabled"] = enable
@@ -133,7 +129,7 @@ async def toggle_auto_scraping(enable=None):
             next_run_time = datetime.now() + timedelta(minutes=15)
             scraping_state["next_scraping"] = next_run_time.strftime('%Y-%m-%d %H:%M:%S')
         
-        save_scraping_state()
+        await save_scraping_state()
         
         message = f"自動スクレイピングを{'有効' if scraping_state['auto_scraping_enabled'] else '無効'}にしました"
         print(message)
@@ -158,21 +154,13 @@ async def toggle_auto_scraping(enable=None):
 
 async def reset_scraping_state():
     """スクレイピング状態をリセットする"""
-    global scraping_state
-    
     try:
         # 初期状態を設定
-        scraping_state = {
-            "last_page": 0,
-            "total_pages_scraped": 0,
-            "is_running": False,
-            "auto_scraping_enabled": True,
-            "last_run": "",
-            "next_scraping": (datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')
-        }
+        scraping_state.clear()
+        scraping_state.update(default_scraping_state())
         
-        # 状態を保存
-        save_scraping_state()
+        # 状態を保存（他のワーカーが追加した項目も含めて置き換える）
+        await save_scraping_state(replace=True)
         
         message = "スクレイピング状態をリセットしました。次回は最初のページからスクレイピングが開始されます。"
         print(message)
@@ -196,100 +184,181 @@ async def reset_scraping_state():
             "message": error_message
         }
 
-async def periodic_scraping(background_tasks=None):
-    """周期的スクレイピング処理"""
-    global scraping_state
-    
+async def run_storage_compaction(include_today=False):
+    """保存済みのレビューファイルを日ごとに圧縮する（ファイル操作はスレッドで実行）"""
     try:
-        # データディレクトリの確保
-        ensure_data_dir()
-        
-        # スクレイピング状態を読み込む
-        load_scraping_state()
-        
-        # 既に実行中の場合は何もしない
-        if scraping_state.get("is_running", False):
-            message = "スクレイピングは既に実行中です。"
-            print(message)
-            
-            # APIからの呼び出しの場合はJSONResponseを返す
-            if background_tasks is not None:
-                return JSONResponse(
-                    content={"status": "info", "message": message}
-                )
-            return {"message": message, "status": "info"}
-        
-        # 実行中フラグを設定
-        scraping_state["is_running"] = True
-        save_scraping_state()
-        
-        print("スクレイピングを開始します...")
+        summary = await asyncio.to_thread(compact_storage, include_today)
         
-        # 開始ページと終了ページを決定
-        start_page = int(scraping_state.get("last_page", 0)) + 1
-        end_page = start_page + 2  # 1回の実行で3ページをスクレイピング
+        # 重複が除かれるとランキングが変わるためキャッシュを無効化
+        if summary["days"]:
+            response_cache.invalidate()
         
-        # スクレイピングを実行
-        base_url = "https://sauna-ikitai.com/posts?prefecture%5B%5D=tokyo&keyword=%E7%A9%B4%E5%A0%B4"
-        results = await scraper.scrape_sauna_reviews(base_url=base_url, start_page=start_page, end_page=end_page)
+        # 最後に圧縮した日付を記録（定期スクレイピングから1日1回だけ実行するため）
+        scraping_state["last_compaction"] = datetime.now().strftime('%Y-%m-%d')
+        await save_scraping_state()
         
-        # 結果を保存
-        if results:
-            num_saved = await save_reviews(results)
-            print(f"{num_saved}件のレビューをデータベースに保存しました")
-        else:
-            num_saved = 0
-            print("保存するレビューがありませんでした")
+        message = (f"レビューファイルを圧縮しました: {summary['files_before']}ファイル/{summary['bytes_before']}バイト → "
+                   f"{summary['files_after']}ファイル/{summary['bytes_after']}バイト")
+        print(message)
         
-        # スクレイピング状態を更新
-        scraping_state["is_running"] = False
-        scraping_state["last_page"] = end_page
-        scraping_state["total_pages_scraped"] += (end_page - start_page + 1)
-        scraping_state["last_run"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return {
+            "status": "success",
+            "message": message,
+            "data": summary
+        }
+    except Exception as e:
+        print(f"レビューファイルの圧縮に失敗しました: {str(e)}")
+        print(traceback.format_exc())
         
-        # 次回のスクレイピング時刻を15分後に設定
-        next_run_time = datetime.now() + timedelta(minutes=15)
-        scraping_state["next_scraping"] = next_run_time.strftime('%Y-%m-%d %H:%M:%S')
+        return {
+            "status": "error",
+            "message": f"レビューファイルの圧縮に失敗しました: {str(e)}"
+        }
+
+async def _scrape_and_save(background_tasks=None):
+    """実行権を取得した状態で、新着分とバックフィルを取得・保存して状態を更新する"""
+    # 前の実行者が保存した最新の状態を読み込む
+    await load_scraping_state()
+    
+    print("スクレイピングを開始します...")
+    
+    # 1ページ目から前回取得済みのレビューまでを取得し、ページごとに保存（新着分）
+    incremental = await run_incremental(scraper, POSTS_SEARCH_URL, scraping_state.get("high_water_mark") or [])
+    pages_scraped = incremental["pages"]
+    num_saved = incremental["saved"]
+    
+    # 高水位標は新着分をすべて保存できた場合だけ進める
+    previous_mark = scraping_state.get("high_water_mark") or []
+    high_water_mark, gap_page = next_high_water_mark(incremental, previous_mark)
+    if high_water_mark != previous_mark:
+        scraping_state["high_water_mark"] = high_water_mark
+        if gap_page is not None:
+            # 前回の位置までの残りのページは、バックフィルの位置を戻さず別の範囲として取り直す
+            scraping_state["pending_gaps"] = (scraping_state.get("pending_gaps") or []) + [{"page": gap_page, "until": previous_mark}]
+        elif not previous_mark and not scraping_state.get("backfill_page") and not scraping_state.get("last_page"):
+            # 初回は新着分として取得したページの次からバックフィルを始める
+            scraping_state["backfill_page"] = incremental["next_page"]
+        await save_scraping_state()
+    
+    # 取り漏れた範囲を、その時点の高水位標に届くまで取得
+    page_budget = BACKFILL_PAGES_PER_RUN
+    if scraping_state.get("pending_gaps"):
+        gaps = scraping_state["pending_gaps"]
         
-        save_scraping_state()
+        # 保存すると状態の中身が読み込み直されるため、保存のたびに範囲のリストを入れ直す
+        async def gap_checkpoint(progress=None):
+            scraping_state["pending_gaps"] = gaps
+            await save_scraping_state()
         
-        # 結果メッセージを作成
-        message = f"スクレイピングが完了しました。ページ {start_page} から {end_page} まで処理し、{num_saved} 件のレビューを保存しました。"
-        print(message)
+        gap_fill = await run_gap_fill(scraper, POSTS_SEARCH_URL, gaps, page_budget, on_checkpoint=gap_checkpoint)
+        await gap_checkpoint()
+        pages_scraped += gap_fill["pages"]
+        num_saved += gap_fill["saved"]
+        page_budget = max(page_budget - gap_fill["pages"], 0)
+    
+    # 過去のレビューを数ページずつさかのぼって取得（バックフィル）
+    start_page = int(scraping_state.get("backfill_page") or int(scraping_state.get("last_page", 0)) + 1)
+    end_page = start_page - 1
+    if not scraping_state.get("backfill_done", False) and page_budget > 0:
+        # ページを保存するたびに再開位置を記録（中断しても次回は続きから取得）
+        async def checkpoint(progress):
+            scraping_state["backfill_page"] = progress["next_page"]
+            scraping_state["last_page"] = progress["next_page"] - 1
+            await save_scraping_state()
         
-        # APIからの呼び出しの場合はJSONResponseを返す
-        if background_tasks is not None:
-            return JSONResponse(
-                content={
-                    "status": "success", 
-                    "message": message,
-                    "data": {
-                        "start_page": start_page,
-                        "end_page": end_page,
-                        "reviews_saved": num_saved,
-                        "next_scraping": scraping_state["next_scraping"]
-                    }
+        backfill = await run_backfill(scraper, POSTS_SEARCH_URL, start_page, page_budget, on_checkpoint=checkpoint)
+        pages_scraped += backfill["pages"]
+        num_saved += backfill["saved"]
+        end_page = backfill["next_page"] - 1
+        scraping_state["backfill_page"] = backfill["next_page"]
+        scraping_state["backfill_done"] = backfill["done"]
+    
+    print(f"{num_saved}件のレビューをデータベースに保存しました")
+    
+    # 新しいレビューを反映するためキャッシュを無効化
+    if num_saved:
+        response_cache.invalidate()
+    
+    # スクレイピング状態を更新
+    scraping_state["last_page"] = max(end_page, 0)
+    scraping_state["total_pages_scraped"] += pages_scraped
+    scraping_state["last_run"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    # 次回のスクレイピング時刻を15分後に設定
+    next_run_time = datetime.now() + timedelta(minutes=15)
+    scraping_state["next_scraping"] = next_run_time.strftime('%Y-%m-%d %H:%M:%S')
+    
+    await save_scraping_state()
+    
+    # 前日までのレビューファイルの圧縮を1日1回実行
+    if scraping_state.get("last_compaction") != datetime.now().strftime('%Y-%m-%d'):
+        await run_storage_compaction()
+    
+    # 結果メッセージを作成
+    backfill_message = f"過去分はページ {start_page} から {end_page} まで" if end_page >= start_page else "過去分の取得はなし"
+    message = (f"スクレイピングが完了しました。新着 {incremental['reviews']} 件（{incremental['pages']}ページ）、"
+               f"{backfill_message}処理し、{num_saved} 件のレビューを保存しました。")
+    print(message)
+    
+    # APIからの呼び出しの場合はJSONResponseを返す
+    if background_tasks is not None:
+        return JSONResponse(
+            content={
+                "status": "success", 
+                "message": message,
+                "data": {
+                    "start_page": start_page,
+                    "end_page": end_page,
+                    "new_reviews": incremental["reviews"],
+                    "pages_scraped": pages_scraped,
+                    "reviews_saved": num_saved,
+                    "next_scraping": scraping_state["next_scraping"]
                 }
-            )
+            }
+        )
+    
+    # 通常の呼び出しの場合は辞書を返す
+    return {
+        "message": message,
+        "start_page": start_page,
+        "end_page": end_page,
+        "new_reviews": incremental["reviews"],
+        "pages_scraped": pages_scraped,
+        "reviews_saved": num_saved,
+        "next_scraping": scraping_state["next_scraping"]
+    }
+
+async def periodic_scraping(background_tasks=None):
+    """
+    周期的スクレイピング処理
+    
+    データベースのリースで実行権を取得できたプロセスだけがスクレイピングを行うため、
+    複数のワーカーやスケジューラーから同時に呼び出されてもクロールは1つだけ実行されます。
+    """
+    try:
+        # データディレクトリの確保
+        ensure_data_dir()
         
-        # 通常の呼び出しの場合は辞書を返す
-        return {
-            "message": message,
-            "start_page": start_page,
-            "end_page": end_page,
-            "reviews_saved": num_saved,
-            "next_scraping": scraping_state["next_scraping"]
-        }
+        async with JobLease(SCRAPING_LEASE_NAME, SCRAPING_LEASE_TTL) as lease:
+            # 他のプロセス（またはタスク）が実行中の場合は何もしない
+            if not lease.acquired:
+                message = "スクレイピングは既に実行中です。"
+                print(message)
+                
+                # APIからの呼び出しの場合はJSONResponseを返す
+                if background_tasks is not None:
+                    return JSONResponse(
+                        content={"status": "info", "message": message}
+                    )
+                return {"message": message, "status": "info"}
+            
+            return await _scrape_and_save(background_tasks)
         
     except Exception as e:
         # エラー発生時
         print(f"スクレイピングエラー: {str(e)}")
         print(traceback.format_exc())
         
-        # スクレイピング状態をリセット
-        scraping_state["is_running"] = False
-        save_scraping_state()
-        
         # APIからの呼び出しの場合はJSONResponseでエラーを返す
         if background_tasks is not None:
             return JSONResponse(
@@ -303,5 +372,103 @@ async def periodic_scraping(background_tasks=None):
             "error": True
         }
 
-# 起動時に状態を読み込む
-load_scraping_state() 
\ No newline at end of file
+async def run_scraping_job():
+    """定期スクレイピングをジョブとして実行する（失敗した場合は例外にしてジョブの状態に反映）"""
+    result = await periodic_scraping()
+    if result.get("error"):
+        raise RuntimeError(result["message"])
+    return result
+
+async def submit_scraping_job():
+    """定期スクレイピングのジョブを登録する（実行中の場合はそのジョブを返す）"""
+    return await job_registry.submit("periodic_scraping", run_scraping_job)
+
+def _parse_schedule_time(value):
+    """次回スクレイピングの予定時刻を読み取る（未設定や不正な値はNone）"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S') if value else None
+    except ValueError:
+        return None
+
+async def check_scraping_due():
+    """
+    自動スクレイピングの設定と予定時刻から、今スクレイピングを実行してよいかを判定する
+
+    アプリ内のスケジューラーと外部（GitHub Actions）からの要求で同じ判定を使い、
+    予定より早く実行したり、無効にした自動スクレイピングを実行したりしないようにします。
+
+    Returns:
+        (実行してよいかどうか, 理由のメッセージ)
+    """
+    await load_scraping_state()
+    
+    if not scraping_state.get("auto_scraping_enabled", True):
+        return False, "自動スクレイピングは無効です"
+    
+    due = _parse_schedule_time(scraping_state.get("next_scraping"))
+    if due is not None and datetime.now() < due:
+        return False, f"次回のスクレイピングは {scraping_state['next_scraping']} の予定です"
+    return True, "予定時刻を過ぎています"
+
+async def _run_due_scraping():
+    """
+    予定時刻を過ぎていればスクレイピングのジョブを実行し、次に確認するまでの秒数を返す
+    
+    予定時刻の直前まで待つ場合は、複数のインスタンスが同時に実行しないよう待ち時間をランダムに延ばします。
+    """
+    await load_scraping_state()
+    
+    if not scraping_state.get("auto_scraping_enabled", True):
+        return SCHEDULER_POLL_SECONDS
+    
+    now = datetime.now()
+    due = _parse_schedule_time(scraping_state.get("next_scraping"))
+    if due is not None and now < due:
+        remaining = (due - now).total_seconds()
+        if remaining > SCHEDULER_POLL_SECONDS:
+            return SCHEDULER_POLL_SECONDS
+        return remaining + random.uniform(0, SCHEDULER_JITTER_SECONDS)
+    
+    job, _ = await submit_scraping_job()
+    print(f"スケジューラーがスクレイピングのジョブを開始しました: {job['job_id']}")
+    job = await job_registry.wait(job["job_id"])
+    
+    # 失敗して予定時刻が進まなかった場合は、一定時間おいてから再試行する
+    due = _parse_schedule_time(scraping_state.get("next_scraping"))
+    if job["status"] != "succeeded" and (due is None or due <= datetime.now()):
+        scraping_state["next_scraping"] = (datetime.now() + timedelta(seconds=SCHEDULER_RETRY_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+        await save_scraping_state()
+    
+    return SCHEDULER_POLL_SECONDS
+
+async def scheduler_loop():
+    """自動スクレイピングが有効な間、予定時刻ごとにスクレイピングを実行するループ"""
+    print("スクレイピングのスケジューラーを開始しました")
+    while True:
+        try:
+            delay = await _run_due_scraping()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"スケジューラーの処理エラー: {str(e)}")
+            print(traceback.format_exc())
+            delay = SCHEDULER_POLL_SECONDS
+        await asyncio.sleep(delay)
+
+def start_scheduler():
+    """アプリ内のスケジューラーを開始する（アプリの起動時に実行）"""
+    global _scheduler_task
+    
+    if _scheduler_task is None or _scheduler_task.done():
+        _scheduler_task = asyncio.create_task(scheduler_loop())
+    return _scheduler_task
+
+async def stop_scheduler():
+    """スケジューラーと実行中のジョブを停止する（アプリの終了時に実行）"""
+    global _scheduler_task
+    
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+        await asyncio.gather(_scheduler_task, return_exceptions=True)
+        _scheduler_task = None
+    await job_registry.shutdown() 
@@ -0,0 +1,36 @@
+"""
+テスト共通の設定
+データベースはテストごとの一時ディレクトリに作成し、スケジューラーは起動しません
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# アプリの設定は読み込み時に環境変数を参照するため、importより前に設定する
+os.environ.setdefault("EXECUTOR_KIND", "thread")
+os.environ.setdefault("SCHEDULER_ENABLED", "False")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models import database
+
+@pytest.fixture(autouse=True)
+def isolated_db(tmp_path, monkeypatch):
+    """テストごとに空のデータベースを使う"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_INITIALIZED", False)
+    # asyncio.Lock は最初に使ったイベントループに結び付くため、テストごとに作り直す
+    monkeypatch.setattr(database, "_async_lock", None)
+    yield tmp_path
+
+def run(coro):
+    """コルーチンを実行し、同じイベントループで共有の非同期接続を閉じる"""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await database.close_async_db()
+    return asyncio.run(main())
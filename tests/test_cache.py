@@ -0,0 +1,146 @@
+"""計算結果のキャッシュ（ResponseCache）のテスト"""
+
+import asyncio
+
+import pytest
+
+from app.services import cache as cache_module
+from app.services.cache import ResponseCache
+from conftest import run
+
+def test_concurrent_misses_compute_once():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"rows": [1, 2, 3]}
+
+    async def main():
+        cache = ResponseCache(ttl=60)
+        key = cache.make_key("/ranking", {"limit": 10})
+        results = await asyncio.gather(*(cache.get_or_compute(key, compute) for _ in range(10)))
+        # 保存後はキャッシュから返す
+        again = await cache.get_or_compute(key, compute)
+        return cache, results, again
+
+    cache, results, again = run(main())
+
+    assert calls == [1]
+    assert all(result == {"rows": [1, 2, 3]} for result in results)
+    assert again == {"rows": [1, 2, 3]}
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 10
+
+def test_cancelled_leader_hands_over_to_one_waiter():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        cache = ResponseCache(ttl=60)
+        key = cache.make_key("/ranking")
+        leader = asyncio.create_task(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get_or_compute(key, compute)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        return leader, results
+
+    leader, results = run(main())
+
+    # キャンセルは待っていた呼び出しに伝わらず、計算し直しは1回だけ
+    assert leader.cancelled()
+    assert calls == [1, 1]
+    assert results == [2] * 5
+
+def test_exception_is_shared_and_not_cached():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db error")
+
+    async def main():
+        cache = ResponseCache(ttl=60)
+        key = cache.make_key("/ranking")
+        results = await asyncio.gather(*(cache.get_or_compute(key, compute) for _ in range(3)), return_exceptions=True)
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute(key, compute)
+        return results
+
+    results = run(main())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert calls == [1, 1]
+
+def test_invalidate_and_should_cache():
+    values = iter(range(100))
+
+    async def compute():
+        return next(values)
+
+    async def main():
+        cache = ResponseCache(ttl=60)
+        ranking = cache.make_key("/ranking")
+        search = cache.make_key("/search", {"q": "穴場"})
+        first = await cache.get_or_compute(ranking, compute)
+        await cache.get_or_compute(search, compute)
+        cache.invalidate("/ranking")
+        second = await cache.get_or_compute(ranking, compute)
+        kept = await cache.get_or_compute(search, compute)
+        # 保存しないと判定された結果は次の呼び出しで計算し直す
+        empty = cache.make_key("/empty")
+        skipped = await cache.get_or_compute(empty, compute, should_cache=lambda value: False)
+        recomputed = await cache.get_or_compute(empty, compute, should_cache=lambda value: False)
+        return first, second, kept, skipped, recomputed
+
+    assert run(main()) == (0, 2, 1, 3, 4)
+
+def test_result_computed_during_invalidate_is_not_stored():
+    async def main():
+        cache = ResponseCache(ttl=60)
+        key = cache.make_key("/ranking")
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            return "old"
+
+        task = asyncio.create_task(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0)
+        cache.invalidate()
+        stale = await task
+        fresh = await cache.get_or_compute(key, lambda: asyncio.sleep(0, "new"))
+        return stale, fresh
+
+    assert run(main()) == ("old", "new")
+
+def test_ttl_expiry_and_maxsize(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    values = iter(range(100))
+
+    async def compute():
+        return next(values)
+
+    async def main():
+        cache = ResponseCache(ttl=10, maxsize=2)
+        a, b, c = (cache.make_key(route) for route in ("/a", "/b", "/c"))
+        results = [await cache.get_or_compute(a, compute)]
+        now[0] += 5
+        results.append(await cache.get_or_compute(a, compute))
+        now[0] += 6
+        results.append(await cache.get_or_compute(a, compute))
+        await cache.get_or_compute(b, compute)
+        await cache.get_or_compute(c, compute)
+        return cache, results
+
+    cache, results = run(main())
+
+    assert results == [0, 0, 1]
+    # 最も古く使われた /a が削除される
+    assert [key[0] for key in cache._entries] == ["/b", "/c"]
@@ -0,0 +1,48 @@
+"""SQLiteの非同期接続（書き込み用の共有接続と読み込み用のプール）のテスト"""
+
+import asyncio
+import time
+
+from app.models.database import async_db_connection, async_read_connection, get_review_count, init_db
+from conftest import run
+
+def test_reads_do_not_wait_for_a_write_transaction():
+    async def main():
+        await init_db()
+        async with async_db_connection() as conn:
+            await conn.execute("INSERT INTO reviews (review_id, sauna_name, review_text) VALUES ('r0', 'A', 'x')")
+
+        writing = asyncio.Event()
+
+        async def slow_writer():
+            async with async_db_connection() as conn:
+                await conn.execute("BEGIN IMMEDIATE")
+                await conn.execute("INSERT INTO reviews (review_id, sauna_name, review_text) VALUES ('r1', 'A', 'y')")
+                writing.set()
+                await asyncio.sleep(0.5)
+
+        writer = asyncio.create_task(slow_writer())
+        await writing.wait()
+        started = time.monotonic()
+        during = await get_review_count()
+        elapsed = time.monotonic() - started
+        await writer
+        return during, elapsed, await get_review_count()
+
+    during, elapsed, after = run(main())
+
+    # 書き込み中もコミット済みの内容をすぐに読める
+    assert during == 1
+    assert elapsed < 0.3
+    assert after == 2
+
+def test_read_connection_is_read_only():
+    async def main():
+        await init_db()
+        async with async_read_connection() as conn:
+            try:
+                await conn.execute("DELETE FROM reviews")
+            except Exception as e:
+                return str(e)
+
+    assert "readonly" in run(main())
@@ -0,0 +1,76 @@
+"""バックグラウンドジョブの登録（JobRegistry）のテスト"""
+
+import asyncio
+
+from app.services.jobs import JobRegistry
+from conftest import run
+
+def test_concurrent_submits_start_one_job():
+    started = []
+
+    async def work():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        registry = JobRegistry()
+        (first, created_first), (second, created_second) = await asyncio.gather(
+            registry.submit("scrape", work),
+            registry.submit("scrape", work)
+        )
+        job = await registry.wait(first["job_id"])
+        return first, created_first, second, created_second, job
+
+    first, created_first, second, created_second, job = run(main())
+
+    assert started == [1]
+    assert (created_first, created_second) == (True, False)
+    assert first["job_id"] == second["job_id"]
+    assert job["status"] == "succeeded" and job["result"] == "done"
+
+def test_finished_job_is_visible_from_another_registry():
+    async def work(x):
+        return {"x": x}
+
+    async def main():
+        registry, other = JobRegistry(), JobRegistry()
+        job, _ = await registry.submit("scrape", work, 1)
+        await registry.wait(job["job_id"])
+        # 別のワーカーのジョブ一覧からもデータベース経由で参照できる
+        return await other.get(job["job_id"]), await other.list()
+
+    job, jobs = run(main())
+
+    assert job["status"] == "succeeded" and job["result"] == {"x": 1}
+    assert [j["job_id"] for j in jobs] == [job["job_id"]]
+
+def test_resubmit_after_finish_starts_new_job():
+    async def work():
+        return None
+
+    async def main():
+        registry = JobRegistry()
+        first, _ = await registry.submit("scrape", work)
+        await registry.wait(first["job_id"])
+        second, created = await registry.submit("scrape", work)
+        await registry.wait(second["job_id"])
+        return first, second, created
+
+    first, second, created = run(main())
+
+    assert created and first["job_id"] != second["job_id"]
+
+def test_shutdown_marks_unstarted_jobs_cancelled():
+    async def work():
+        await asyncio.sleep(10)
+
+    async def main():
+        registry = JobRegistry()
+        running, _ = await registry.submit("running", work)
+        await asyncio.sleep(0.05)
+        queued, _ = await registry.submit("queued", work)
+        await registry.shutdown()
+        return [(await registry.get(job["job_id"]))["status"] for job in (running, queued)]
+
+    assert run(main()) == ["cancelled", "cancelled"]
@@ -0,0 +1,41 @@
+"""複数キーワードの一括検出（KeywordMatcher）のテスト"""
+
+import random
+
+from app.services.keyword_matcher import KeywordMatcher, get_matcher
+from app.services.ranking import HIDDEN_GEM_KEYWORDS
+
+def naive_score(keywords, text):
+    """キーワードごとに `in` で調べる、オートマトン導入前の数え方"""
+    return sum(weight for keyword, weight in keywords.items() if keyword in text)
+
+def test_score_counts_each_keyword_once():
+    matcher = KeywordMatcher({"穴場": 3, "秘密": 1})
+    assert matcher.score("穴場です。本当に穴場。秘密の穴場") == 4
+    assert matcher.score("普通のサウナ") == 0
+
+def test_overlapping_keywords_are_all_found():
+    matcher = KeywordMatcher(HIDDEN_GEM_KEYWORDS)
+    # 「穴場サウナ」の中の「穴場」、「隠れ家」の中の「隠れ」は別のキーワードとして数える
+    assert matcher.find("ここは穴場サウナで隠れ家のよう") == {"穴場", "穴場サウナ", "隠れ家"}
+    assert matcher.score("ここは穴場サウナで隠れ家のよう") == 3 + 4 + 2
+    # 失敗遷移をたどって見つかる、途中から始まるキーワード
+    assert matcher.find("知る人ぞ知る穴場スポット") == {"知る人ぞ知る", "穴場", "穴場スポット"}
+
+def test_score_matches_naive_count():
+    matcher = KeywordMatcher(HIDDEN_GEM_KEYWORDS)
+    alphabet = "".join(HIDDEN_GEM_KEYWORDS) + "のでサウナ水風呂"
+    rng = random.Random(0)
+    for _ in range(500):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert matcher.score(text) == naive_score(HIDDEN_GEM_KEYWORDS, text), text
+
+def test_list_keywords_and_contains_any():
+    matcher = KeywordMatcher(["ロウリュ", "外気浴", ""])
+    assert matcher.find("外気浴とロウリュ") == {"ロウリュ", "外気浴"}
+    assert matcher.score("外気浴とロウリュ") == 2
+    assert matcher.contains_any("最高の外気浴")
+    assert not matcher.contains_any("")
+
+def test_get_matcher_reuses_automaton():
+    assert get_matcher(HIDDEN_GEM_KEYWORDS) is get_matcher(dict(HIDDEN_GEM_KEYWORDS))
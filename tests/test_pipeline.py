@@ -0,0 +1,118 @@
+"""増分クロール（ScrapePipeline・高水位標・取り漏れの範囲）のテスト"""
+
+import pytest
+
+from app.config import HIGH_WATER_MARK_SIZE
+from app.services import pipeline
+from app.services.pipeline import run_incremental, run_gap_fill, next_high_water_mark
+from conftest import run
+
+PAGE_SIZE = 10
+POST_URL = "https://sauna-ikitai.com/posts/{}"
+
+class FakeSite:
+    """新しい順に投稿が並ぶ一覧ページを返すスクレイパーの代わり"""
+
+    def __init__(self, posts):
+        self.posts = sorted(posts, reverse=True)
+        self.hidden_gem_keywords = []
+        self.fetched = []
+
+    async def fetch_list_page(self, base_url, page, limiter):
+        self.fetched.append(page)
+        return page
+
+    def parse(self, page, keywords):
+        posts = self.posts[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        reviews = [
+            {"review_id": f"r{post}", "post_url": POST_URL.format(post), "sauna_name": "サウナ",
+             "sauna_url": "", "review_text": "よかった"}
+            for post in posts
+        ]
+        return len(reviews), reviews
+
+@pytest.fixture
+def site(monkeypatch):
+    """投稿1001〜1100のサイトを用意し、保存は件数を数えるだけにする"""
+    site = FakeSite(range(1001, 1101))
+    saved = []
+
+    async def save_reviews_bulk(reviews):
+        saved.extend(reviews)
+        return {"inserted": len(reviews)}
+
+    async def init_db():
+        return True
+
+    monkeypatch.setattr(pipeline, "parse_review_list", site.parse)
+    monkeypatch.setattr(pipeline, "save_reviews_bulk", save_reviews_bulk)
+    monkeypatch.setattr(pipeline, "init_db", init_db)
+    site.saved = saved
+    return site
+
+def keys(*posts):
+    return [POST_URL.format(post) for post in posts]
+
+def crawl(site, mark):
+    result = run(run_incremental(site, "https://example.com/posts", mark))
+    return result, next_high_water_mark(result, mark)
+
+@pytest.mark.parametrize("new_posts", [0, 1, 3, PAGE_SIZE + 5])
+def test_mark_keeps_previous_keys(site, new_posts):
+    mark = keys(*range(1100, 1095, -1))
+    site.posts = sorted(range(1001, 1101 + new_posts), reverse=True)
+
+    result, (next_mark, gap_page) = crawl(site, mark)
+
+    assert gap_page is None
+    assert result["reviews"] == new_posts
+    newest = keys(*range(1100 + new_posts, 1100, -1))[:PAGE_SIZE]
+    assert next_mark == (newest + mark)[:HIGH_WATER_MARK_SIZE]
+    assert len(next_mark) == min(len(newest) + len(mark), HIGH_WATER_MARK_SIZE)
+
+def test_mark_survives_deleted_top_post(site):
+    mark = keys(*range(1100, 1095, -1))
+    _, (mark, _) = crawl(site, mark)
+
+    # 先頭の投稿が削除されても、残りのキーで前回の位置に到達する
+    site.posts.remove(1100)
+    result, (next_mark, gap_page) = crawl(site, mark)
+
+    assert result["reached_known"]
+    assert result["pages"] == 1
+    assert gap_page is None
+    assert next_mark[0] == POST_URL.format(1099)
+
+def test_failed_page_keeps_mark(site):
+    mark = keys(1100)
+    site.posts = sorted(range(1001, 1131), reverse=True)
+    original = site.fetch_list_page
+
+    async def fetch_list_page(base_url, page, limiter):
+        if page == 2:
+            raise RuntimeError("timeout")
+        return await original(base_url, page, limiter)
+
+    site.fetch_list_page = fetch_list_page
+    _, (next_mark, gap_page) = crawl(site, mark)
+
+    assert next_mark == mark
+    assert gap_page is None
+
+def test_gap_fill_stops_at_previous_mark(site):
+    # 前回の位置は4ページ目の途中（1061）
+    gaps = [{"page": 2, "until": keys(1061, 1060)}]
+
+    total = run(run_gap_fill(site, "https://example.com/posts", gaps, max_pages=6))
+
+    assert gaps == []
+    assert site.fetched[:3] == [2, 3, 4]
+    assert {review["review_id"] for review in site.saved} == {f"r{post}" for post in range(1062, 1091)}
+    assert total["saved"] == len(site.saved)
+
+def test_gap_fill_resumes_after_page_limit(site):
+    gaps = [{"page": 2, "until": keys(1001)}]
+
+    run(run_gap_fill(site, "https://example.com/posts", gaps, max_pages=2))
+
+    assert gaps == [{"page": 4, "until": keys(1001)}]
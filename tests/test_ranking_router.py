@@ -0,0 +1,53 @@
+"""データベースのランキングAPI（/api/ranking）のテスト"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.database import async_db_connection, close_async_db, get_data_version, init_db
+from app.routers import ranking
+from conftest import run
+
+async def insert_reviews(*review_ids):
+    await init_db()
+    async with async_db_connection() as conn:
+        for review_id in review_ids:
+            await conn.execute(
+                "INSERT INTO reviews (review_id, sauna_name, review_text) VALUES (?, 'A', '穴場')", (review_id,)
+            )
+        await conn.commit()
+
+def test_data_version_follows_last_rowid():
+    async def main():
+        empty = await get_data_version()
+        await insert_reviews("r1", "r2")
+        first = await get_data_version()
+        await insert_reviews("r3")
+        return empty, first, await get_data_version()
+
+    empty, first, second = run(main())
+
+    assert empty == (0, None)
+    assert first[0] == 2 and first[1] is not None
+    assert second[0] == 3
+
+def test_ranking_etag_changes_only_when_reviews_are_added():
+    app = FastAPI()
+    app.include_router(ranking.router)
+
+    with TestClient(app) as client:
+        first = client.get("/api/ranking")
+        etag = first.headers["ETag"]
+        assert first.status_code == 200
+        assert client.get("/api/ranking", headers={"If-None-Match": etag}).status_code == 304
+
+        client.portal.call(insert_reviews, "r1")
+        changed = client.get("/api/ranking", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        client.portal.call(close_async_db)
+
+def test_ranking_router_is_mounted_in_app():
+    from app.direct_html_app import app
+
+    paths = {route.path for route in app.routes}
+    assert "/api/ranking" in paths
@@ -0,0 +1,101 @@
+"""集計済みランキング（RankingStore）のテスト"""
+
+import threading
+
+import pytest
+
+from app.services import github_storage, ranking
+from app.services.dedup import json_review_filter
+from app.services.github_storage import save_reviews_to_json, load_manifest, write_manifest
+from app.services.ranking import RankingStore
+from conftest import run
+
+@pytest.fixture(autouse=True)
+def fresh_storage(monkeypatch):
+    """マニフェストの読み込み状態と重複判定フィルタを空にし、前のテストのセグメントを閉じる"""
+    github_storage.close_segment_writer()
+    monkeypatch.setattr(github_storage, "_manifest_cache", {"offset": 0, "entries": [], "inode": None})
+    json_review_filter.reset()
+    yield
+    github_storage.close_segment_writer()
+
+def reviews(name, start, count, text="よかった"):
+    return [
+        {"name": name, "review": f"{text} {i}", "url": f"https://example.com/{name}", "review_id": f"{name}-{i}"}
+        for i in range(start, start + count)
+    ]
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = RankingStore(tmp_path / "ranking_store.json")
+    rebuilds = []
+    original = store._rebuild
+
+    def rebuild(entries, inode):
+        rebuilds.append(len(entries))
+        original(entries, inode)
+
+    monkeypatch.setattr(store, "_rebuild", rebuild)
+    store.rebuilds = rebuilds
+    return store
+
+def test_appended_entries_are_applied_without_rebuild(store):
+    save_reviews_to_json(reviews("A", 0, 3))
+    assert [(r["name"], r["review_count"]) for r in store.top_k()] == [("A", 3)]
+    assert store.rebuilds == [1]
+
+    # 他のプロセスが追記した分（このストアにはリスナーで通知されない）
+    save_reviews_to_json(reviews("B", 0, 5, text="穴場"))
+    save_reviews_to_json(reviews("A", 3, 1))
+    top = store.top_k()
+
+    assert [(r["name"], r["review_count"]) for r in top] == [("B", 5), ("A", 4)]
+    assert top[0]["keywords"] == ["穴場"]
+    assert store.rebuilds == [1]
+    assert store.manifest_entries == 3 and store.review_total == 9
+    assert store.verify()["consistent"]
+
+def test_listener_applies_only_the_new_entry(store):
+    save_reviews_to_json(reviews("A", 0, 2))
+    store.top_k()
+    github_storage.register_ingest_listener(store.apply)
+    try:
+        save_reviews_to_json(reviews("A", 2, 2))
+    finally:
+        github_storage._ingest_listeners.remove(store.apply)
+
+    assert store.review_total == 4 and store.manifest_entries == 2
+    assert store.rebuilds == [1]
+
+def test_rewritten_manifest_triggers_rebuild(store):
+    save_reviews_to_json(reviews("A", 0, 2))
+    save_reviews_to_json(reviews("B", 0, 1))
+    store.top_k()
+
+    # 圧縮と同じく、マニフェストを別のファイルで置き換える（Bの項目を除く）
+    write_manifest(load_manifest()[:1])
+    top = store.top_k()
+
+    assert [(r["name"], r["review_count"]) for r in top] == [("A", 2)]
+    assert store.rebuilds == [2, 1]
+
+def test_reload_resumes_from_saved_position(store, tmp_path):
+    save_reviews_to_json(reviews("A", 0, 2))
+    store.top_k()
+    save_reviews_to_json(reviews("A", 2, 1))
+
+    reloaded = RankingStore(tmp_path / "ranking_store.json")
+    assert reloaded.top_k()[0]["review_count"] == 3
+    assert reloaded.manifest_entries == 2
+
+def test_generate_ranking_reads_store_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def top_k(limit, min_reviews):
+        threads.append(threading.current_thread())
+        return []
+
+    monkeypatch.setattr(ranking._ranking_store, "top_k", top_k)
+    run(ranking.generate_sauna_ranking())
+
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,58 @@
+"""定期スクレイピング（新着分・取り漏れ・バックフィルの順序）のテスト"""
+
+import pytest
+
+from app import tasks
+from conftest import run
+from test_pipeline import site, keys
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    """プロセス内に保持しているスクレイピング状態を捨てる（データベースはテストごとに空）"""
+    store = tasks.scraping_state_store
+    store.data.clear()
+    store._saved = {}
+    store.version = None
+
+def scrape(site, monkeypatch):
+    monkeypatch.setattr(tasks, "scraper", site)
+
+    async def compaction(include_today=False):
+        return {"status": "success"}
+
+    monkeypatch.setattr(tasks, "run_storage_compaction", compaction)
+    return run(tasks._scrape_and_save())
+
+def test_first_run_does_not_refetch_first_page(site, monkeypatch):
+    scrape(site, monkeypatch)
+
+    assert site.fetched == [1, 2, 3]
+    assert tasks.scraping_state["backfill_page"] == 4
+
+def test_gap_does_not_rewind_backfill(site, monkeypatch):
+    scrape(site, monkeypatch)
+    site.fetched.clear()
+
+    # 上限のページ数を超える新着があり、前回の位置に届かなかった
+    site.posts = sorted(range(1001, 1301), reverse=True)
+    monkeypatch.setattr(tasks, "BACKFILL_PAGES_PER_RUN", 3)
+    scrape(site, monkeypatch)
+
+    gaps = tasks.scraping_state["pending_gaps"]
+    assert len(gaps) == 1 and gaps[0]["until"][0] == keys(1100)[0]
+    assert site.fetched[:10] == list(range(1, 11))
+    # 取り漏れの範囲を先に取得し、バックフィルの位置は戻さない
+    assert site.fetched[10:] == [11, 12, 13]
+    assert gaps[0]["page"] == 14
+    assert tasks.scraping_state["backfill_page"] == 4
+
+def test_check_scraping_due_follows_schedule():
+    async def check(**changes):
+        await tasks.load_scraping_state()
+        tasks.scraping_state.update(changes)
+        await tasks.save_scraping_state()
+        return (await tasks.check_scraping_due())[0]
+
+    assert run(check(auto_scraping_enabled=True, next_scraping="2000-01-01 00:00:00"))
+    assert not run(check(auto_scraping_enabled=True, next_scraping="2999-01-01 00:00:00"))
+    assert not run(check(auto_scraping_enabled=False, next_scraping="2000-01-01 00:00:00"))
@@ -0,0 +1,57 @@
+"""JSON Linesセグメントへの追記（SegmentWriter）のテスト"""
+
+import json
+import multiprocessing
+from pathlib import Path
+
+from app.services.github_storage import SegmentWriter, iter_entry_reviews, SCRAPING_DIR
+
+def record(writer_id, i):
+    return {"name": f"サウナ{writer_id}", "review": "よかった" * (i % 5 + 1), "review_id": f"{writer_id}-{i}"}
+
+def entry(path, offset, nbytes):
+    return {"file": path.relative_to(SCRAPING_DIR).as_posix(), "offset": offset, "bytes": nbytes}
+
+def read_entry(path, offset, nbytes):
+    return [review["review_id"] for review in iter_entry_reviews([entry(path, offset, nbytes)])]
+
+def test_offset_accounts_for_appends_by_another_handle():
+    writer = SegmentWriter()
+    try:
+        path, _, _ = writer.append([record("a", 0)])
+
+        # 別のプロセスが同じセグメントに追記した
+        with open(path, 'ab') as other:
+            other.write((json.dumps(record("b", 0)) + "\n").encode('utf-8'))
+
+        path, offset, nbytes = writer.append([record("a", 1)])
+    finally:
+        writer.close()
+
+    assert read_entry(path, offset, nbytes) == ["a-1"]
+
+def _append_many(cwd, writer_id, count, queue):
+    import os
+    os.chdir(cwd)
+    writer = SegmentWriter()
+    spans = [writer.append([record(writer_id, i)]) for i in range(count)]
+    writer.close()
+    queue.put([(str(path), offset, nbytes) for path, offset, nbytes in spans])
+
+def test_concurrent_processes_get_disjoint_spans(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    processes = [context.Process(target=_append_many, args=(str(tmp_path), writer_id, 1000, queue)) for writer_id in "ab"]
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join(timeout=60)
+
+    seen = set()
+    for spans in results:
+        for path, offset, nbytes in spans:
+            ids = read_entry(Path(path), offset, nbytes)
+            assert len(ids) == 1
+            seen.update(ids)
+    assert len(seen) == 2000